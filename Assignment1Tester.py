@@ -7,6 +7,7 @@ DATABASE_NAME = 'dds_assgn1'
 RATINGS_TABLE = 'ratings'
 RANGE_TABLE_PREFIX = 'range_part'
 RROBIN_TABLE_PREFIX = 'rrobin_part'
+HASH_TABLE_PREFIX = 'hash_part'
 USER_ID_COLNAME = 'userid'
 MOVIE_ID_COLNAME = 'movieid'
 RATING_COLNAME = 'rating'
@@ -67,6 +68,37 @@ if __name__ == '__main__':
             else:
                 print("roundrobininsert function fail!")
 
+            [result, e] = testHelper.testroundrobininsertsequence(MyAssignment, RATINGS_TABLE, 5, 12, conn)
+            if result :
+                print("roundrobininsert sequence test pass!")
+            else:
+                print("roundrobininsert sequence test fail!")
+
+            [result, e] = testHelper.testroundrobininsertconcurrent(MyAssignment, RATINGS_TABLE, 5, 4, 50, conn)
+            if result :
+                print("roundrobininsert concurrency test pass!")
+            else:
+                print("roundrobininsert concurrency test fail!")
+
+            [result, e] = testHelper.testroundrobinnativemixed(MyAssignment, RATINGS_TABLE, 5, 12, conn)
+            if result :
+                print("roundrobin native/standard insert test pass!")
+            else:
+                print("roundrobin native/standard insert test fail!")
+
+            [result, e] = testHelper.testhashpartition(MyAssignment, RATINGS_TABLE, 5, conn, 0, ACTUAL_ROWS_IN_INPUT_FILE)
+            if result :
+                print("hashpartition function pass!")
+            else:
+                print("hashpartition function fail!")
+
+            # userid 100 được băm vào phân mảnh (((100 * 2654435761) & 0xFFFFFFFF) >> 16) % 5 = 1
+            [result, e] = testHelper.testhashinsert(MyAssignment, RATINGS_TABLE, 100, 1, 3, conn, '1')
+            if result :
+                print("hashinsert function pass!")
+            else:
+                print("hashinsert function fail!")
+
             choice = input('Press enter to Delete all tables? ')
             if choice == '':
                 testHelper.deleteAllPublicTables(conn)
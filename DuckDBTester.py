@@ -0,0 +1,69 @@
+#
+# Tester for the DuckDB engine (same checks as Assignment1Tester, no PostgreSQL server needed)
+#
+DUCKDB_PATH = ':memory:'
+
+RATINGS_TABLE = 'ratings'
+INPUT_FILE_PATH = 'ratings.dat'
+ACTUAL_ROWS_IN_INPUT_FILE = 10000054  # số dòng dữ liệu file ratings.dat, nếu là file test_data.dat thì là 20
+
+import traceback
+import testHelper
+import duckdbengine as MyAssignment
+
+if __name__ == '__main__':
+    try:
+        conn = MyAssignment.getopenconnection(DUCKDB_PATH)
+
+        testHelper.deleteAllPublicTables(conn)
+
+        [result, e] = testHelper.testloadratings(MyAssignment, RATINGS_TABLE, INPUT_FILE_PATH, conn, ACTUAL_ROWS_IN_INPUT_FILE)
+        if result :
+            print("loadratings function pass!")
+        else:
+            print("loadratings function fail!")
+
+        [result, e] = testHelper.testrangepartition(MyAssignment, RATINGS_TABLE, 5, conn, 0, ACTUAL_ROWS_IN_INPUT_FILE)
+        if result :
+            print("rangepartition function pass!")
+        else:
+            print("rangepartition function fail!")
+
+        [result, e] = testHelper.testrangeinsert(MyAssignment, RATINGS_TABLE, 100, 2, 3, conn, '2')
+        if result:
+            print("rangeinsert function pass!")
+        else:
+            print("rangeinsert function fail!")
+
+        testHelper.deleteAllPublicTables(conn)
+        MyAssignment.loadratings(RATINGS_TABLE, INPUT_FILE_PATH, conn)
+
+        [result, e] = testHelper.testroundrobinpartition(MyAssignment, RATINGS_TABLE, 5, conn, 0, ACTUAL_ROWS_IN_INPUT_FILE)
+        if result :
+            print("roundrobinpartition function pass!")
+        else:
+            print("roundrobinpartition function fail")
+
+        # Vì file ratings.dat có 10000054 dòng dữ liệu nên khi insert bản ghi này vào sẽ ở phân mảnh thứ 4.
+        [result, e] = testHelper.testroundrobininsert(MyAssignment, RATINGS_TABLE, 100, 1, 3, conn, '4')
+        if result :
+            print("roundrobininsert function pass!")
+        else:
+            print("roundrobininsert function fail!")
+
+        [result, e] = testHelper.testhashpartition(MyAssignment, RATINGS_TABLE, 5, conn, 0, ACTUAL_ROWS_IN_INPUT_FILE)
+        if result :
+            print("hashpartition function pass!")
+        else:
+            print("hashpartition function fail!")
+
+        [result, e] = testHelper.testhashinsert(MyAssignment, RATINGS_TABLE, 100, 1, 3, conn, '1')
+        if result :
+            print("hashinsert function pass!")
+        else:
+            print("hashinsert function fail!")
+
+        conn.close()
+
+    except Exception as detail:
+        traceback.print_exc()
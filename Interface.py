@@ -4,18 +4,49 @@
 #
 
 import psycopg2
+import psycopg2.errors
+import psycopg2.extras
+import io
 from io import StringIO
 import time
 import functools
+import math
+import bisect
 import duckdb
 import os
+import queue
+import re
+import threading
 import tempfile
+import numpy as np
 import polars as pl
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import connectionpool
+import pgcopy
+import bloomfilter
+import ratingsparser
+import ratingscache
 
 DATABASE_NAME = 'dds_assgn1'
 
 RANGE_METADATA_TABLE = 'range_metadata'
 RROBIN_METADATA_TABLE = 'rrobin_metadata'
+HASH_METADATA_TABLE = 'hash_metadata'
+
+RANGE_TABLE_PREFIX = 'range_part'
+RROBIN_TABLE_PREFIX = 'rrobin_part'
+HASH_TABLE_PREFIX = 'hash_part'
+
+# Kích thước mỗi khối đọc từ file ratings khi nạp dữ liệu theo kiểu streaming
+STREAM_CHUNK_SIZE = 8 * 1024 * 1024
+# Kích thước mỗi lần psycopg2 gọi read() trên luồng dữ liệu khi COPY
+COPY_BUFFER_SIZE = 1024 * 1024
+# Số dòng mỗi lần lấy về từ server-side cursor khi đọc phân mảnh
+QUERY_FETCH_SIZE = 10000
+# Lỗi khi ghi vào phân mảnh range theo metadata cũ trong bộ nhớ đệm (phân mảnh vừa bị tách / gộp và
+# được gắn ràng buộc CHECK theo khoảng mới, hoặc đã bị đổi tên / xóa): các hàm insert đọc lại metadata và thử lại
+STALE_PARTITION_ERRORS = (psycopg2.errors.CheckViolation, psycopg2.errors.UndefinedTable)
 
 # Hàm measure_time là một decorator dùng để đo thời gian thực thi của một hàm bất kỳ
 def measure_time(func):
@@ -41,15 +72,9 @@ def measure_time(func):
     return wrapper_measure_time
 
 # Hàm getopenconnection dùng để tạo và trả về một kết nối tới cơ sở dữ liệu PostgreSQL
+# (dùng chung cách tạo kết nối của module connectionpool, kết nối ghi nhớ cấu hình phiên)
 def getopenconnection(user='postgres', password='1234', dbname='postgres'):
-    # Sử dụng hàm psycopg2.connect để tạo kết nối:
-    # - dbname: tên cơ sở dữ liệu (mặc định là 'postgres')
-    # - user: tên người dùng (mặc định là 'postgres')
-    # - password: mật khẩu của người dùng (mặc định là '1234')
-    # - host: máy chủ lưu trữ cơ sở dữ liệu (mặc định là 'localhost')
-    return psycopg2.connect(
-        "dbname='" + dbname + "' user='" + user + "' host='localhost' password='" + password + "'"
-    )
+    return connectionpool.getopenconnection(user=user, password=password, dbname=dbname)
 
 
 # Hàm khởi tạo bảng metadata cho kiểu phân vùng RANGE nếu chưa tồn tại.
@@ -59,9 +84,12 @@ def init_range_metadata_table(openconnection):
     cur.execute(f'''
         CREATE TABLE IF NOT EXISTS {RANGE_METADATA_TABLE} (
             tablename VARCHAR(100) PRIMARY KEY,        -- Tên bảng gốc
-            partition_count INTEGER NOT NULL           -- Số lượng phân vùng RANGE cho bảng này
+            partition_count INTEGER NOT NULL,          -- Số lượng phân vùng RANGE cho bảng này
+            boundaries DOUBLE PRECISION[]              -- Các mốc biên (partition_count + 1 phần tử), NULL = chia đều [0, 5]
         );
     ''')
+    # Bảng metadata tạo từ phiên bản cũ chưa có cột boundaries
+    cur.execute(f"ALTER TABLE {RANGE_METADATA_TABLE} ADD COLUMN IF NOT EXISTS boundaries DOUBLE PRECISION[];")
     con.commit()
     cur.close()
 
@@ -79,16 +107,103 @@ def init_rrobin_metadata_table(openconnection):
     con.commit()
     cur.close()
 
+# Hàm khởi tạo bảng metadata cho kiểu phân vùng HASH (theo userid) nếu chưa tồn tại.
+def init_hash_metadata_table(openconnection):
+    con = openconnection
+    cur = con.cursor()
+    cur.execute(f'''
+        CREATE TABLE IF NOT EXISTS {HASH_METADATA_TABLE} (
+            tablename VARCHAR(100) PRIMARY KEY,        -- Tên bảng gốc
+            partition_count INTEGER NOT NULL           -- Số lượng phân vùng HASH
+        );
+    ''')
+    con.commit()
+    cur.close()
+
+# Bộ nhớ đệm metadata trong tiến trình: (máy chủ, cổng, database, bảng metadata, tablename) -> giá trị
+_METADATA_CACHE = {}
+# Các kết nối đã LISTEN kênh thông báo thay đổi metadata (để kiểm tra phiên bản)
+_METADATA_LISTENERS = set()
+METADATA_CHANNEL = 'partition_metadata_changed'
+
+
+def _connectionkey(openconnection):
+    info = openconnection.info
+    return (info.host, info.port, info.dbname)
+
+
+def _metadatakey(openconnection, metadatatable, tablename):
+    return _connectionkey(openconnection) + (metadatatable, tablename)
+
+
+def enable_metadata_validation(openconnection):
+    """
+    Bật kiểm tra phiên bản cho bộ nhớ đệm metadata trên kết nối này:
+    kết nối LISTEN kênh thông báo, mỗi khi tiến trình khác ghi lại metadata (update_*_metadata
+    gửi NOTIFY) thì mục tương ứng trong bộ nhớ đệm bị xóa ở lần đọc kế tiếp.
+    Việc kiểm tra chỉ đọc các thông báo đã về socket nên không tốn thêm lượt truy vấn.
+    """
+    cur = openconnection.cursor()
+    cur.execute(f"LISTEN {METADATA_CHANNEL};")
+    cur.close()
+    openconnection.commit()
+    _METADATA_LISTENERS.add(_connectionkey(openconnection))
+
+
+def _applymetadatanotifications(openconnection):
+    # Xóa khỏi bộ nhớ đệm các mục mà tiến trình khác đã thay đổi
+    connkey = _connectionkey(openconnection)
+    if connkey not in _METADATA_LISTENERS:
+        return
+    openconnection.poll()
+    backend_pid = openconnection.get_backend_pid()
+    while openconnection.notifies:
+        notify = openconnection.notifies.pop(0)
+        if notify.pid == backend_pid:
+            continue
+        metadatatable, _, tablename = notify.payload.partition(':')
+        _METADATA_CACHE.pop(connkey + (metadatatable, tablename), None)
+        _METADATA_CACHE.pop(connkey + (metadatatable, tablename, 'boundaries'), None)
+
+
+def _notifymetadata(cur, metadatatable, tablename):
+    # Báo cho các tiến trình khác rằng metadata đã đổi (NOTIFY chỉ được gửi đi khi giao dịch commit)
+    cur.execute("SELECT pg_notify(%s, %s)", (METADATA_CHANNEL, f"{metadatatable}:{tablename}"))
+
+
+def _cachemetadata(openconnection, key, value):
+    """
+    Ghi giá trị metadata vừa commit vào bộ nhớ đệm. Nếu kết nối vẫn đang trong giao dịch
+    (autocommit với BEGIN tường minh, con.commit() không có tác dụng) thì chỉ xóa mục cũ:
+    giá trị mới chưa chắc tới được CSDL, lần đọc sau sẽ lấy lại từ bảng metadata.
+    """
+    if openconnection.info.transaction_status == psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+        _METADATA_CACHE[key] = value
+    else:
+        _METADATA_CACHE.pop(key, None)
+
+
+def clear_metadata_cache():
+    """Xóa toàn bộ bộ nhớ đệm metadata của tiến trình."""
+    _METADATA_CACHE.clear()
+
+
 # Cập nhật metadata cho một bảng RANGE: xóa bản ghi cũ (nếu có), sau đó thêm mới.
-def update_range_metadata(openconnection, tablename, partition_count):
+# boundaries: danh sách partition_count + 1 mốc biên (phân mảnh i nhận (b[i], b[i+1]], phân mảnh 0 gồm cả b[0]),
+# None nghĩa là chia đều [0, 5] như rangepartition gốc.
+def update_range_metadata(openconnection, tablename, partition_count, boundaries=None):
     con = openconnection
     cur = con.cursor()
     cur.execute(f"DELETE FROM {RANGE_METADATA_TABLE} WHERE tablename = %s", (tablename,))
     cur.execute(
-        f"INSERT INTO {RANGE_METADATA_TABLE} (tablename, partition_count) VALUES (%s, %s)",
-        (tablename, partition_count)
+        f"INSERT INTO {RANGE_METADATA_TABLE} (tablename, partition_count, boundaries) VALUES (%s, %s, %s)",
+        (tablename, partition_count, None if boundaries is None else [float(b) for b in boundaries])
     )
+    _notifymetadata(cur, RANGE_METADATA_TABLE, tablename)
     con.commit()
+    key = _metadatakey(con, RANGE_METADATA_TABLE, tablename)
+    _cachemetadata(con, key, partition_count)
+    _cachemetadata(con, key + ('boundaries',), None if boundaries is None else [float(b) for b in boundaries])
     cur.close()
 
 # Cập nhật metadata cho một bảng ROUND ROBIN: xóa bản ghi cũ (nếu có), sau đó thêm mới.
@@ -100,14 +215,21 @@ def update_rrobin_metadata(openconnection, tablename, partition_count, last_part
         f"INSERT INTO {RROBIN_METADATA_TABLE} (tablename, partition_count, last_partition_index) VALUES (%s, %s, %s)",
         (tablename, partition_count, last_partition_index)
     )
+    _notifymetadata(cur, RROBIN_METADATA_TABLE, tablename)
     con.commit()
+    _cachemetadata(con, _metadatakey(con, RROBIN_METADATA_TABLE, tablename), (partition_count, last_partition_index))
     cur.close()
 
 
 # Truy xuất số lượng phân vùng RANGE của bảng được chỉ định trong RANGE_METADATA.
 # Trả về 0 nếu bảng không tồn tại trong RANGE_METADATA.
-def get_range_metadata(openconnection, tablename):
+# Kết quả được lưu trong bộ nhớ đệm của tiến trình (usecache=False để luôn đọc từ database).
+def get_range_metadata(openconnection, tablename, usecache=True):
     con = openconnection
+    key = _metadatakey(con, RANGE_METADATA_TABLE, tablename)
+    _applymetadatanotifications(con)
+    if usecache and key in _METADATA_CACHE:
+        return _METADATA_CACHE[key]
     cur = con.cursor()
     cur.execute(
         f"SELECT partition_count FROM {RANGE_METADATA_TABLE} WHERE tablename = %s",
@@ -115,12 +237,84 @@ def get_range_metadata(openconnection, tablename):
     )
     row = cur.fetchone()
     cur.close()
-    return row[0] if row else 0
+    if row:
+        _METADATA_CACHE[key] = row[0]
+        return row[0]
+    return 0
+
+# Truy xuất các khoảng (minR, maxR) của từng phân mảnh RANGE: từ cột boundaries nếu bảng được phân mảnh
+# theo mốc lưu sẵn (ví dụ mode='equidepth'), ngược lại là các khoảng chia đều của range_bounds.
+def get_range_bounds(openconnection, tablename, usecache=True):
+    con = openconnection
+    boundaries = get_range_boundaries(con, tablename, usecache)
+    if boundaries is None:
+        partition_count = get_range_metadata(con, tablename, usecache)
+        return range_bounds(partition_count) if partition_count else []
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+
+# Truy xuất mảng boundaries của bảng RANGE (None nếu bảng dùng cách chia đều hoặc chưa có metadata).
+def get_range_boundaries(openconnection, tablename, usecache=True):
+    con = openconnection
+    key = _metadatakey(con, RANGE_METADATA_TABLE, tablename) + ('boundaries',)
+    _applymetadatanotifications(con)
+    if usecache and key in _METADATA_CACHE:
+        return _METADATA_CACHE[key]
+    cur = con.cursor()
+    cur.execute(
+        f"SELECT boundaries FROM {RANGE_METADATA_TABLE} WHERE tablename = %s",
+        (tablename,)
+    )
+    row = cur.fetchone()
+    cur.close()
+    if row:
+        _METADATA_CACHE[key] = row[0]
+        return row[0]
+    return None
+
+# Cập nhật metadata cho một bảng HASH: xóa bản ghi cũ (nếu có), sau đó thêm mới.
+def update_hash_metadata(openconnection, tablename, partition_count):
+    con = openconnection
+    cur = con.cursor()
+    cur.execute(f"DELETE FROM {HASH_METADATA_TABLE} WHERE tablename = %s", (tablename,))
+    cur.execute(
+        f"INSERT INTO {HASH_METADATA_TABLE} (tablename, partition_count) VALUES (%s, %s)",
+        (tablename, partition_count)
+    )
+    _notifymetadata(cur, HASH_METADATA_TABLE, tablename)
+    con.commit()
+    _cachemetadata(con, _metadatakey(con, HASH_METADATA_TABLE, tablename), partition_count)
+    cur.close()
+
+
+# Truy xuất số lượng phân vùng HASH của bảng, 0 nếu chưa có metadata (có bộ nhớ đệm như get_range_metadata).
+def get_hash_metadata(openconnection, tablename, usecache=True):
+    con = openconnection
+    key = _metadatakey(con, HASH_METADATA_TABLE, tablename)
+    _applymetadatanotifications(con)
+    if usecache and key in _METADATA_CACHE:
+        return _METADATA_CACHE[key]
+    cur = con.cursor()
+    cur.execute(
+        f"SELECT partition_count FROM {HASH_METADATA_TABLE} WHERE tablename = %s",
+        (tablename,)
+    )
+    row = cur.fetchone()
+    cur.close()
+    if row:
+        _METADATA_CACHE[key] = row[0]
+        return row[0]
+    return 0
 
 # Truy xuất metadata của bảng ROUND ROBIN: gồm partition_count và chỉ số last_partition_index.
 # Trả về (0, -1) nếu bảng không tồn tại trong metadata.
-def get_rrobin_metadata(openconnection, tablename):
+# Kết quả được lưu trong bộ nhớ đệm của tiến trình (usecache=False để luôn đọc từ database).
+def get_rrobin_metadata(openconnection, tablename, usecache=True):
     con = openconnection
+    key = _metadatakey(con, RROBIN_METADATA_TABLE, tablename)
+    _applymetadatanotifications(con)
+    if usecache and key in _METADATA_CACHE:
+        return _METADATA_CACHE[key]
     cur = con.cursor()
     cur.execute(
         f"SELECT partition_count, last_partition_index FROM {RROBIN_METADATA_TABLE} WHERE tablename = %s",
@@ -129,11 +323,339 @@ def get_rrobin_metadata(openconnection, tablename):
     row = cur.fetchone()
     cur.close()
     if row:
+        _METADATA_CACHE[key] = (row[0], row[1])
         return row[0], row[1]
     return 0, -1
-    
+
+# Cấp `count` slot round robin liên tiếp cho bảng bằng một câu UPDATE ... RETURNING nguyên tử.
+# Khóa dòng metadata được giữ tới khi giao dịch của người gọi commit, nên các client đồng thời
+# luôn nhận các slot khác nhau theo đúng thứ tự round robin. Hàm không commit.
+# Trả về (partition_count, chỉ số phân mảnh của slot đầu tiên).
+def allocate_rrobin_slots(openconnection, tablename, count=1):
+    con = openconnection
+    cur = con.cursor()
+    cur.execute(
+        f"""UPDATE {RROBIN_METADATA_TABLE}
+            SET last_partition_index = (last_partition_index + %s) %% partition_count
+            WHERE tablename = %s
+            RETURNING partition_count, last_partition_index""",
+        (count, tablename)
+    )
+    row = cur.fetchone()
+    cur.close()
+    if row is None:
+        raise Exception(f"Round robin metadata not found for table '{tablename}'")
+    partition_count, last_partition_index = row
+    # Giá trị trong bộ nhớ đệm không còn đúng sau khi con trỏ dịch chuyển
+    _METADATA_CACHE.pop(_metadatakey(con, RROBIN_METADATA_TABLE, tablename), None)
+    return partition_count, (last_partition_index - count + 1) % partition_count
+
+class RatingsCopyStream:
+    """
+    Đối tượng dạng file (file-like) đưa trực tiếp vào cur.copy_expert.
+    Đọc ratings.dat theo từng khối có kích thước cố định, chuyển mỗi dòng
+    "userid::movieid::rating::timestamp" thành "userid\tmovieid\trating" rồi trả cho COPY.
+    Bộ nhớ chỉ giữ một khối tại một thời điểm và không ghi file tạm ra đĩa.
+    """
+
+    # Giữ 3 trường đầu, bỏ timestamp; xử lý cả dòng kết thúc bằng \r\n
+    LINE_PATTERN = re.compile(rb'^([^:\r\n]*)::([^:\r\n]*)::([^:\r\n]*)::[^\r\n]*?\r?$', re.MULTILINE)
+
+    def __init__(self, ratingsfilepath, chunksize=STREAM_CHUNK_SIZE, start=0, end=None):
+        # [start, end) là khoảng byte cần đọc, mặc định là toàn bộ file
+        self.file = open(ratingsfilepath, 'rb')
+        self.file.seek(start)
+        self.remaining = (end - start) if end is not None else None
+        self.chunksize = chunksize
+        self.remainder = b''     # Phần dòng dở dang ở cuối khối trước
+        self.buffer = b''        # Khối đã chuyển đổi, đang chờ COPY đọc
+        self.position = 0        # Vị trí đọc hiện tại trong buffer
+        self.eof = False
+
+    def next_block(self):
+        """
+        Trả về khối tiếp theo đã chuyển sang dạng tab (kết thúc tại một ký tự xuống dòng),
+        hoặc None khi đã đọc hết file.
+        """
+        while not self.eof:
+            size = self.chunksize if self.remaining is None else min(self.chunksize, self.remaining)
+            data = self.remainder + (self.file.read(size) if size > 0 else b'')
+            if self.remaining is not None:
+                self.remaining -= len(data) - len(self.remainder)
+            if len(data) == len(self.remainder):
+                self.eof = True
+                if data and not data.endswith(b'\n'):
+                    data += b'\n'
+                self.remainder = b''
+            else:
+                cut = data.rfind(b'\n') + 1
+                data, self.remainder = data[:cut], data[cut:]
+            if data:
+                return self.LINE_PATTERN.sub(rb'\1\t\2\t\3', data)
+        return None
+
+    def read(self, size=-1):
+        if self.position >= len(self.buffer):
+            self.buffer = self.next_block() or b''
+            self.position = 0
+        if size is None or size < 0:
+            size = len(self.buffer) - self.position
+        piece = self.buffer[self.position:self.position + size]
+        self.position += len(piece)
+        return piece
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def loadratingsstream(ratingstablename, ratingsfilepath, openconnection, chunksize=STREAM_CHUNK_SIZE):
+    """
+    Nạp ratings.dat theo kiểu streaming: đọc từng khối và đẩy thẳng vào COPY.
+    Bộ nhớ sử dụng không phụ thuộc kích thước file và không cần file CSV tạm.
+    """
+    create_db(DATABASE_NAME)
+
+    conn = openconnection
+    cur = conn.cursor()
+
+    try:
+        connectionpool.configure_session(cur.connection)  # synchronous_commit, work_mem, maintenance_work_mem
+
+        cur.execute(f"""
+            CREATE TABLE IF NOT EXISTS {ratingstablename} (
+                userid INTEGER,
+                movieid INTEGER,
+                rating FLOAT
+            ) WITH (fillfactor=100);
+        """)
+
+        # COPY dạng text (mặc định phân tách bằng tab), psycopg2 gọi stream.read() cho tới khi hết dữ liệu
+        with RatingsCopyStream(ratingsfilepath, chunksize) as stream:
+            cur.copy_expert(f"COPY {ratingstablename} (userid, movieid, rating) FROM STDIN", stream, size=COPY_BUFFER_SIZE)
+
+        conn.commit()
+
+    except Exception as e:
+        conn.rollback()
+        raise e
+
+    finally:
+        cur.close()
+
+def iter_ratings_chunks(ratingsfilepath, chunksize=STREAM_CHUNK_SIZE, start=0, end=None, usecache=False):
+    """
+    Đọc ratings.dat (hoặc khoảng byte [start, end)) theo từng khối và sinh ra
+    bộ ba mảng NumPy (userid int32, movieid int32, rating float64).
+    Mỗi khối được ratingsparser phân tích trực tiếp trên mmap bằng quét byte vector hóa,
+    không tạo chuỗi hay cột list-of-strings. rating giữ float64 để khớp kiểu FLOAT của bảng.
+    usecache=True (chỉ khi đọc cả file): lấy các cột từ ratingscache, chỉ phân tích khi cache chưa có.
+    """
+    if usecache:
+        if start != 0 or end is not None:
+            raise ValueError("usecache only supports reading the whole file")
+        yield from ratingscache.iter_cached_ratings(ratingsfilepath)
+        return
+    yield from ratingsparser.iter_ratings(ratingsfilepath, chunksize, start, end, ratingdtype=np.float64)
+
+
+def loadratingsbinary(ratingstablename, ratingsfilepath, openconnection, chunksize=STREAM_CHUNK_SIZE, usecache=False):
+    """
+    Nạp ratings.dat bằng COPY dạng nhị phân (FORMAT BINARY).
+    Các cột kiểu số được đóng gói trực tiếp thành định dạng PGCOPY, PostgreSQL không phải phân tích lại văn bản.
+    usecache=True: đọc các cột đã phân tích từ ratingscache (mmap) thay vì phân tích lại file.
+    """
+    create_db(DATABASE_NAME)
+
+    conn = openconnection
+    cur = conn.cursor()
+
+    try:
+        connectionpool.configure_session(cur.connection)  # synchronous_commit, work_mem, maintenance_work_mem
+
+        cur.execute(f"""
+            CREATE TABLE IF NOT EXISTS {ratingstablename} (
+                userid INTEGER,
+                movieid INTEGER,
+                rating FLOAT
+            ) WITH (fillfactor=100);
+        """)
+
+        stream = pgcopy.PGCopyBinaryStream(iter_ratings_chunks(ratingsfilepath, chunksize, usecache=usecache))
+        cur.copy_expert(
+            f"COPY {ratingstablename} (userid, movieid, rating) FROM STDIN (FORMAT BINARY)",
+            stream, size=COPY_BUFFER_SIZE
+        )
+
+        conn.commit()
+
+    except Exception as e:
+        conn.rollback()
+        raise e
+
+    finally:
+        cur.close()
+
+def split_file_ranges(ratingsfilepath, parts):
+    """
+    Chia file thành tối đa `parts` khoảng byte [start, end), mỗi ranh giới nằm ngay sau một ký tự xuống dòng.
+    """
+    size = os.path.getsize(ratingsfilepath)
+    bounds = [0]
+    with open(ratingsfilepath, 'rb') as f:
+        for i in range(1, parts):
+            pos = max(size * i // parts, bounds[-1])
+            if pos > 0:
+                # Lùi 1 byte rồi đọc hết dòng: nếu byte trước là '\n' thì giữ nguyên vị trí
+                f.seek(pos - 1)
+                f.readline()
+                pos = f.tell()
+            bounds.append(min(pos, size))
+    bounds.append(size)
+    return [(start, end) for start, end in zip(bounds, bounds[1:]) if end > start]
+
+
+def _loadratingsrange(connectionparams, tablename, ratingsfilepath, start, end, xid=None):
+    """
+    Tiến trình con: mở kết nối riêng, phân tích khoảng byte [start, end) và COPY nhị phân vào `tablename`.
+    Nếu có `xid` thì dùng giao dịch hai pha: dừng ở trạng thái PREPARED để tiến trình chính commit sau.
+    """
+    conn = connectionpool.connect_with(connectionparams)
+    try:
+        # Cấu hình phiên (đã commit) trước khi mở giao dịch hai pha
+        connectionpool.configure_session(conn)
+        if xid is not None:
+            conn.tpc_begin(xid)
+        cur = conn.cursor()
+        stream = pgcopy.PGCopyBinaryStream(iter_ratings_chunks(ratingsfilepath, start=start, end=end))
+        cur.copy_expert(
+            f"COPY {tablename} (userid, movieid, rating) FROM STDIN (FORMAT BINARY)",
+            stream, size=COPY_BUFFER_SIZE
+        )
+        cur.close()
+        if xid is not None:
+            conn.tpc_prepare()
+        else:
+            conn.commit()
+    finally:
+        conn.close()
+
+
+def loadratingsparallel(ratingstablename, ratingsfilepath, openconnection, workers=None, commitmode='staging'):
+    """
+    Nạp ratings.dat song song: chia file thành `workers` khoảng byte theo ranh giới dòng,
+    mỗi tiến trình con có kết nối riêng, tự phân tích và COPY phần của mình.
+    Kết quả là tất cả hoặc không có gì:
+    - commitmode='staging': mỗi tiến trình nạp vào bảng tạm UNLOGGED riêng, cuối cùng chuyển sang
+      bảng đích bằng một câu INSERT ... SELECT duy nhất rồi xóa các bảng tạm.
+    - commitmode='twophase': mỗi tiến trình COPY thẳng vào bảng đích trong một giao dịch PREPARED,
+      tiến trình chính chỉ COMMIT PREPARED khi mọi phần đều thành công
+      (cần max_prepared_transactions > 0 trên server).
+    """
+    if commitmode not in ('staging', 'twophase'):
+        raise ValueError(f"Unknown commitmode: {commitmode}")
+
+    create_db(DATABASE_NAME)
+    workers = workers or os.cpu_count() or 1
+    # Đủ host, port, user, mật khẩu của kết nối gọi hàm chứ không chỉ tên database
+    connectionparams = connectionpool.connectionparameters(openconnection)
+    ranges = split_file_ranges(ratingsfilepath, workers)
+
+    conn = openconnection
+    cur = conn.cursor()
+    # Bảng đích (hoặc bảng tạm) nhận dữ liệu của từng phần
+    if commitmode == 'staging':
+        targets = [f"{ratingstablename}_stage{i}" for i in range(len(ranges))]
+        xids = [None] * len(ranges)
+    else:
+        targets = [ratingstablename] * len(ranges)
+        xids = [f"loadratings_{ratingstablename}_{os.getpid()}_{i}" for i in range(len(ranges))]
+
+    try:
+        cur.execute(f"""
+            CREATE TABLE IF NOT EXISTS {ratingstablename} (
+                userid INTEGER,
+                movieid INTEGER,
+                rating FLOAT
+            ) WITH (fillfactor=100);
+        """)
+        if commitmode == 'staging':
+            for table in targets:
+                cur.execute(f"DROP TABLE IF EXISTS {table};")
+                cur.execute(f"CREATE UNLOGGED TABLE {table} (LIKE {ratingstablename});")
+        conn.commit()
+
+        # Mỗi tiến trình con xử lý một khoảng byte
+        with ProcessPoolExecutor(max_workers=len(ranges) or 1) as executor:
+            futures = [
+                executor.submit(_loadratingsrange, connectionparams, table, ratingsfilepath, start, end, xid)
+                for table, (start, end), xid in zip(targets, ranges, xids)
+            ]
+            errors = [f.exception() for f in futures]
+        failed = next((e for e in errors if e is not None), None)
+
+        if commitmode == 'twophase':
+            # Chỉ commit khi mọi phần đã PREPARED, ngược lại hủy các phần đã PREPARED.
+            # COMMIT/ROLLBACK PREPARED không chạy được trong khối giao dịch nên dùng kết nối autocommit riêng
+            finisher = connectionpool.connect_with(connectionparams)
+            finisher.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+            try:
+                with finisher.cursor() as fcur:
+                    fcur.execute("SELECT gid FROM pg_prepared_xacts WHERE gid = ANY(%s)", (xids,))
+                    for (gid,) in fcur.fetchall():
+                        fcur.execute(f"{'ROLLBACK' if failed else 'COMMIT'} PREPARED %s", (gid,))
+            finally:
+                finisher.close()
+        elif failed is None and targets:
+            # Một câu lệnh duy nhất nên vẫn nguyên tử kể cả khi kết nối ở chế độ autocommit
+            cur.execute(
+                f"INSERT INTO {ratingstablename} (userid, movieid, rating) "
+                + " UNION ALL ".join(f"SELECT userid, movieid, rating FROM {table}" for table in targets)
+            )
+            conn.commit()
+
+        if failed is not None:
+            raise failed
+
+    except Exception as e:
+        conn.rollback()
+        raise e
+
+    finally:
+        # Luôn xóa các bảng tạm, kể cả khi có lỗi
+        if commitmode == 'staging':
+            for table in targets:
+                cur.execute(f"DROP TABLE IF EXISTS {table};")
+            conn.commit()
+        cur.close()
+
 @measure_time
-def loadratings(ratingstablename, ratingsfilepath, openconnection):
+def loadratings(ratingstablename, ratingsfilepath, openconnection, mode='polars', usecache=False):
+    """
+    Nạp dữ liệu ratings vào PostgreSQL.
+    mode='polars': đọc toàn bộ file bằng Polars rồi COPY qua file CSV tạm (mặc định).
+    mode='stream': đọc theo từng khối và COPY trực tiếp, bộ nhớ không đổi theo kích thước file.
+    mode='binary': đọc theo từng khối và COPY dạng nhị phân (PGCOPY).
+    mode='parallel': chia file theo khoảng byte, nhiều tiến trình cùng COPY trên các kết nối riêng.
+    usecache=True: bỏ qua mode, nạp bằng COPY nhị phân từ các cột đã phân tích lưu trong ratingscache
+    (lần đầu phân tích và ghi cache, các lần sau chỉ mmap file cache).
+    """
+    if usecache:
+        return loadratingsbinary(ratingstablename, ratingsfilepath, openconnection, usecache=True)
+    if mode == 'stream':
+        return loadratingsstream(ratingstablename, ratingsfilepath, openconnection)
+    if mode == 'binary':
+        return loadratingsbinary(ratingstablename, ratingsfilepath, openconnection)
+    if mode == 'parallel':
+        return loadratingsparallel(ratingstablename, ratingsfilepath, openconnection)
+    if mode != 'polars':
+        raise ValueError(f"Unknown loadratings mode: {mode}")
+
     # Tạo database 
     create_db('dds_assgn1')
 
@@ -142,9 +664,7 @@ def loadratings(ratingstablename, ratingsfilepath, openconnection):
 
     try:
         # Tối ưu cấu hình PostgreSQL để tăng tốc độ INSERT/COPY
-        cur.execute("SET synchronous_commit = OFF;")  # Không cần ghi log ngay mỗi lần COMMIT
-        cur.execute("SET work_mem = '1024MB';")       # Tăng bộ nhớ RAM dùng cho các thao tác xử lý
-        cur.execute("SET maintenance_work_mem = '2097151kB';")  # Tăng RAM cho CREATE TABLE và COPY
+        connectionpool.configure_session(cur.connection)  # synchronous_commit, work_mem, maintenance_work_mem
 
         # Tạo bảng nếu chưa có, với fillfactor=100 (giảm phân mảnh khi ghi nhiều)
         cur.execute(f"""
@@ -192,72 +712,744 @@ def loadratings(ratingstablename, ratingsfilepath, openconnection):
         if os.path.exists(csv_path):
             os.remove(csv_path)
         
+def range_bounds(numberofpartitions):
+    """
+    Trả về danh sách (minR, maxR) của từng phân mảnh RANGE, tính giống hệt rangepartition:
+    phân mảnh 0 nhận [minR, maxR], các phân mảnh sau nhận (minR, maxR].
+    """
+    delta = 5.0 / numberofpartitions
+    return [(i * delta, i * delta + delta) for i in range(numberofpartitions)]
+
+
+def range_partition_indexes(rating, bounds):
+    """
+    Tính chỉ số phân mảnh RANGE cho cả mảng rating theo kiểu vector.
+    Trả về -1 với các giá trị nằm ngoài mọi khoảng (rangepartition cũng bỏ qua các dòng này).
+    """
+    rating = np.asarray(rating)
+    uppers = np.array([maxR for _, maxR in bounds])
+    # Chỉ số đầu tiên có maxR >= rating, tương ứng điều kiện "rating > minR AND rating <= maxR"
+    indexes = np.searchsorted(uppers, rating, side='left')
+    valid = (rating >= bounds[0][0]) & (indexes < len(bounds))
+    return np.where(valid, indexes, -1)
+
+
+def equidepth_bounds(values, counts, numberofpartitions, lo=0.0, hi=5.0):
+    """
+    Chọn các mốc biên sao cho mỗi phân mảnh nhận xấp xỉ cùng số dòng, từ biểu đồ tần suất chính xác
+    (các giá trị rating phân biệt `values` tăng dần và số dòng `counts` tương ứng).
+    Mốc cắt thứ k là giá trị phân biệt có số dòng cộng dồn gần k * N / n nhất. Vì rating rời rạc,
+    mọi dòng cùng một giá trị phải vào cùng một phân mảnh nên độ cân bằng bị giới hạn bởi giá trị xuất hiện nhiều nhất;
+    nếu số giá trị phân biệt ít hơn số phân mảnh thì các phân mảnh thừa là khoảng rỗng ở đầu trên.
+    Trả về danh sách numberofpartitions + 1 mốc tăng ngặt, phủ cả [lo, hi].
+    """
+    values = np.asarray(values, dtype=np.float64)
+    cumulative = np.cumsum(np.asarray(counts, dtype=np.int64))
+    total = int(cumulative[-1]) if len(cumulative) else 0
+    lower = min(lo, float(values[0])) if len(values) else lo
+    upper = max(hi, float(values[-1])) if len(values) else hi
+
+    # Không cắt tại giá trị lớn nhất: phân mảnh cuối phải chứa nó
+    candidates = len(values) - 1
+    cuts = []
+    if candidates >= numberofpartitions - 1:
+        previous = -1
+        for k in range(1, numberofpartitions):
+            target = total * k / numberofpartitions
+            j = int(np.searchsorted(cumulative, target))
+            if j > 0 and (j >= candidates or target - cumulative[j - 1] <= cumulative[j] - target):
+                j -= 1
+            # Giữ các mốc tăng ngặt và chừa đủ ứng viên cho các mốc còn lại
+            j = min(max(j, previous + 1), candidates - (numberofpartitions - 1 - k) - 1)
+            cuts.append(float(values[j]))
+            previous = j
+    else:
+        cuts = [float(v) for v in values[:candidates]]
+
+    boundaries = [lower] + cuts
+    # Chia đều phần còn lại phía trên thành các khoảng rỗng nếu thiếu mốc
+    missing = numberofpartitions - len(boundaries)
+    if missing > 0:
+        boundaries += [float(v) for v in np.linspace(boundaries[-1], upper, missing + 2)[1:-1]]
+    return boundaries + [upper]
+
+
+def range_insert_index(rating, bounds):
+    """
+    Chỉ số phân mảnh cho một rating theo các khoảng `bounds` bằng tìm kiếm nhị phân trên các cận trên.
+    Giá trị nằm ngoài [b0, bn] được đưa về phân mảnh đầu / cuối.
+    """
+    index = bisect.bisect_left([maxR for _, maxR in bounds], rating)
+    return min(index, len(bounds) - 1)
+
+
+# Hàm băm nhân của Knuth trên userid: lấy 32 bit thấp của userid * 2654435761 rồi bỏ 16 bit thấp
+# (các bit thấp của tích phân bố kém). Cùng một công thức ở Python, NumPy và SQL nên mọi nơi định tuyến giống nhau.
+HASH_MULTIPLIER = 2654435761
+
+
+def hash_partition_index(userid, numberofpartitions):
+    """Chỉ số phân mảnh HASH của một userid."""
+    return (((int(userid) * HASH_MULTIPLIER) & 0xFFFFFFFF) >> 16) % numberofpartitions
+
+
+def hash_partition_indexes(userid, numberofpartitions):
+    """Phiên bản vector hóa của hash_partition_index cho cả mảng userid (int32, tích vừa trong int64)."""
+    userid = np.asarray(userid, dtype=np.int64)
+    return (((userid * HASH_MULTIPLIER) & 0xFFFFFFFF) >> 16) % numberofpartitions
+
+
+def hash_expression(column, numberofpartitions):
+    """Biểu thức SQL tính chỉ số phân mảnh HASH của cột `column`, giống hash_partition_index."""
+    return f"(((({column})::bigint * {HASH_MULTIPLIER}) & 4294967295) >> 16) % {numberofpartitions}"
+
+
+def _copypartition(cur, tablename, userid, movieid, rating):
+    # Gửi một lô dòng vào bảng bằng COPY nhị phân
+    payload = pgcopy.PGCOPY_HEADER + pgcopy.encode_ratings(userid, movieid, rating) + pgcopy.PGCOPY_TRAILER
+    cur.copy_expert(
+        f"COPY {tablename} (userid, movieid, rating) FROM STDIN (FORMAT BINARY)",
+        io.BytesIO(payload), size=COPY_BUFFER_SIZE
+    )
+
+
 @measure_time
-def rangepartition(ratingstablename, numberofpartitions, openconnection):
+def loadandpartition(ratingstablename, ratingsfilepath, scheme, numberofpartitions, openconnection, loadbase=True,
+                     usecache=False):
     """
-    Phân mảnh bảng ratings thành nhiều bảng con dựa trên khoảng giá trị rating.
-    Ví dụ: 0-1, >1-2, >2-3, ...
+    Đọc ratings.dat đúng một lần và chuyển từng dòng thẳng vào bảng phân mảnh trong lúc nạp.
+    scheme='range': phân mảnh theo khoảng rating (range_partN), giống rangepartition.
+    scheme='roundrobin': phân mảnh theo thứ tự dòng (rrobin_partN), giống roundrobinpartition.
+    scheme='hash': phân mảnh theo hàm băm của userid (hash_partN), giống hashpartition.
+    loadbase=True thì đồng thời nạp cả bảng gốc `ratingstablename`.
+    usecache=True thì đọc các cột đã phân tích từ ratingscache thay vì phân tích lại file.
+    Metadata được ghi giống các hàm phân mảnh riêng lẻ nên rangeinsert/roundrobininsert vẫn dùng được.
     """
+    if scheme not in ('range', 'roundrobin', 'hash'):
+        raise ValueError(f"Unknown partitioning scheme: {scheme}")
+
+    create_db(DATABASE_NAME)
 
     con = openconnection
     cur = con.cursor()
-    RANGE_TABLE_PREFIX = 'range_part'   # Tiền tố cho tên bảng con
+    prefix = {'range': RANGE_TABLE_PREFIX, 'roundrobin': RROBIN_TABLE_PREFIX, 'hash': HASH_TABLE_PREFIX}[scheme]
+    bounds = range_bounds(numberofpartitions) if scheme == 'range' else None
 
     try:
-        # Khởi tạo bảng range_metadata
-        init_range_metadata_table(openconnection)
-        # Tối ưu hiệu suất INSERT/CREATE TABLE:
-        cur.execute("SET synchronous_commit = OFF;")           # Tắt ghi log mỗi COMMIT để giảm I/O
-        cur.execute("SET work_mem = '1024MB';")                # Tăng RAM cho các thao tác tính toán trung gian
-        cur.execute("SET maintenance_work_mem = '2097151kB';") # Tăng RAM cho CREATE TABLE, COPY, ...
-
-        # Tính độ rộng mỗi khoảng rating
-        delta = 5.0 / numberofpartitions
+        if scheme == 'range':
+            init_range_metadata_table(con)
+        elif scheme == 'hash':
+            init_hash_metadata_table(con)
+        else:
+            init_rrobin_metadata_table(con)
 
-        # Tạo từng bảng con theo khoảng
-        for i in range(numberofpartitions):
-            minR = i * delta             # Cận dưới của khoảng
-            maxR = minR + delta          # Cận trên của khoảng
-            table = f"{RANGE_TABLE_PREFIX}{i}"       # Tên bảng: range_part0, range_part1, ...
+        connectionpool.configure_session(cur.connection)  # synchronous_commit, work_mem, maintenance_work_mem
 
-            # Tạo bảng mới với dữ liệu trong khoảng [minR, maxR]
-            # Với i == 0 thì dùng >= minR, còn lại thì dùng > minR để tránh trùng
+        tables = [f"{prefix}{i}" for i in range(numberofpartitions)]
+        if loadbase:
             cur.execute(f"""
-                CREATE TABLE {table} AS
-                SELECT userid, movieid, rating
-                FROM {ratingstablename}
-                WHERE rating {'>=' if i == 0 else '>'} {minR}
-                  AND rating <= {maxR};
+                CREATE TABLE IF NOT EXISTS {ratingstablename} (
+                    userid INTEGER,
+                    movieid INTEGER,
+                    rating FLOAT
+                ) WITH (fillfactor=100);
             """)
-        # Cập nhật bảng range_metadata
-        update_range_metadata(openconnection, ratingstablename, numberofpartitions)
-        # Lưu tất cả thay đổi
-        con.commit()
+        for table in tables:
+            cur.execute(f"CREATE TABLE {table} (userid INTEGER, movieid INTEGER, rating FLOAT) WITH (fillfactor=100);")
+
+        # Mỗi khối được chia theo phân mảnh rồi COPY lần lượt vào từng bảng trên cùng một kết nối
+        total_rows = 0
+        for userid, movieid, rating in iter_ratings_chunks(ratingsfilepath, usecache=usecache):
+            if loadbase:
+                _copypartition(cur, ratingstablename, userid, movieid, rating)
+
+            if scheme == 'range':
+                indexes = range_partition_indexes(rating, bounds)
+            elif scheme == 'hash':
+                indexes = hash_partition_indexes(userid, numberofpartitions)
+            else:
+                # Thứ tự dòng toàn cục = số dòng đã đọc ở các khối trước + vị trí trong khối
+                indexes = (total_rows + np.arange(len(userid))) % numberofpartitions
+            total_rows += len(userid)
+
+            for i, table in enumerate(tables):
+                mask = indexes == i
+                if mask.any():
+                    _copypartition(cur, table, userid[mask], movieid[mask], rating[mask])
+
+        # Ghi metadata (hàm update_* commit luôn toàn bộ thay đổi phía trên)
+        if scheme == 'range':
+            update_range_metadata(con, ratingstablename, numberofpartitions)
+        elif scheme == 'hash':
+            update_hash_metadata(con, ratingstablename, numberofpartitions)
+        else:
+            last_partition_index = (total_rows - 1) % numberofpartitions if total_rows > 0 else -1
+            update_rrobin_metadata(con, ratingstablename, numberofpartitions, last_partition_index)
 
     except Exception as e:
-        # Nếu có lỗi thì rollback 
         con.rollback()
         raise e
 
     finally:
-        # Đóng cursor 
         cur.close()
-        
-@measure_time
-def roundrobinpartition(ratingstablename: str, numberofpartitions: int, openconnection):
-    con = openconnection
-    cur = con.cursor()
-    RROBIN_TABLE_PREFIX = 'rrobin_part'
-    temp_table = "rrobin_temp"
-    
-    try:
-        # Khởi tạo bảng metadata theo dõi trạng thái round-robin
+
+def _routedbuild(cur, router, columns, partitionby, children, selectsql, detach=True):
+    """
+    Xây các bảng phân mảnh chỉ với một lần quét bảng nguồn:
+    tạo bảng cha phân vùng tạm (router) có các bảng con chính là các phân mảnh đích,
+    INSERT ... SELECT một lần vào bảng cha để PostgreSQL tự định tuyến từng dòng,
+    sau đó tách (DETACH) các bảng con thành bảng độc lập và xóa bảng cha.
+    Với detach=False thì giữ nguyên bảng cha (dùng cho backend phân vùng khai báo của PostgreSQL).
+    `children` là danh sách (tên bảng, mệnh đề FOR VALUES ...). Trả về số dòng đã chèn.
+    """
+    cur.execute(f"DROP TABLE IF EXISTS {router};")
+    cur.execute(f"CREATE TABLE {router} ({columns}) PARTITION BY {partitionby};")
+    for table, forvalues in children:
+        cur.execute(f"CREATE TABLE {table} PARTITION OF {router} {forvalues} WITH (fillfactor=100);")
+
+    cur.execute(f"INSERT INTO {router} {selectsql};")
+    rows = cur.rowcount
+    if not detach:
+        return rows
+
+    for table, _ in children:
+        cur.execute(f"ALTER TABLE {router} DETACH PARTITION {table};")
+    cur.execute(f"DROP TABLE {router};")
+    return rows
+
+
+def range_forvalues(bounds):
+    """
+    Đổi các khoảng (minR, maxR] của rangepartition sang mệnh đề FOR VALUES FROM (...) TO (...)
+    của PostgreSQL (cận dưới bao gồm, cận trên loại trừ) bằng math.nextafter.
+    Cận dưới của mỗi phân mảnh là cận trên của phân mảnh trước nên các khoảng liền nhau, không chồng lấn.
+    """
+    forvalues = []
+    lower = bounds[0][0]
+    for _, maxR in bounds:
+        upper = math.nextafter(maxR, math.inf)
+        forvalues.append(f"FOR VALUES FROM ({lower!r}) TO ({upper!r})")
+        lower = upper
+    return forvalues
+
+
+def rangeparentname(ratingstablename):
+    # Tên bảng cha của backend phân vùng khai báo (không bắt đầu bằng range_part)
+    return f"{ratingstablename}_range"
+
+
+def rrobinparentname(ratingstablename):
+    return f"{ratingstablename}_rrobin"
+
+
+def rangepartitionnative(ratingstablename, numberofpartitions, openconnection):
+    """
+    Backend phân vùng khai báo của PostgreSQL cho RANGE: bảng cha <ratings>_range PARTITION BY RANGE (rating)
+    với các phân vùng con range_partN, nạp một lần bằng INSERT ... SELECT và giữ nguyên bảng cha.
+    Truy vấn qua bảng cha được planner cắt tỉa phân vùng (partition pruning) và gộp theo phân vùng;
+    INSERT vào bảng cha (rangeinsertnative) được định tuyến tự động.
+    """
+    con = openconnection
+    cur = con.cursor()
+
+    try:
+        init_range_metadata_table(con)
+        connectionpool.configure_session(cur.connection)  # synchronous_commit, work_mem, ..., enable_partitionwise_aggregate
+
+        bounds = range_bounds(numberofpartitions)
+        children = [
+            (f"{RANGE_TABLE_PREFIX}{i}", forvalues)
+            for i, forvalues in enumerate(range_forvalues(bounds))
+        ]
+        _routedbuild(
+            cur, rangeparentname(ratingstablename),
+            "userid INTEGER, movieid INTEGER, rating FLOAT", "RANGE (rating)", children,
+            f"""SELECT userid, movieid, rating FROM {ratingstablename}
+                WHERE rating >= {bounds[0][0]!r} AND rating <= {bounds[-1][1]!r}""",
+            detach=False
+        )
+        cur.execute(f"ANALYZE {rangeparentname(ratingstablename)};")
+
+        update_range_metadata(con, ratingstablename, numberofpartitions)
+        con.commit()
+
+    except Exception as e:
+        con.rollback()
+        raise e
+
+    finally:
+        cur.close()
+
+
+def roundrobinpartitionnative(ratingstablename, numberofpartitions, openconnection):
+    """
+    Backend phân vùng khai báo cho ROUND ROBIN: bảng cha <ratings>_rrobin PARTITION BY LIST (rrobin_slot),
+    mỗi rrobin_partN nhận slot N. Con trỏ round robin vẫn là rrobin_metadata như các backend khác:
+    roundrobininsertnative cấp slot qua allocate_rrobin_slots rồi ghi slot tường minh vào bảng cha.
+    Cột rrobin_slot của mỗi rrobin_partN có mặc định là N nên roundrobininsert / roundrobininsert_many
+    (ghi thẳng vào phân mảnh, không có cột rrobin_slot) vẫn dùng được trên bố cục này.
+    """
+    con = openconnection
+    cur = con.cursor()
+    parent = rrobinparentname(ratingstablename)
+
+    try:
+        init_rrobin_metadata_table(con)
+        connectionpool.configure_session(cur.connection)  # synchronous_commit, work_mem, ..., enable_partitionwise_aggregate
+
+        cur.execute(f"DROP TABLE IF EXISTS {parent};")
+        tables = [f"{RROBIN_TABLE_PREFIX}{i}" for i in range(numberofpartitions)]
+        total_rows = _routedbuild(
+            cur, parent,
+            "userid INTEGER, movieid INTEGER, rating FLOAT, rrobin_slot INTEGER NOT NULL",
+            "LIST (rrobin_slot)",
+            [(table, f"FOR VALUES IN ({i})") for i, table in enumerate(tables)],
+            f"""(userid, movieid, rating, rrobin_slot)
+                SELECT userid, movieid, rating, (ROW_NUMBER() OVER () - 1) % {numberofpartitions}
+                FROM {ratingstablename}""",
+            detach=False
+        )
+        for i, table in enumerate(tables):
+            cur.execute(f"ALTER TABLE {table} ALTER COLUMN rrobin_slot SET DEFAULT {i};")
+        cur.execute(f"ANALYZE {parent};")
+
+        last_partition_index = (total_rows - 1) % numberofpartitions if total_rows > 0 else -1
+        update_rrobin_metadata(con, ratingstablename, numberofpartitions, last_partition_index)
+        con.commit()
+
+    except Exception as e:
+        con.rollback()
+        raise e
+
+    finally:
+        cur.close()
+
+def rangepartitionsinglescan(ratingstablename, numberofpartitions, openconnection, boundaries=None):
+    """
+    Phân mảnh RANGE đọc bảng ratings đúng một lần (thay vì một lần cho mỗi phân mảnh):
+    các dòng được PostgreSQL định tuyến qua một bảng cha PARTITION BY RANGE (rating) tạm thời.
+    Thời gian gần như không đổi khi số phân mảnh tăng.
+    boundaries: numberofpartitions + 1 mốc biên tăng ngặt (lưu vào range_metadata); mặc định chia đều [0, 5].
+    """
+    con = openconnection
+    cur = con.cursor()
+
+    try:
+        init_range_metadata_table(openconnection)
+        connectionpool.configure_session(cur.connection)  # synchronous_commit, work_mem, maintenance_work_mem
+
+        if boundaries is None:
+            bounds = range_bounds(numberofpartitions)
+        else:
+            bounds = list(zip(boundaries[:-1], boundaries[1:]))
+        children = [
+            (f"{RANGE_TABLE_PREFIX}{i}", forvalues)
+            for i, forvalues in enumerate(range_forvalues(bounds))
+        ]
+        # Chỉ lấy các dòng nằm trong [0, 5] giống các câu CREATE TABLE AS của rangepartition
+        _routedbuild(
+            cur, f"{ratingstablename}_range_router",
+            "userid INTEGER, movieid INTEGER, rating FLOAT", "RANGE (rating)", children,
+            f"""SELECT userid, movieid, rating FROM {ratingstablename}
+                WHERE rating >= {bounds[0][0]!r} AND rating <= {bounds[-1][1]!r}"""
+        )
+
+        update_range_metadata(openconnection, ratingstablename, numberofpartitions, boundaries)
+        con.commit()
+
+    except Exception as e:
+        con.rollback()
+        raise e
+
+    finally:
+        cur.close()
+
+
+def rating_histogram(ratingstablename, openconnection):
+    """Biểu đồ tần suất chính xác của cột rating: (mảng giá trị phân biệt tăng dần, mảng số dòng)."""
+    cur = openconnection.cursor()
+    cur.execute(f"SELECT rating, count(*) FROM {ratingstablename} GROUP BY rating ORDER BY rating")
+    rows = cur.fetchall()
+    cur.close()
+    values = np.array([row[0] for row in rows], dtype=np.float64)
+    counts = np.array([row[1] for row in rows], dtype=np.int64)
+    return values, counts
+
+
+def rangepartitionequidepth(ratingstablename, numberofpartitions, openconnection):
+    """
+    Phân mảnh RANGE theo phân vị (equi-depth): mốc biên được tính từ biểu đồ tần suất của rating
+    để các phân mảnh có số dòng xấp xỉ nhau, rồi xây trong một lần quét như mode='singlescan'.
+    Các mốc được lưu ở cột boundaries của range_metadata để rangeinsert định tuyến bằng tìm kiếm nhị phân.
+    """
+    values, counts = rating_histogram(ratingstablename, openconnection)
+    boundaries = equidepth_bounds(values, counts, numberofpartitions)
+    rangepartitionsinglescan(ratingstablename, numberofpartitions, openconnection, boundaries)
+
+def _buildpartitionworker(connectionparams, statement):
+    """
+    Luồng con: mượn một kết nối từ pool, chạy một câu CREATE TABLE ... AS, commit và trả về số dòng.
+    """
+    with connectionpool.pooled_connection(connectionparams) as conn:
+        cur = conn.cursor()
+        # SET LOCAL để không để lại cấu hình cho người mượn kết nối sau;
+        # các luồng đã chạy song song với nhau nên mỗi câu không mở thêm worker
+        cur.execute("SET LOCAL max_parallel_workers_per_gather = 0;")
+        cur.execute(statement)
+        rows = cur.rowcount
+        cur.close()
+        conn.commit()
+        return rows
+
+
+def _buildpartitionsparallel(openconnection, tables, statements, workers):
+    """
+    Xây các phân mảnh đồng thời trên `workers` kết nối lấy từ pool, mỗi phân mảnh dưới tên tạm staging_<tên>.
+    Trả về (danh sách tên tạm, tổng số dòng). Nếu có lỗi thì xóa mọi bảng tạm rồi ném lại lỗi.
+    """
+    # Các luồng dùng cùng máy chủ, tài khoản và database với kết nối gọi hàm
+    connectionparams = connectionpool.connectionparameters(openconnection)
+    stagings = [f"staging_{table}" for table in tables]
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(_buildpartitionworker, connectionparams, statement.format(table=staging))
+                for staging, statement in zip(stagings, statements)
+            ]
+            total_rows = sum(f.result() for f in futures)
+    except Exception:
+        with openconnection.cursor() as cur:
+            for staging in stagings:
+                cur.execute(f"DROP TABLE IF EXISTS {staging};")
+        openconnection.commit()
+        raise
+    return stagings, total_rows
+
+
+def _publishpartitions(openconnection, tables, stagings, writemetadata):
+    """
+    Đổi tên các bảng tạm thành tên phân mảnh thật và ghi metadata trong cùng một giao dịch.
+    Nếu kết nối đang ở chế độ autocommit thì mở giao dịch tường minh bằng BEGIN.
+    """
+    con = openconnection
+    cur = con.cursor()
+    explicit = con.autocommit
+    try:
+        if explicit:
+            cur.execute("BEGIN;")
+        for staging, table in zip(stagings, tables):
+            cur.execute(f"ALTER TABLE {staging} RENAME TO {table};")
+        writemetadata()
+        if explicit:
+            cur.execute("COMMIT;")
+        else:
+            con.commit()
+    except Exception as e:
+        if explicit:
+            cur.execute("ROLLBACK;")
+        con.rollback()
+        for staging in stagings:
+            cur.execute(f"DROP TABLE IF EXISTS {staging};")
+        con.commit()
+        raise e
+    finally:
+        cur.close()
+
+
+def rangepartitionparallel(ratingstablename, numberofpartitions, openconnection, workers=4):
+    """
+    Phân mảnh RANGE song song: mỗi phân mảnh được tạo bằng CREATE TABLE AS trên một trong `workers` kết nối,
+    dưới tên tạm, sau đó đổi tên tất cả và ghi metadata trong một giao dịch cuối cùng.
+    """
+    init_range_metadata_table(openconnection)
+    tables = [f"{RANGE_TABLE_PREFIX}{i}" for i in range(numberofpartitions)]
+    statements = [
+        f"""CREATE TABLE {{table}} AS
+            SELECT userid, movieid, rating
+            FROM {ratingstablename}
+            WHERE rating {'>=' if i == 0 else '>'} {minR}
+              AND rating <= {maxR};"""
+        for i, (minR, maxR) in enumerate(range_bounds(numberofpartitions))
+    ]
+    stagings, _ = _buildpartitionsparallel(openconnection, tables, statements, workers)
+    _publishpartitions(
+        openconnection, tables, stagings,
+        lambda: update_range_metadata(openconnection, ratingstablename, numberofpartitions)
+    )
+
+
+def roundrobinpartitionparallel(ratingstablename, numberofpartitions, openconnection, workers=4):
+    """
+    Phân mảnh ROUND ROBIN song song: các dòng được đánh số một lần vào bảng tạm staging_<ratings>_rnum,
+    sau đó mỗi kết nối lấy các dòng thuộc phân mảnh của mình từ bảng tạm đó
+    (đánh số riêng trên từng kết nối thì thứ tự quét có thể khác nhau, dòng bị lặp hoặc mất).
+    Cuối cùng đổi tên các bảng tạm và ghi metadata trong một giao dịch.
+    """
+    init_rrobin_metadata_table(openconnection)
+    tables = [f"{RROBIN_TABLE_PREFIX}{i}" for i in range(numberofpartitions)]
+    numbered = f"staging_{ratingstablename}_rnum"
+    with openconnection.cursor() as cur:
+        cur.execute(f"DROP TABLE IF EXISTS {numbered};")
+        cur.execute(f"""
+            CREATE UNLOGGED TABLE {numbered} AS
+            SELECT userid, movieid, rating, (ROW_NUMBER() OVER () - 1) % {numberofpartitions} AS partition_id
+            FROM {ratingstablename};
+        """)
+    openconnection.commit()
+
+    try:
+        statements = [
+            f"""CREATE TABLE {{table}} AS
+                SELECT userid, movieid, rating
+                FROM {numbered}
+                WHERE partition_id = {i};"""
+            for i in range(numberofpartitions)
+        ]
+        stagings, total_rows = _buildpartitionsparallel(openconnection, tables, statements, workers)
+    finally:
+        with openconnection.cursor() as cur:
+            cur.execute(f"DROP TABLE IF EXISTS {numbered};")
+        openconnection.commit()
+
+    last_partition_index = (total_rows - 1) % numberofpartitions if total_rows > 0 else -1
+    _publishpartitions(
+        openconnection, tables, stagings,
+        lambda: update_rrobin_metadata(openconnection, ratingstablename, numberofpartitions, last_partition_index)
+    )
+
+# Chỉ mục mặc định cho từng phân mảnh: hậu tố tên chỉ mục -> (phương thức, danh sách cột)
+PARTITION_INDEXES = {
+    'userid': ('btree', 'userid'),
+    'movieid_userid': ('btree', 'movieid, userid'),
+    'rating_brin': ('brin', 'rating'),
+}
+
+
+def _createindexworker(connectionparams, table, indexes, memorykb):
+    """
+    Luồng con: mượn một kết nối từ pool, tạo các chỉ mục còn thiếu của một phân mảnh và trả về thời gian (giây).
+    """
+    start = time.perf_counter()
+    with connectionpool.pooled_connection(connectionparams) as conn:
+        cur = conn.cursor()
+        # SET LOCAL để không để lại cấu hình cho người mượn kết nối sau
+        cur.execute(f"SET LOCAL maintenance_work_mem = '{memorykb}kB';")
+        # Đã song song ở mức phân mảnh nên không để CREATE INDEX mở thêm worker
+        cur.execute("SET LOCAL max_parallel_maintenance_workers = 0;")
+        for suffix, (method, columns) in indexes.items():
+            cur.execute(f"CREATE INDEX IF NOT EXISTS {table}_{suffix}_idx ON {table} USING {method} ({columns});")
+        cur.close()
+        conn.commit()
+    return time.perf_counter() - start
+
+
+def createpartitionindexes(scheme, numberofpartitions, openconnection, indexes=None, workers=4, memorykb=None):
+    """
+    Tạo chỉ mục cho mọi phân mảnh của `scheme` ('range' hoặc 'roundrobin') đồng thời trên `workers` kết nối từ pool.
+    indexes: dict hậu tố -> (phương thức, cột), mặc định PARTITION_INDEXES; chỉ mục đã có thì bỏ qua.
+    memorykb: tổng ngân sách bộ nhớ (kB) chia đều cho các luồng, mặc định là maintenance_work_mem
+    hiện tại của openconnection; mỗi kết nối nhận memorykb / workers (tối thiểu 1MB).
+    Trả về dict tên phân mảnh -> thời gian xây (giây).
+    """
+    prefix = _partitionprefix(scheme)
+    indexes = PARTITION_INDEXES if indexes is None else indexes
+    connectionparams = connectionpool.connectionparameters(openconnection)
+    tables = [f"{prefix}{i}" for i in range(numberofpartitions)]
+    if memorykb is None:
+        with openconnection.cursor() as cur:
+            cur.execute("SELECT pg_size_bytes(current_setting('maintenance_work_mem')) / 1024")
+            memorykb = int(cur.fetchone()[0])
+        if not openconnection.autocommit:
+            openconnection.commit()
+    memorykb = max(1024, memorykb // max(1, workers))
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(_createindexworker, connectionparams, table, indexes, memorykb) for table in tables]
+        timings = {table: f.result() for table, f in zip(tables, futures)}
+
+    for table, seconds in timings.items():
+        print(f"Chỉ mục của '{table}' được tạo trong {seconds:.4f} giây.")
+    return timings
+
+
+@measure_time
+def rangepartition(ratingstablename, numberofpartitions, openconnection, mode='ctas', workers=4, withindex=False,
+                   withbloom=False, bloomfpr=0.01, partitionindexes=None):
+    """
+    Phân mảnh bảng ratings thành nhiều bảng con dựa trên khoảng giá trị rating.
+    Ví dụ: 0-1, >1-2, >2-3, ...
+    mode='ctas': mỗi phân mảnh một câu CREATE TABLE AS (mặc định).
+    mode='singlescan': đọc bảng ratings một lần và định tuyến dòng vào mọi phân mảnh.
+    mode='parallel': tạo các phân mảnh đồng thời trên `workers` kết nối.
+    mode='native': dùng phân vùng khai báo của PostgreSQL (bảng cha <ratings>_range).
+    mode='equidepth': mốc biên theo phân vị của rating để các phân mảnh có kích thước gần bằng nhau.
+    withindex=True: xây thêm chỉ mục phụ toàn cục (userid, movieid) -> phân mảnh.
+    withbloom=True: xây Bloom filter theo userid và (userid, movieid) cho từng phân mảnh, tỉ lệ dương tính giả bloomfpr.
+    partitionindexes: True (dùng PARTITION_INDEXES) hoặc dict chỉ mục, tạo song song trên mọi phân mảnh sau khi xây.
+    """
+    if mode == 'native':
+        rangepartitionnative(ratingstablename, numberofpartitions, openconnection)
+    elif mode == 'singlescan':
+        rangepartitionsinglescan(ratingstablename, numberofpartitions, openconnection)
+    elif mode == 'equidepth':
+        rangepartitionequidepth(ratingstablename, numberofpartitions, openconnection)
+    elif mode == 'parallel':
+        rangepartitionparallel(ratingstablename, numberofpartitions, openconnection, workers)
+    elif mode == 'ctas':
+        rangepartitionctas(ratingstablename, numberofpartitions, openconnection)
+    else:
+        raise ValueError(f"Unknown rangepartition mode: {mode}")
+
+    # Các phân mảnh vừa được xây lại nên chỉ mục phụ và Bloom filter cũ (nếu có) không còn đúng
+    if withindex:
+        build_partition_index('range', numberofpartitions, openconnection)
+    else:
+        drop_partition_index('range', openconnection)
+    if withbloom:
+        build_partition_blooms('range', numberofpartitions, openconnection, bloomfpr)
+    else:
+        drop_partition_blooms('range', openconnection)
+    if partitionindexes:
+        createpartitionindexes('range', numberofpartitions, openconnection,
+                               None if partitionindexes is True else partitionindexes, workers)
+
+
+def rangepartitionctas(ratingstablename, numberofpartitions, openconnection):
+    """
+    Phân mảnh RANGE bằng một câu CREATE TABLE AS cho mỗi phân mảnh.
+    """
+    con = openconnection
+    cur = con.cursor()
+    RANGE_TABLE_PREFIX = 'range_part'   # Tiền tố cho tên bảng con
+
+    try:
+        # Khởi tạo bảng range_metadata
+        init_range_metadata_table(openconnection)
+        # Tối ưu hiệu suất INSERT/CREATE TABLE:
+        connectionpool.configure_session(cur.connection)  # synchronous_commit, work_mem, maintenance_work_mem
+
+        # Tính độ rộng mỗi khoảng rating
+        delta = 5.0 / numberofpartitions
+
+        # Tạo từng bảng con theo khoảng
+        for i in range(numberofpartitions):
+            minR = i * delta             # Cận dưới của khoảng
+            maxR = minR + delta          # Cận trên của khoảng
+            table = f"{RANGE_TABLE_PREFIX}{i}"       # Tên bảng: range_part0, range_part1, ...
+
+            # Tạo bảng mới với dữ liệu trong khoảng [minR, maxR]
+            # Với i == 0 thì dùng >= minR, còn lại thì dùng > minR để tránh trùng
+            cur.execute(f"""
+                CREATE TABLE {table} AS
+                SELECT userid, movieid, rating
+                FROM {ratingstablename}
+                WHERE rating {'>=' if i == 0 else '>'} {minR}
+                  AND rating <= {maxR};
+            """)
+        # Cập nhật bảng range_metadata
+        update_range_metadata(openconnection, ratingstablename, numberofpartitions)
+        # Lưu tất cả thay đổi
+        con.commit()
+
+    except Exception as e:
+        # Nếu có lỗi thì rollback 
+        con.rollback()
+        raise e
+
+    finally:
+        # Đóng cursor 
+        cur.close()
+        
+def roundrobinpartitionsinglescan(ratingstablename, numberofpartitions, openconnection):
+    """
+    Phân mảnh ROUND ROBIN trong một lần quét, không tạo bảng tạm rrobin_temp:
+    ROW_NUMBER() được tính ngay trong luồng INSERT ... SELECT và dùng làm khóa của một bảng cha
+    PARTITION BY LIST tạm thời, PostgreSQL định tuyến từng dòng vào rrobin_partN.
+    Tổng số dòng lấy từ rowcount của chính câu INSERT, không cần SELECT COUNT(*) riêng.
+    """
+    con = openconnection
+    cur = con.cursor()
+
+    try:
+        init_rrobin_metadata_table(con)
+        connectionpool.configure_session(cur.connection)  # synchronous_commit, work_mem, maintenance_work_mem
+
+        tables = [f"{RROBIN_TABLE_PREFIX}{i}" for i in range(numberofpartitions)]
+        total_rows = _routedbuild(
+            cur, f"{ratingstablename}_rrobin_router",
+            "userid INTEGER, movieid INTEGER, rating FLOAT, partition_id INTEGER", "LIST (partition_id)",
+            [(table, f"FOR VALUES IN ({i})") for i, table in enumerate(tables)],
+            f"""SELECT userid, movieid, rating, (ROW_NUMBER() OVER () - 1) % {numberofpartitions}
+                FROM {ratingstablename}"""
+        )
+        # Cột định tuyến không còn cần sau khi tách; DROP COLUMN chỉ sửa catalog, không ghi lại dữ liệu
+        for table in tables:
+            cur.execute(f"ALTER TABLE {table} DROP COLUMN partition_id;")
+
+        last_partition_index = (total_rows - 1) % numberofpartitions if total_rows > 0 else -1
+        update_rrobin_metadata(con, ratingstablename, numberofpartitions, last_partition_index)
+        con.commit()
+
+    except Exception as e:
+        con.rollback()
+        raise e
+
+    finally:
+        cur.close()
+
+@measure_time
+def roundrobinpartition(ratingstablename: str, numberofpartitions: int, openconnection, mode='temptable', workers=4, withindex=False,
+                         withbloom=False, bloomfpr=0.01, partitionindexes=None):
+    """
+    Phân mảnh bảng ratings theo phương pháp Round Robin.
+    mode='temptable': đánh số dòng vào bảng tạm rrobin_temp rồi tạo từng phân mảnh (mặc định).
+    mode='singlescan': gán phân mảnh trong một lần quét, không tạo bảng trung gian.
+    mode='parallel': tạo các phân mảnh đồng thời trên `workers` kết nối.
+    mode='native': dùng phân vùng khai báo của PostgreSQL (bảng cha <ratings>_rrobin).
+    withindex=True: xây thêm chỉ mục phụ toàn cục (userid, movieid) -> phân mảnh.
+    withbloom=True: xây Bloom filter theo userid và (userid, movieid) cho từng phân mảnh, tỉ lệ dương tính giả bloomfpr.
+    partitionindexes: True (dùng PARTITION_INDEXES) hoặc dict chỉ mục, tạo song song trên mọi phân mảnh sau khi xây.
+    """
+    if mode == 'native':
+        roundrobinpartitionnative(ratingstablename, numberofpartitions, openconnection)
+    elif mode == 'singlescan':
+        roundrobinpartitionsinglescan(ratingstablename, numberofpartitions, openconnection)
+    elif mode == 'parallel':
+        roundrobinpartitionparallel(ratingstablename, numberofpartitions, openconnection, workers)
+    elif mode == 'temptable':
+        roundrobinpartitiontemptable(ratingstablename, numberofpartitions, openconnection)
+    else:
+        raise ValueError(f"Unknown roundrobinpartition mode: {mode}")
+
+    # Các phân mảnh vừa được xây lại nên chỉ mục phụ và Bloom filter cũ (nếu có) không còn đúng
+    if withindex:
+        build_partition_index('roundrobin', numberofpartitions, openconnection)
+    else:
+        drop_partition_index('roundrobin', openconnection)
+    if withbloom:
+        build_partition_blooms('roundrobin', numberofpartitions, openconnection, bloomfpr)
+    else:
+        drop_partition_blooms('roundrobin', openconnection)
+    if partitionindexes:
+        createpartitionindexes('roundrobin', numberofpartitions, openconnection,
+                               None if partitionindexes is True else partitionindexes, workers)
+
+
+def roundrobinpartitiontemptable(ratingstablename: str, numberofpartitions: int, openconnection):
+    """
+    Phân mảnh ROUND ROBIN qua bảng tạm rrobin_temp đánh số dòng sẵn.
+    """
+    con = openconnection
+    cur = con.cursor()
+    RROBIN_TABLE_PREFIX = 'rrobin_part'
+    temp_table = "rrobin_temp"
+    
+    try:
+        # Khởi tạo bảng metadata theo dõi trạng thái round-robin
         init_rrobin_metadata_table(con)
         
         # Thiết lập PostgreSQL để tối ưu hiệu suất
-        cur.execute("SET synchronous_commit = OFF;")            # Tắt ghi log để tăng tốc độ insert
-        cur.execute("SET work_mem = '1024MB';")                 # Tăng bộ nhớ xử lý sort/hash
-        cur.execute("SET maintenance_work_mem = '2097151kB';")  # Tăng bộ nhớ cho thao tác CREATE TABLE
+        connectionpool.configure_session(cur.connection)  # synchronous_commit, work_mem, maintenance_work_mem
 
         # Tạo bảng tạm chứa dữ liệu và chỉ số phân vùng được tính trước
         cur.execute(f"""
@@ -314,28 +1506,32 @@ def roundrobininsert(ratingstablename: str, userid: int, itemid: int, rating: fl
     con = openconnection
     cur = con.cursor()
 
-    # Tiền tố tên bảng cho các phân mảnh round robin
-    RROBIN_TABLE_PREFIX = 'rrobin_part'
+    # Ở chế độ autocommit cần mở giao dịch tường minh để cấp slot và INSERT cùng commit
+    explicit = con.autocommit
     try:
-        # Lấy tổng số phân mảnh round robin và chỉ số của phân mảnh cuối cùng vừa được thêm dữ liệu từ bảng metadata
-        partition_count, last_partition_index = get_rrobin_metadata(con, ratingstablename)
-        
-        # Tính toán chỉ số của phân mảnh round robin thích hợp
-        partition_index = (last_partition_index + 1) % partition_count
+        if explicit:
+            cur.execute("BEGIN;")
+
+        # Cấp slot round robin kế tiếp bằng một câu UPDATE ... RETURNING nguyên tử
+        partition_count, partition_index = allocate_rrobin_slots(con, ratingstablename)
 
         # Tên bảng phân mảnh round robin tương ứng
         table_name = f"{RROBIN_TABLE_PREFIX}{partition_index}"
 
         # Thêm dòng mới vào phân mảnh round robin tương ứng
         cur.execute(f"INSERT INTO {table_name} (userid, movieid, rating) VALUES (%s, %s, %s)", (userid, itemid, rating))
-
-        # Cập nhật metadata cho phân mảnh round robin
-        update_rrobin_metadata(con, ratingstablename, partition_count, partition_index)
+        _indexrows(cur, 'roundrobin', [userid], [itemid], [partition_index])
+        _bloomrows(cur, 'roundrobin', [userid], [itemid], [partition_index])
 
         # Commit các thay đổi
-        con.commit()
+        if explicit:
+            cur.execute("COMMIT;")
+        else:
+            con.commit()
     except Exception as e:
         # Rollback các thay đổi nếu có lỗi
+        if explicit and not con.closed:
+            cur.execute("ROLLBACK;")
         con.rollback()
         raise e
     finally:
@@ -353,23 +1549,39 @@ def rangeinsert(ratingstablename: str, userid: int, itemid: int, rating: float,
     cur = con.cursor()
     RANGE_TABLE_PREFIX = 'range_part'
     try:
-        # Lấy tổng số phân mảnh range từ bảng metadata
-        partition_count = get_range_metadata(con, ratingstablename)
-        
-        # Tính toán chỉ số của phân mảnh range thích hợp
-        delta = 5.0 / partition_count
-        index = int(rating / delta)
-        if rating % delta == 0 and index != 0:
-            index = index - 1
+        # Lần thử thứ hai đọc lại metadata từ database (xem STALE_PARTITION_ERRORS)
+        for attempt in range(2):
+            # Lấy tổng số phân mảnh range từ bảng metadata
+            partition_count = get_range_metadata(con, ratingstablename, usecache=attempt == 0)
+            boundaries = get_range_boundaries(con, ratingstablename, usecache=attempt == 0)
 
-        # Tên bảng phân mảnh range tương ứng
-        table_name = f"{RANGE_TABLE_PREFIX}{index}"
+            # Tính toán chỉ số của phân mảnh range thích hợp
+            if boundaries is not None:
+                # Mốc biên lưu sẵn (equi-depth, tách / gộp phân mảnh): tìm kiếm nhị phân trên các cận trên
+                index = range_insert_index(rating, list(zip(boundaries[:-1], boundaries[1:])))
+            else:
+                delta = 5.0 / partition_count
+                index = int(rating / delta)
+                if rating % delta == 0 and index != 0:
+                    index = index - 1
 
-        # Thêm dòng mới vào phân mảnh range tương ứng
-        cur.execute(f"INSERT INTO {table_name} (userid, movieid, rating) VALUES (%s, %s, %s)", (userid, itemid, rating))
+            # Tên bảng phân mảnh range tương ứng
+            table_name = f"{RANGE_TABLE_PREFIX}{index}"
 
-        # Commit các thay đổi
-        con.commit()
+            # Thêm dòng mới vào phân mảnh range tương ứng
+            try:
+                cur.execute(f"INSERT INTO {table_name} (userid, movieid, rating) VALUES (%s, %s, %s)", (userid, itemid, rating))
+            except STALE_PARTITION_ERRORS:
+                if attempt:
+                    raise
+                con.rollback()
+                continue
+            _indexrows(cur, 'range', [userid], [itemid], [index])
+            _bloomrows(cur, 'range', [userid], [itemid], [index])
+
+            # Commit các thay đổi
+            con.commit()
+            break
     except Exception as e:
         # Rollback các thay đổi nếu có lỗi
         con.rollback()
@@ -379,36 +1591,1050 @@ def rangeinsert(ratingstablename: str, userid: int, itemid: int, rating: float,
         cur.close()
 
 @measure_time
-def create_db(dbname):
+def rangeinsertnative(ratingstablename: str, userid: int, itemid: int, rating: float, openconnection):
     """
-    Tạo một cơ sở dữ liệu mới trong PostgreSQL.
-    Nếu cơ sở dữ liệu có tên `dbname` đã tồn tại thì không tạo mới.
+    Thêm 1 dòng vào bảng cha của backend phân vùng khai báo, PostgreSQL tự chọn range_partN.
     """
+    con = openconnection
+    cur = con.cursor()
+    try:
+        cur.execute(
+            f"INSERT INTO {rangeparentname(ratingstablename)} (userid, movieid, rating) VALUES (%s, %s, %s)",
+            (userid, itemid, rating)
+        )
+        con.commit()
+    except Exception as e:
+        con.rollback()
+        raise e
+    finally:
+        cur.close()
 
-    # Kết nối tới cơ sở dữ liệu mặc định là 'postgres'
-    con = getopenconnection(dbname='postgres')
-
-    # Thiết lập chế độ AUTOCOMMIT vì lệnh CREATE DATABASE không thể nằm trong transaction
-    con.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
 
-    # Tạo cursor để thực hiện truy vấn SQL
+@measure_time
+def roundrobininsertnative(ratingstablename: str, userid: int, itemid: int, rating: float, openconnection):
+    """
+    Thêm 1 dòng vào bảng cha round robin của backend phân vùng khai báo.
+    Slot được cấp qua allocate_rrobin_slots như roundrobininsert nên hai hàm dùng xen kẽ được
+    và con trỏ trong rrobin_metadata luôn đúng; PostgreSQL định tuyến dòng theo slot ghi tường minh.
+    """
+    con = openconnection
     cur = con.cursor()
 
-    # Kiểm tra xem cơ sở dữ liệu tên dbname đã tồn tại chưa
-    cur.execute(
-        'SELECT COUNT(*) FROM pg_catalog.pg_database WHERE datname=\'%s\'' % (dbname,)
-    )
-    count = cur.fetchone()[0]
+    # Ở chế độ autocommit cần mở giao dịch tường minh để cấp slot và INSERT cùng commit
+    explicit = con.autocommit
+    try:
+        if explicit:
+            cur.execute("BEGIN;")
 
-    if count == 0:
-        # Nếu chưa tồn tại thì tạo mới cơ sở dữ liệu
-        cur.execute('CREATE DATABASE %s' % (dbname,))
-    else:
-        # Nếu đã tồn tại thì in thông báo
-        print('A database named {0} already exists'.format(dbname))
+        partition_count, partition_index = allocate_rrobin_slots(con, ratingstablename)
+        cur.execute(
+            f"INSERT INTO {rrobinparentname(ratingstablename)} (userid, movieid, rating, rrobin_slot) VALUES (%s, %s, %s, %s)",
+            (userid, itemid, rating, partition_index)
+        )
+        _indexrows(cur, 'roundrobin', [userid], [itemid], [partition_index])
+        _bloomrows(cur, 'roundrobin', [userid], [itemid], [partition_index])
 
-    # Đóng cursor và kết nối
+        if explicit:
+            cur.execute("COMMIT;")
+        else:
+            con.commit()
+    except Exception as e:
+        if explicit and not con.closed:
+            cur.execute("ROLLBACK;")
+        con.rollback()
+        raise e
+    finally:
+        cur.close()
+
+
+@measure_time
+def hashpartition(ratingstablename, numberofpartitions, openconnection):
+    """
+    Phân mảnh bảng ratings theo hàm băm của userid (hash_partN): mọi rating của một người dùng
+    nằm trong đúng một phân mảnh nên truy vấn / phép nối theo userid chỉ chạm một phân mảnh.
+    Bảng được đọc đúng một lần qua một bảng cha PARTITION BY LIST tạm thời có khóa là biểu thức băm
+    (hash_expression), PostgreSQL định tuyến từng dòng; không cần cột phụ trong các phân mảnh.
+    """
+    if not isinstance(numberofpartitions, int) or numberofpartitions <= 0:
+        return
+
+    con = openconnection
+    cur = con.cursor()
+
+    try:
+        init_hash_metadata_table(con)
+        connectionpool.configure_session(cur.connection)  # synchronous_commit, work_mem, maintenance_work_mem
+
+        _routedbuild(
+            cur, f"{ratingstablename}_hash_router",
+            "userid INTEGER, movieid INTEGER, rating FLOAT",
+            f"LIST (({hash_expression('userid', numberofpartitions)}))",
+            [(f"{HASH_TABLE_PREFIX}{i}", f"FOR VALUES IN ({i})") for i in range(numberofpartitions)],
+            f"SELECT userid, movieid, rating FROM {ratingstablename}"
+        )
+
+        update_hash_metadata(con, ratingstablename, numberofpartitions)
+        con.commit()
+
+    except Exception as e:
+        con.rollback()
+        raise e
+
+    finally:
+        cur.close()
+
+
+@measure_time
+def hashinsert(ratingstablename: str, userid: int, itemid: int, rating: float, openconnection):
+    """
+    Hàm để thêm 1 dòng mới vào phân mảnh hash tương ứng với userid
+    """
+    con = openconnection
+    cur = con.cursor()
+    try:
+        # Lấy tổng số phân mảnh hash từ bảng metadata
+        partition_count = get_hash_metadata(con, ratingstablename)
+
+        # Tên bảng phân mảnh hash tương ứng
+        table_name = f"{HASH_TABLE_PREFIX}{hash_partition_index(userid, partition_count)}"
+
+        # Thêm dòng mới vào phân mảnh hash tương ứng
+        cur.execute(f"INSERT INTO {table_name} (userid, movieid, rating) VALUES (%s, %s, %s)", (userid, itemid, rating))
+
+        # Commit các thay đổi
+        con.commit()
+    except Exception as e:
+        # Rollback các thay đổi nếu có lỗi
+        con.rollback()
+        raise e
+    finally:
+        # Đóng cursor
+        cur.close()
+
+
+def _tocolumns(rows):
+    """
+    Chuẩn hóa một lô dữ liệu về ba mảng NumPy (userid int32, movieid int32, rating float64).
+    Chấp nhận: DataFrame Polars / dict có các cột userid, movieid, rating,
+    bộ ba mảng NumPy/Series (userid, movieid, rating), hoặc iterable các tuple (userid, movieid, rating).
+    """
+    if isinstance(rows, pl.DataFrame) or isinstance(rows, dict):
+        userid, movieid, rating = rows['userid'], rows['movieid'], rows['rating']
+    elif isinstance(rows, tuple) and len(rows) == 3 and all(isinstance(c, (np.ndarray, pl.Series)) for c in rows):
+        userid, movieid, rating = rows
+    else:
+        data = np.array(list(rows), dtype=np.float64).reshape(-1, 3)
+        userid, movieid, rating = data[:, 0], data[:, 1], data[:, 2]
+    return (np.asarray(userid, dtype=np.int32), np.asarray(movieid, dtype=np.int32),
+            np.asarray(rating, dtype=np.float64))
+
+
+def rangeinsert_indexes(rating, partition_count, boundaries=None):
+    """
+    Phiên bản vector hóa của cách rangeinsert chọn phân mảnh, cho kết quả giống hệt từng lần gọi đơn lẻ.
+    """
+    rating = np.asarray(rating, dtype=np.float64)
+    if boundaries is not None:
+        indexes = np.searchsorted(np.asarray(boundaries[1:], dtype=np.float64), rating, side='left')
+        return np.minimum(indexes, len(boundaries) - 2)
+    delta = 5.0 / partition_count
+    indexes = (rating / delta).astype(np.int64)
+    indexes -= (np.mod(rating, delta) == 0) & (indexes != 0)
+    return indexes
+
+
+@measure_time
+def rangeinsert_many(ratingstablename: str, rows, openconnection):
+    """
+    Thêm một lô dòng vào các phân mảnh range: đọc metadata một lần, tính phân mảnh cho cả lô
+    theo kiểu vector, mỗi phân mảnh nhận dữ liệu bằng một lệnh COPY và chỉ commit một lần.
+    """
+    con = openconnection
+    cur = con.cursor()
+    # Ở chế độ autocommit cần mở giao dịch tường minh để cả lô (và lần thử lại) là một giao dịch
+    explicit = False
+    try:
+        userid, movieid, rating = _tocolumns(rows)
+        if len(userid) == 0:
+            return
+
+        explicit = con.autocommit
+        # Lần thử thứ hai đọc lại metadata từ database (xem STALE_PARTITION_ERRORS)
+        for attempt in range(2):
+            partition_count = get_range_metadata(con, ratingstablename, usecache=attempt == 0)
+            boundaries = get_range_boundaries(con, ratingstablename, usecache=attempt == 0)
+            indexes = rangeinsert_indexes(rating, partition_count, boundaries)
+
+            if explicit:
+                cur.execute("BEGIN;")
+            try:
+                for index in np.unique(indexes):
+                    mask = indexes == index
+                    _copypartition(cur, f"{RANGE_TABLE_PREFIX}{index}", userid[mask], movieid[mask], rating[mask])
+            except STALE_PARTITION_ERRORS:
+                if attempt:
+                    raise
+                if explicit:
+                    cur.execute("ROLLBACK;")
+                con.rollback()
+                continue
+            _indexrows(cur, 'range', userid, movieid, indexes)
+            _bloomrows(cur, 'range', userid, movieid, indexes)
+
+            if explicit:
+                cur.execute("COMMIT;")
+            else:
+                con.commit()
+            break
+    except Exception as e:
+        if explicit and not con.closed:
+            cur.execute("ROLLBACK;")
+        con.rollback()
+        raise e
+    finally:
+        cur.close()
+
+
+@measure_time
+def roundrobininsert_many(ratingstablename: str, rows, openconnection):
+    """
+    Thêm một lô dòng theo round robin: dòng thứ j của lô vào phân mảnh (last_partition_index + 1 + j) % partition_count,
+    đúng như gọi roundrobininsert lần lượt. Các slot của cả lô được cấp bằng một câu UPDATE ... RETURNING.
+    """
+    con = openconnection
+    cur = con.cursor()
+    explicit = False
+    try:
+        userid, movieid, rating = _tocolumns(rows)
+        if len(userid) == 0:
+            return
+
+        explicit = con.autocommit
+        if explicit:
+            cur.execute("BEGIN;")
+
+        # Cấp một lần đủ slot cho cả lô, con trỏ round robin tiến đúng bằng kích thước lô
+        partition_count, first_index = allocate_rrobin_slots(con, ratingstablename, len(userid))
+        indexes = (first_index + np.arange(len(userid))) % partition_count
+
+        for index in np.unique(indexes):
+            mask = indexes == index
+            _copypartition(cur, f"{RROBIN_TABLE_PREFIX}{index}", userid[mask], movieid[mask], rating[mask])
+        _indexrows(cur, 'roundrobin', userid, movieid, indexes)
+        _bloomrows(cur, 'roundrobin', userid, movieid, indexes)
+
+        if explicit:
+            cur.execute("COMMIT;")
+        else:
+            con.commit()
+    except Exception as e:
+        if explicit and not con.closed:
+            cur.execute("ROLLBACK;")
+        con.rollback()
+        raise e
+    finally:
+        cur.close()
+
+
+# Bảng chỉ mục phụ toàn cục (userid, movieid) -> phân mảnh cho từng kiểu phân mảnh
+PARTITION_INDEX_TABLES = {'range': 'range_lookup', 'roundrobin': 'rrobin_lookup'}
+# Bộ nhớ đệm: (máy chủ, cổng, database, scheme) -> chỉ mục phụ có tồn tại hay không
+_PARTITION_INDEX_ENABLED = {}
+
+
+def _partitionprefix(scheme):
+    if scheme not in PARTITION_INDEX_TABLES:
+        raise ValueError(f"Unknown partitioning scheme: {scheme}")
+    return RANGE_TABLE_PREFIX if scheme == 'range' else RROBIN_TABLE_PREFIX
+
+
+def build_partition_index(scheme, numberofpartitions, openconnection):
+    """
+    Xây (lại) chỉ mục phụ toàn cục cho các phân mảnh của `scheme` ('range' hoặc 'roundrobin'):
+    bảng range_lookup / rrobin_lookup ánh xạ (userid, movieid) -> partition_id, có btree trên (userid, movieid).
+    Sau khi xây, rangeinsert / roundrobininsert (và bản _many) tự ghi thêm vào chỉ mục.
+    """
+    prefix = _partitionprefix(scheme)
+    table = PARTITION_INDEX_TABLES[scheme]
+    con = openconnection
+    cur = con.cursor()
+    try:
+        connectionpool.configure_session(cur.connection)  # synchronous_commit, work_mem, maintenance_work_mem
+        cur.execute(f"DROP TABLE IF EXISTS {table};")
+        cur.execute(f"""
+            CREATE TABLE {table} (
+                userid INTEGER,
+                movieid INTEGER,
+                partition_id SMALLINT
+            ) WITH (fillfactor=100);
+        """)
+        if numberofpartitions > 0:
+            cur.execute(f"INSERT INTO {table} (userid, movieid, partition_id) " + " UNION ALL ".join(
+                f"SELECT userid, movieid, {i} FROM {prefix}{i}" for i in range(numberofpartitions)
+            ))
+        # Tạo btree sau khi nạp dữ liệu (nhanh hơn cập nhật chỉ mục từng dòng); INCLUDE cho phép index-only scan
+        cur.execute(f"CREATE INDEX {table}_userid_movieid_idx ON {table} (userid, movieid) INCLUDE (partition_id);")
+        cur.execute(f"ANALYZE {table};")
+        con.commit()
+        _PARTITION_INDEX_ENABLED[_connectionkey(con) + (scheme,)] = True
+    except Exception as e:
+        con.rollback()
+        raise e
+    finally:
+        cur.close()
+
+
+def drop_partition_index(scheme, openconnection):
+    """Xóa chỉ mục phụ toàn cục của `scheme`, các hàm insert ngừng cập nhật nó."""
+    _partitionprefix(scheme)
+    cur = openconnection.cursor()
+    cur.execute(f"DROP TABLE IF EXISTS {PARTITION_INDEX_TABLES[scheme]};")
+    cur.close()
+    openconnection.commit()
+    _PARTITION_INDEX_ENABLED[_connectionkey(openconnection) + (scheme,)] = False
+
+
+def partition_index_enabled(openconnection, scheme):
+    """Kiểm tra (có bộ nhớ đệm trong tiến trình) xem `scheme` có chỉ mục phụ toàn cục hay không."""
+    key = _connectionkey(openconnection) + (scheme,)
+    if key not in _PARTITION_INDEX_ENABLED:
+        cur = openconnection.cursor()
+        cur.execute("SELECT to_regclass(%s) IS NOT NULL", (PARTITION_INDEX_TABLES[scheme],))
+        _PARTITION_INDEX_ENABLED[key] = cur.fetchone()[0]
+        cur.close()
+    return _PARTITION_INDEX_ENABLED[key]
+
+
+def _indexrows(cur, scheme, userid, movieid, partition_ids):
+    # Ghi các cặp (userid, movieid) mới vào chỉ mục phụ (nếu có) trong cùng giao dịch với INSERT dữ liệu
+    if not partition_index_enabled(cur.connection, scheme):
+        return
+    psycopg2.extras.execute_values(
+        cur,
+        f"INSERT INTO {PARTITION_INDEX_TABLES[scheme]} (userid, movieid, partition_id) VALUES %s",
+        [(int(u), int(m), int(p)) for u, m, p in zip(userid, movieid, partition_ids)],
+        page_size=10000
+    )
+
+
+# Bloom filter theo phân mảnh: mảng bit lưu trong BLOOM_METADATA_TABLE, các dòng chèn sau khi xây
+# được ghi vào nhật ký BLOOM_DELTA_TABLE (ghi lại cả mảng bit cho mỗi lần insert thì quá đắt)
+BLOOM_METADATA_TABLE = 'bloom_metadata'
+BLOOM_DELTA_TABLE = 'bloom_delta'
+# Dự trù thêm chỗ cho các dòng sẽ được chèn sau khi xây, để tỉ lệ dương tính giả không tăng quá nhanh
+BLOOM_CAPACITY_HEADROOM = 1.25
+# Khi nhật ký delta vượt ngưỡng này, lookupratings gộp nó vào mảng bit (trên một kết nối riêng từ pool)
+BLOOM_DELTA_COMPACT_ROWS = 100000
+BLOOM_KEYTYPES = ('userid', 'pair')
+# Bộ nhớ đệm: (máy chủ, cổng, database, scheme) -> (generation, {(partition_id, keytype): BloomFilter}), None nếu không có
+_BLOOM_CACHE = {}
+
+
+def init_bloom_tables(openconnection):
+    cur = openconnection.cursor()
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS {BLOOM_METADATA_TABLE} (
+            scheme VARCHAR(16) NOT NULL,        -- 'range' hoặc 'roundrobin'
+            partition_id INTEGER NOT NULL,
+            keytype VARCHAR(16) NOT NULL,       -- 'userid' hoặc 'pair' (userid, movieid)
+            nbits BIGINT NOT NULL,
+            nhashes INTEGER NOT NULL,
+            items BIGINT NOT NULL,
+            generation BIGINT NOT NULL,         -- Tăng mỗi lần mảng bit được ghi lại
+            bits BYTEA NOT NULL,
+            PRIMARY KEY (scheme, partition_id, keytype)
+        );
+    """)
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS {BLOOM_DELTA_TABLE} (
+            scheme VARCHAR(16) NOT NULL,
+            partition_id INTEGER NOT NULL,
+            userid INTEGER NOT NULL,
+            movieid INTEGER NOT NULL
+        );
+    """)
+    cur.close()
+
+
+def _readpartitionkeys(cur, tablename):
+    # Đọc (userid, movieid) của một phân mảnh bằng COPY nhị phân, giải mã thành mảng NumPy
+    buffer = io.BytesIO()
+    cur.copy_expert(f"COPY (SELECT userid, movieid FROM {tablename}) TO STDOUT (FORMAT BINARY)", buffer)
+    rows = pgcopy.decode_rows(buffer.getbuffer(), pgcopy.USERMOVIE_ROW_DTYPE)
+    return rows['userid'].astype(np.int32), rows['movieid'].astype(np.int32)
+
+
+def _partitionblooms(partition_id, userid, movieid, fpr):
+    """
+    Bloom filter theo userid và theo (userid, movieid) cho các khóa của một phân mảnh.
+    Bộ lọc userid được định cỡ theo số userid khác nhau (một người dùng có nhiều dòng),
+    bộ lọc cặp theo số dòng; cả hai đều dự trù thêm BLOOM_CAPACITY_HEADROOM.
+    """
+    users = np.unique(userid)
+    byuser = bloomfilter.BloomFilter.forcapacity(int(len(users) * BLOOM_CAPACITY_HEADROOM), fpr)
+    byuser.add(bloomfilter.userkeys(users))
+    bypair = bloomfilter.BloomFilter.forcapacity(int(len(userid) * BLOOM_CAPACITY_HEADROOM), fpr)
+    bypair.add(bloomfilter.pairkeys(userid, movieid))
+    return {(partition_id, 'userid'): byuser, (partition_id, 'pair'): bypair}
+
+
+def _writeblooms(cur, scheme, filters, generation):
+    psycopg2.extras.execute_values(
+        cur,
+        f"""INSERT INTO {BLOOM_METADATA_TABLE} (scheme, partition_id, keytype, nbits, nhashes, items, generation, bits)
+            VALUES %s
+            ON CONFLICT (scheme, partition_id, keytype) DO UPDATE SET
+                nbits = EXCLUDED.nbits, nhashes = EXCLUDED.nhashes, items = EXCLUDED.items,
+                generation = EXCLUDED.generation, bits = EXCLUDED.bits""",
+        [(scheme, partition_id, keytype, f.nbits, f.nhashes, f.items, generation, psycopg2.Binary(f.tobytes()))
+         for (partition_id, keytype), f in filters.items()],
+        page_size=100
+    )
+
+
+def build_partition_blooms(scheme, numberofpartitions, openconnection, fpr=0.01):
+    """
+    Xây (lại) Bloom filter theo userid và theo (userid, movieid) cho từng phân mảnh của `scheme`.
+    Sau khi xây, các hàm insert ghi khóa mới vào nhật ký bloom_delta và lookupratings dùng
+    các bộ lọc để bỏ qua phân mảnh chắc chắn không chứa khóa cần tìm.
+    """
+    prefix = _partitionprefix(scheme)
+    con = openconnection
+    cur = con.cursor()
+    try:
+        init_bloom_tables(con)
+        cur.execute(f"SELECT COALESCE(max(generation), 0) + 1 FROM {BLOOM_METADATA_TABLE} WHERE scheme = %s", (scheme,))
+        generation = cur.fetchone()[0]
+        cur.execute(f"DELETE FROM {BLOOM_METADATA_TABLE} WHERE scheme = %s", (scheme,))
+        cur.execute(f"DELETE FROM {BLOOM_DELTA_TABLE} WHERE scheme = %s", (scheme,))
+
+        filters = {}
+        for i in range(numberofpartitions):
+            userid, movieid = _readpartitionkeys(cur, f"{prefix}{i}")
+            filters.update(_partitionblooms(i, userid, movieid, fpr))
+        if filters:
+            _writeblooms(cur, scheme, filters, generation)
+        con.commit()
+        _BLOOM_CACHE[_connectionkey(con) + (scheme,)] = (generation, filters)
+    except Exception as e:
+        con.rollback()
+        raise e
+    finally:
+        cur.close()
+
+
+def drop_partition_blooms(scheme, openconnection):
+    """Xóa Bloom filter của `scheme`, các hàm insert ngừng ghi nhật ký bloom_delta."""
+    _partitionprefix(scheme)
+    cur = openconnection.cursor()
+    cur.execute("SELECT to_regclass(%s) IS NOT NULL", (BLOOM_METADATA_TABLE,))
+    if cur.fetchone()[0]:
+        cur.execute(f"DELETE FROM {BLOOM_METADATA_TABLE} WHERE scheme = %s", (scheme,))
+        cur.execute(f"DELETE FROM {BLOOM_DELTA_TABLE} WHERE scheme = %s", (scheme,))
+    cur.close()
+    openconnection.commit()
+    _BLOOM_CACHE[_connectionkey(openconnection) + (scheme,)] = None
+
+
+def partition_blooms_enabled(openconnection, scheme):
+    """Kiểm tra (có bộ nhớ đệm trong tiến trình) xem `scheme` có Bloom filter hay không."""
+    key = _connectionkey(openconnection) + (scheme,)
+    if key not in _BLOOM_CACHE:
+        cur = openconnection.cursor()
+        cur.execute("SELECT to_regclass(%s) IS NOT NULL", (BLOOM_METADATA_TABLE,))
+        exists = cur.fetchone()[0]
+        if exists:
+            cur.execute(f"SELECT EXISTS (SELECT 1 FROM {BLOOM_METADATA_TABLE} WHERE scheme = %s)", (scheme,))
+            exists = cur.fetchone()[0]
+        cur.close()
+        # Chỉ đánh dấu là có, mảng bit được nạp khi lookupratings cần đến
+        _BLOOM_CACHE[key] = (None, {}) if exists else None
+    return _BLOOM_CACHE[key] is not None
+
+
+def _bloomrows(cur, scheme, userid, movieid, partition_ids):
+    # Ghi khóa mới vào nhật ký bloom_delta (nếu có Bloom filter) trong cùng giao dịch với INSERT dữ liệu
+    if not partition_blooms_enabled(cur.connection, scheme):
+        return
+    psycopg2.extras.execute_values(
+        cur,
+        f"INSERT INTO {BLOOM_DELTA_TABLE} (scheme, partition_id, userid, movieid) VALUES %s",
+        [(scheme, int(p), int(u), int(m)) for u, m, p in zip(userid, movieid, partition_ids)],
+        page_size=10000
+    )
+
+
+def _addbloomkeys(filters, partition_ids, userid, movieid, count):
+    for i in np.unique(partition_ids):
+        mask = partition_ids == i
+        if (int(i), 'userid') in filters:
+            filters[(int(i), 'userid')].add(bloomfilter.userkeys(userid[mask]), count)
+            filters[(int(i), 'pair')].add(bloomfilter.pairkeys(userid[mask], movieid[mask]), count)
+
+
+def compact_partition_blooms(scheme, openconnection, nowait=False):
+    """
+    Gộp nhật ký bloom_delta vào mảng bit đã lưu của `scheme` (thao tác bảo trì: commit trên openconnection).
+    Khóa bảng delta trong lúc gộp để không mất dòng của giao dịch insert đang chạy;
+    với nowait=True thì báo lỗi LockNotAvailable ngay thay vì chờ khóa.
+    """
+    con = openconnection
+    cur = con.cursor()
+    explicit = con.autocommit
+    try:
+        if explicit:
+            cur.execute("BEGIN;")
+        cur.execute(f"LOCK TABLE {BLOOM_DELTA_TABLE} IN EXCLUSIVE MODE{' NOWAIT' if nowait else ''};")
+        # Nạp lại mảng bit từ CSDL để số phần tử của các dòng delta chỉ được đếm một lần
+        _BLOOM_CACHE.pop(_connectionkey(con) + (scheme,), None)
+        _, filters = _loadblooms(con, scheme, countdelta=True)
+        cur.execute(f"SELECT COALESCE(max(generation), 0) + 1 FROM {BLOOM_METADATA_TABLE} WHERE scheme = %s", (scheme,))
+        generation = cur.fetchone()[0]
+        _writeblooms(cur, scheme, filters, generation)
+        cur.execute(f"DELETE FROM {BLOOM_DELTA_TABLE} WHERE scheme = %s", (scheme,))
+        if explicit:
+            cur.execute("COMMIT;")
+        else:
+            con.commit()
+        _BLOOM_CACHE[_connectionkey(con) + (scheme,)] = (generation, filters)
+    except Exception as e:
+        if explicit and not con.closed:
+            cur.execute("ROLLBACK;")
+        con.rollback()
+        raise e
+    finally:
+        cur.close()
+
+
+def _loadblooms(openconnection, scheme, applydelta=True, countdelta=False):
+    """
+    Trả về (số dòng delta, {(partition_id, keytype): BloomFilter}) của `scheme`.
+    Mảng bit chỉ được nạp lại khi generation trong CSDL khác bản đệm; nhật ký delta luôn được đọc lại
+    và thêm vào bộ lọc (thêm lại một khóa không làm thay đổi bộ lọc) để không bao giờ trả lời sai "không có".
+    """
+    key = _connectionkey(openconnection) + (scheme,)
+    cur = openconnection.cursor()
+    try:
+        cur.execute(f"SELECT COALESCE(max(generation), 0) FROM {BLOOM_METADATA_TABLE} WHERE scheme = %s", (scheme,))
+        generation = cur.fetchone()[0]
+        cached = _BLOOM_CACHE.get(key)
+        if cached is None or cached[0] != generation:
+            cur.execute(
+                f"SELECT partition_id, keytype, nbits, nhashes, items, bits FROM {BLOOM_METADATA_TABLE} WHERE scheme = %s",
+                (scheme,)
+            )
+            filters = {(partition_id, keytype): bloomfilter.BloomFilter(nbits, nhashes, bits, items)
+                       for partition_id, keytype, nbits, nhashes, items, bits in cur.fetchall()}
+            _BLOOM_CACHE[key] = (generation, filters)
+        filters = _BLOOM_CACHE[key][1]
+
+        deltarows = 0
+        if applydelta:
+            buffer = io.BytesIO()
+            select = cur.mogrify(
+                f"SELECT userid, movieid, partition_id FROM {BLOOM_DELTA_TABLE} WHERE scheme = %s", (scheme,)
+            ).decode()
+            cur.copy_expert(f"COPY ({select}) TO STDOUT (FORMAT BINARY)", buffer)
+            rows = pgcopy.decode_rows(buffer.getbuffer(), pgcopy.USERMOVIEPART_ROW_DTYPE)
+            deltarows = len(rows)
+            if deltarows:
+                _addbloomkeys(filters, rows['partition_id'].astype(np.int64),
+                              rows['userid'].astype(np.int32), rows['movieid'].astype(np.int32), countdelta)
+        return deltarows, filters
+    finally:
+        cur.close()
+
+
+def _compactbloomsseparately(scheme, openconnection):
+    """
+    Gộp nhật ký delta trên một kết nối mượn từ pool (cùng tham số với openconnection) để đường tra cứu
+    không bao giờ commit hay rollback giao dịch của người gọi. Không chờ khóa: nếu bảng delta đang bị
+    giữ (kể cả bởi chính giao dịch của người gọi) thì bỏ qua, lần tra cứu sau sẽ thử lại.
+    """
+    with connectionpool.pooled_connection(connectionpool.connectionparameters(openconnection)) as conn:
+        try:
+            compact_partition_blooms(scheme, conn, nowait=True)
+        except psycopg2.errors.LockNotAvailable:
+            pass
+
+
+def bloomcandidates(scheme, userid, openconnection, movieid=None):
+    """Danh sách phân mảnh có thể chứa userid (hoặc cặp userid, movieid) theo Bloom filter."""
+    deltarows, filters = _loadblooms(openconnection, scheme)
+    if deltarows > BLOOM_DELTA_COMPACT_ROWS:
+        _compactbloomsseparately(scheme, openconnection)
+    if movieid is None:
+        keytype, keys = 'userid', bloomfilter.userkeys([userid])
+    else:
+        keytype, keys = 'pair', bloomfilter.pairkeys([userid], [movieid])
+    return sorted(i for (i, kind), f in filters.items() if kind == keytype and f.contains(keys)[0])
+
+
+def partition_bloom_stats(scheme, openconnection):
+    """Bộ nhớ và tỉ lệ dương tính giả ước tính của từng Bloom filter: danh sách dict."""
+    _, filters = _loadblooms(openconnection, scheme)
+    return [
+        {'partition_id': i, 'keytype': kind, 'items': f.items, 'nbits': f.nbits, 'nhashes': f.nhashes,
+         'nbytes': f.nbytes, 'estimatedfpr': f.estimatedfpr}
+        for (i, kind), f in sorted(filters.items())
+    ]
+
+
+def lookupratings(ratingstablename, scheme, userid, openconnection, movieid=None):
+    """
+    Trả về các dòng (userid, movieid, rating) của một người dùng (hoặc một cặp userid, movieid) trong các phân mảnh `scheme`.
+    Với scheme='hash' chỉ đọc đúng một phân mảnh (mọi dòng của một người dùng nằm chung một phân mảnh).
+    Nếu có chỉ mục phụ toàn cục thì chỉ đọc những phân mảnh chứa người dùng đó; nếu có Bloom filter thì
+    bỏ qua các phân mảnh chắc chắn không chứa; ngược lại đọc mọi phân mảnh.
+    """
+    if scheme == 'hash':
+        prefix = HASH_TABLE_PREFIX
+        partition_count = get_hash_metadata(openconnection, ratingstablename)
+    elif scheme == 'range':
+        prefix = _partitionprefix(scheme)
+        partition_count = get_range_metadata(openconnection, ratingstablename)
+    else:
+        prefix = _partitionprefix(scheme)
+        partition_count, _ = get_rrobin_metadata(openconnection, ratingstablename)
+
+    condition = "userid = %(userid)s" + (" AND movieid = %(movieid)s" if movieid is not None else "")
+    params = {'userid': userid, 'movieid': movieid}
+    cur = openconnection.cursor()
+    try:
+        if scheme == 'hash':
+            partitions = [hash_partition_index(userid, partition_count)] if partition_count else []
+        elif partition_index_enabled(openconnection, scheme):
+            cur.execute(f"SELECT DISTINCT partition_id FROM {PARTITION_INDEX_TABLES[scheme]} WHERE {condition}", params)
+            partitions = sorted(row[0] for row in cur.fetchall())
+        elif partition_blooms_enabled(openconnection, scheme):
+            partitions = bloomcandidates(scheme, userid, openconnection, movieid)
+        else:
+            partitions = list(range(partition_count))
+        if not partitions:
+            return []
+        cur.execute(" UNION ALL ".join(
+            f"SELECT userid, movieid, rating FROM {prefix}{i} WHERE {condition}" for i in partitions
+        ), params)
+        return cur.fetchall()
+    finally:
+        cur.close()
+
+
+# Ràng buộc CHECK gắn vào các phân mảnh range bị tách / gộp / đổi chỉ số để insert theo metadata cũ bị từ chối
+RANGE_CHECK_CONSTRAINT = 'range_bounds_check'
+
+
+def _requireplainpartitions(cur, parentname):
+    # Tách / gộp chỉ áp dụng cho các phân mảnh là bảng thường, không cho backend phân vùng khai báo
+    cur.execute("SELECT to_regclass(%s) IS NOT NULL", (parentname,))
+    if cur.fetchone()[0]:
+        raise ValueError(f"Partitions are attached to {parentname}; repartition with mode='native' instead")
+
+
+def _renamepartition(cur, old, new):
+    # Đổi tên phân mảnh cùng các chỉ mục mang tiền tố tên bảng (ví dụ của createpartitionindexes)
+    cur.execute("SELECT indexname FROM pg_indexes WHERE schemaname = current_schema() AND tablename = %s", (old,))
+    indexes = [row[0] for row in cur.fetchall()]
+    cur.execute(f"ALTER TABLE {old} RENAME TO {new};")
+    for index in indexes:
+        if index.startswith(old + '_'):
+            cur.execute(f"ALTER INDEX {index} RENAME TO {new}{index[len(old):]};")
+
+
+def _rangeconstraint(cur, index, boundaries):
+    # Gắn CHECK theo khoảng mới của phân mảnh `index` (NOT VALID: không quét lại dữ liệu đã có)
+    count = len(boundaries) - 1
+    conditions = []
+    if index > 0:
+        conditions.append(f"rating > {boundaries[index]!r}")
+    if index < count - 1:
+        conditions.append(f"rating <= {boundaries[index + 1]!r}")
+    table = f"{RANGE_TABLE_PREFIX}{index}"
+    cur.execute(f"ALTER TABLE {table} DROP CONSTRAINT IF EXISTS {RANGE_CHECK_CONSTRAINT};")
+    if conditions:
+        cur.execute(f"ALTER TABLE {table} ADD CONSTRAINT {RANGE_CHECK_CONSTRAINT} "
+                    f"CHECK ({' AND '.join(conditions)}) NOT VALID;")
+
+
+def _lockrangeboundaries(cur, ratingstablename):
+    # Khóa dòng metadata (các thao tác phân mảnh lại chạy tuần tự) và trả về mốc biên hiện tại
+    cur.execute(
+        f"SELECT partition_count, boundaries FROM {RANGE_METADATA_TABLE} WHERE tablename = %s FOR UPDATE",
+        (ratingstablename,)
+    )
+    row = cur.fetchone()
+    if row is None:
+        raise Exception(f"No range metadata for table {ratingstablename}")
+    partition_count, boundaries = row
+    if boundaries is None:
+        bounds = range_bounds(partition_count)
+        boundaries = [bounds[0][0]] + [maxR for _, maxR in bounds]
+    return [float(b) for b in boundaries]
+
+
+def _renumberpartitions(cur, scheme, dropped, shiftfrom, shiftby, rebuilt):
+    """
+    Đồng bộ chỉ mục phụ toàn cục và Bloom filter sau khi phân mảnh bị tách / gộp / chuyển dòng:
+    xóa mục của các phân mảnh `dropped` (chỉ số cũ), cộng `shiftby` vào các chỉ số >= `shiftfrom`,
+    rồi xây lại mục của các phân mảnh `rebuilt` (chỉ số mới) từ dữ liệu hiện tại của chúng.
+    Các phân mảnh khác không bị đọc lại.
+    """
+    con = cur.connection
+    prefix = _partitionprefix(scheme)
+    dropped = [int(i) for i in dropped]
+
+    if partition_index_enabled(con, scheme):
+        table = PARTITION_INDEX_TABLES[scheme]
+        cur.execute(f"DELETE FROM {table} WHERE partition_id = ANY(%s)", (dropped,))
+        if shiftby:
+            cur.execute(f"UPDATE {table} SET partition_id = partition_id + %s WHERE partition_id >= %s", (shiftby, shiftfrom))
+        for i in rebuilt:
+            cur.execute(f"INSERT INTO {table} (userid, movieid, partition_id) SELECT userid, movieid, {i} FROM {prefix}{i}")
+
+    if partition_blooms_enabled(con, scheme):
+        cur.execute(
+            f"SELECT COALESCE(max(generation), 0) + 1, COALESCE(max(nhashes), 0) FROM {BLOOM_METADATA_TABLE} WHERE scheme = %s",
+            (scheme,)
+        )
+        generation, nhashes = cur.fetchone()
+        # Bộ lọc xây với tỉ lệ dương tính giả p có khoảng log2(1/p) hàm băm
+        fpr = 0.5 ** nhashes if nhashes else 0.01
+        for table in (BLOOM_METADATA_TABLE, BLOOM_DELTA_TABLE):
+            cur.execute(f"DELETE FROM {table} WHERE scheme = %s AND partition_id = ANY(%s)", (scheme, dropped))
+        if shiftby:
+            # Đổi dấu qua hai bước để không vi phạm khóa chính (scheme, partition_id, keytype) giữa chừng
+            cur.execute(
+                f"UPDATE {BLOOM_METADATA_TABLE} SET partition_id = -(partition_id + %s) - 1, generation = %s "
+                f"WHERE scheme = %s AND partition_id >= %s", (shiftby, generation, scheme, shiftfrom)
+            )
+            cur.execute(f"UPDATE {BLOOM_METADATA_TABLE} SET partition_id = -partition_id - 1 "
+                        f"WHERE scheme = %s AND partition_id < 0", (scheme,))
+            cur.execute(f"UPDATE {BLOOM_DELTA_TABLE} SET partition_id = partition_id + %s "
+                        f"WHERE scheme = %s AND partition_id >= %s", (shiftby, scheme, shiftfrom))
+        filters = {}
+        for i in rebuilt:
+            userid, movieid = _readpartitionkeys(cur, f"{prefix}{i}")
+            filters.update(_partitionblooms(i, userid, movieid, fpr))
+        if filters:
+            _writeblooms(cur, scheme, filters, generation)
+        # Generation mới khiến mọi tiến trình (kể cả tiến trình này) nạp lại mảng bit ở lần tra cứu sau
+        _BLOOM_CACHE[_connectionkey(con) + (scheme,)] = (None, {})
+
+
+def _repartition(openconnection, operation):
+    # Chạy `operation(cur)` trong một giao dịch; ở chế độ autocommit mở giao dịch tường minh bằng BEGIN
+    con = openconnection
+    cur = con.cursor()
+    explicit = con.autocommit
+    try:
+        if explicit:
+            cur.execute("BEGIN;")
+        result = operation(cur)
+        if explicit:
+            cur.execute("COMMIT;")
+        else:
+            con.commit()
+        return result
+    except Exception as e:
+        if explicit and not con.closed:
+            cur.execute("ROLLBACK;")
+        con.rollback()
+        raise e
+    finally:
+        cur.close()
+
+
+@measure_time
+def splitrangepartition(ratingstablename, index, openconnection, at=None):
+    """
+    Tách phân mảnh range_part<index> có khoảng (lo, hi] thành (lo, at] và (at, hi] mà không đọc lại bảng ratings.
+    at mặc định là mốc chia đôi số dòng của phân mảnh (theo biểu đồ tần suất của nó).
+    Các phân mảnh phía sau được đổi tên lên một chỉ số; chỉ những dòng có rating > at được chuyển
+    sang range_part<index + 1> bằng DELETE ... RETURNING. Metadata, chỉ mục phụ và Bloom filter
+    được cập nhật trong cùng giao dịch. Insert đồng thời vào các phân mảnh bị động tới chờ tới khi commit;
+    insert theo metadata cũ bị ràng buộc CHECK từ chối và được rangeinsert tự thử lại.
+    """
+    def operation(cur):
+        _requireplainpartitions(cur, rangeparentname(ratingstablename))
+        boundaries = _lockrangeboundaries(cur, ratingstablename)
+        count = len(boundaries) - 1
+        if not 0 <= index < count:
+            raise ValueError(f"Partition index {index} out of range [0, {count})")
+        lo, hi = boundaries[index], boundaries[index + 1]
+        table = f"{RANGE_TABLE_PREFIX}{index}"
+
+        point = at
+        if point is None:
+            values, counts = rating_histogram(table, cur.connection)
+            point = equidepth_bounds(values, counts, 2, lo, hi)[1]
+        if not ((lo <= point if index == 0 else lo < point) and point < hi):
+            raise ValueError(f"Split point {point} is not inside partition {index} ({lo}, {hi}]")
+
+        # Dời các phân mảnh phía sau lên một chỉ số, từ cuối về để không trùng tên
+        for j in range(count - 1, index, -1):
+            _renamepartition(cur, f"{RANGE_TABLE_PREFIX}{j}", f"{RANGE_TABLE_PREFIX}{j + 1}")
+        newtable = f"{RANGE_TABLE_PREFIX}{index + 1}"
+        cur.execute(f"CREATE TABLE {newtable} (LIKE {table} INCLUDING ALL);")
+        cur.execute(f"""
+            WITH moved AS (
+                DELETE FROM {table} WHERE rating > %s RETURNING userid, movieid, rating
+            )
+            INSERT INTO {newtable} (userid, movieid, rating) SELECT userid, movieid, rating FROM moved
+        """, (point,))
+        moved = cur.rowcount
+
+        boundaries = boundaries[:index + 1] + [float(point)] + boundaries[index + 1:]
+        for j in range(index, count + 1):
+            _rangeconstraint(cur, j, boundaries)
+        _renumberpartitions(cur, 'range', [index], index + 1, 1, [index, index + 1])
+        update_range_metadata(cur.connection, ratingstablename, count + 1, boundaries)
+        return moved
+
+    return _repartition(openconnection, operation)
+
+
+@measure_time
+def mergerangepartitions(ratingstablename, index, openconnection):
+    """
+    Gộp hai phân mảnh liền kề range_part<index> và range_part<index + 1> thành range_part<index>.
+    Chỉ dòng của phân mảnh nhỏ hơn được chuyển; các phân mảnh phía sau được đổi tên xuống một chỉ số.
+    Metadata, chỉ mục phụ và Bloom filter được cập nhật trong cùng giao dịch như splitrangepartition.
+    """
+    def operation(cur):
+        _requireplainpartitions(cur, rangeparentname(ratingstablename))
+        boundaries = _lockrangeboundaries(cur, ratingstablename)
+        count = len(boundaries) - 1
+        if not 0 <= index < count - 1:
+            raise ValueError(f"Partition index {index} has no right neighbour to merge with")
+        left, right = f"{RANGE_TABLE_PREFIX}{index}", f"{RANGE_TABLE_PREFIX}{index + 1}"
+
+        # Chuyển phân mảnh nhỏ hơn (ước lượng từ thống kê) vào phân mảnh lớn hơn
+        cur.execute("SELECT relname, reltuples FROM pg_class WHERE oid IN (to_regclass(%s), to_regclass(%s))",
+                    (left, right))
+        sizes = dict(cur.fetchall())
+        source, target = (left, right) if sizes.get(left, 0) < sizes.get(right, 0) else (right, left)
+        cur.execute(f"INSERT INTO {target} (userid, movieid, rating) SELECT userid, movieid, rating FROM {source};")
+        moved = cur.rowcount
+        cur.execute(f"DROP TABLE {source};")
+        if target == right:
+            _renamepartition(cur, right, left)
+        for j in range(index + 2, count):
+            _renamepartition(cur, f"{RANGE_TABLE_PREFIX}{j}", f"{RANGE_TABLE_PREFIX}{j - 1}")
+
+        boundaries = boundaries[:index + 1] + boundaries[index + 2:]
+        for j in range(index, count - 1):
+            _rangeconstraint(cur, j, boundaries)
+        _renumberpartitions(cur, 'range', [index, index + 1], index + 2, -1, [index])
+        update_range_metadata(cur.connection, ratingstablename, count - 1, boundaries)
+        return moved
+
+    return _repartition(openconnection, operation)
+
+
+def _rebalanceplan(sizes, targets):
+    # Ghép các phân mảnh thừa dòng với các phân mảnh thiếu dòng: danh sách (nguồn, đích, số dòng)
+    surplus = [[i, size - target] for i, (size, target) in enumerate(zip(sizes, targets)) if size > target]
+    deficit = [[i, target - size] for i, (size, target) in enumerate(zip(sizes, targets)) if size < target]
+    plan = []
+    while surplus and deficit:
+        count = min(surplus[0][1], deficit[0][1])
+        plan.append((surplus[0][0], deficit[0][0], count))
+        surplus[0][1] -= count
+        deficit[0][1] -= count
+        if surplus[0][1] == 0:
+            surplus.pop(0)
+        if deficit[0][1] == 0:
+            deficit.pop(0)
+    return plan
+
+
+@measure_time
+def resizeroundrobin(ratingstablename, numberofpartitions, openconnection):
+    """
+    Đổi số phân mảnh round robin sang `numberofpartitions` mà chỉ chuyển số dòng tối thiểu:
+    kích thước đích giống hệt roundrobinpartition trên cùng số dòng (phân mảnh i < N % n có thêm một dòng),
+    mỗi phân mảnh thừa chuyển đúng phần dư sang phân mảnh thiếu bằng DELETE ... RETURNING.
+    Dòng rrobin_metadata bị khóa suốt giao dịch nên roundrobininsert đồng thời chờ rồi dùng số phân mảnh mới.
+    Trả về số dòng đã chuyển.
+    """
+    if numberofpartitions < 1:
+        raise ValueError("numberofpartitions must be at least 1")
+
+    def operation(cur):
+        _requireplainpartitions(cur, rrobinparentname(ratingstablename))
+        cur.execute(
+            f"SELECT partition_count FROM {RROBIN_METADATA_TABLE} WHERE tablename = %s FOR UPDATE",
+            (ratingstablename,)
+        )
+        row = cur.fetchone()
+        if row is None:
+            raise Exception(f"No round robin metadata for table {ratingstablename}")
+        current = row[0]
+        cur.execute(" UNION ALL ".join(
+            f"SELECT {i}, count(*) FROM {RROBIN_TABLE_PREFIX}{i}" for i in range(current)
+        ))
+        sizes = [0] * max(current, numberofpartitions)
+        for i, size in cur.fetchall():
+            sizes[i] = size
+        total = sum(sizes)
+        targets = [total // numberofpartitions + (1 if i < total % numberofpartitions else 0)
+                   if i < numberofpartitions else 0 for i in range(len(sizes))]
+
+        for i in range(current, numberofpartitions):
+            cur.execute(f"CREATE TABLE {RROBIN_TABLE_PREFIX}{i} (LIKE {RROBIN_TABLE_PREFIX}0 INCLUDING ALL);")
+        plan = _rebalanceplan(sizes, targets)
+        for source, target, count in plan:
+            cur.execute(f"""
+                WITH moved AS (
+                    DELETE FROM {RROBIN_TABLE_PREFIX}{source}
+                    WHERE ctid IN (SELECT ctid FROM {RROBIN_TABLE_PREFIX}{source} LIMIT %s)
+                    RETURNING userid, movieid, rating
+                )
+                INSERT INTO {RROBIN_TABLE_PREFIX}{target} (userid, movieid, rating)
+                SELECT userid, movieid, rating FROM moved
+            """, (count,))
+        for i in range(numberofpartitions, current):
+            cur.execute(f"DROP TABLE {RROBIN_TABLE_PREFIX}{i};")
+
+        # UPDATE (không xóa rồi thêm lại dòng) để các insert đang chờ khóa dòng này đọc được giá trị mới
+        last_partition_index = (total - 1) % numberofpartitions if total > 0 else -1
+        cur.execute(
+            f"UPDATE {RROBIN_METADATA_TABLE} SET partition_count = %s, last_partition_index = %s WHERE tablename = %s",
+            (numberofpartitions, last_partition_index, ratingstablename)
+        )
+        _notifymetadata(cur, RROBIN_METADATA_TABLE, ratingstablename)
+
+        touched = sorted({source for source, _, _ in plan} | {target for _, target, _ in plan})
+        _renumberpartitions(cur, 'roundrobin', touched + list(range(numberofpartitions, current)), 0, 0,
+                            [i for i in touched if i < numberofpartitions])
+        return sum(count for _, _, count in plan)
+
+    moved = _repartition(openconnection, operation)
+    _METADATA_CACHE.pop(_metadatakey(openconnection, RROBIN_METADATA_TABLE, ratingstablename), None)
+    return moved
+
+
+def rangepartitionsforinterval(ratingstablename, lo, hi, openconnection):
+    """
+    Trả về danh sách (chỉ số, minR, maxR) của các phân mảnh range giao với đoạn [lo, hi],
+    cùng quy tắc biên với rangepartition: phân mảnh 0 là [minR, maxR], các phân mảnh sau là (minR, maxR].
+    """
+    bounds = get_range_bounds(openconnection, ratingstablename)
+    if not bounds or lo > hi:
+        return []
+    return [
+        (i, minR, maxR)
+        for i, (minR, maxR) in enumerate(bounds)
+        if (hi >= minR if i == 0 else hi > minR) and lo <= maxR
+    ]
+
+
+def _putunlessstopped(results, item, stop):
+    # Đưa item vào hàng đợi, bỏ cuộc nếu người đọc đã dừng
+    while not stop.is_set():
+        try:
+            results.put(item, timeout=0.1)
+            return
+        except queue.Full:
+            pass
+
+
+def _rangequeryworker(connectionparams, table, lo, hi, results, stop):
+    # Đọc một phân mảnh bằng server-side cursor và đẩy từng lô dòng vào hàng đợi chung
+    try:
+        with connectionpool.pooled_connection(connectionparams) as conn:
+            cur = conn.cursor(name=f"rangequery_{table}")
+            cur.itersize = QUERY_FETCH_SIZE
+            cur.execute(
+                f"SELECT userid, movieid, rating FROM {table} WHERE rating >= %s AND rating <= %s",
+                (lo, hi)
+            )
+            while not stop.is_set():
+                rows = cur.fetchmany(QUERY_FETCH_SIZE)
+                if not rows:
+                    break
+                _putunlessstopped(results, rows, stop)
+            cur.close()
+        _putunlessstopped(results, None, stop)
+    except Exception as e:
+        _putunlessstopped(results, e, stop)
+
+
+def rangequery(ratingstablename, lo, hi, openconnection, workers=4):
+    """
+    Trả về (dạng generator) các dòng (userid, movieid, rating) có lo <= rating <= hi.
+    Dùng range_metadata để chỉ đọc các phân mảnh giao với [lo, hi]; các phân mảnh được đọc song song
+    trên các kết nối lấy từ pool và kết quả được trộn lại theo thứ tự về tới.
+    """
+    partitions = rangepartitionsforinterval(ratingstablename, lo, hi, openconnection)
+    if not partitions:
+        return
+    connectionparams = connectionpool.connectionparameters(openconnection)
+    results = queue.Queue(maxsize=workers * 4)
+    stop = threading.Event()
+    executor = ThreadPoolExecutor(max_workers=min(workers, len(partitions)))
+    try:
+        for i, _, _ in partitions:
+            executor.submit(_rangequeryworker, connectionparams, f"{RANGE_TABLE_PREFIX}{i}", lo, hi, results, stop)
+        remaining = len(partitions)
+        while remaining:
+            item = results.get()
+            if item is None:
+                remaining -= 1
+            elif isinstance(item, Exception):
+                raise item
+            else:
+                yield from item
+    finally:
+        # Dừng các luồng còn lại nếu người dùng ngừng đọc sớm hoặc có lỗi
+        stop.set()
+        executor.shutdown(wait=False)
+
+
+def rangepointquery(ratingstablename, rating, openconnection):
+    """
+    Trả về danh sách các dòng có đúng giá trị `rating`, chỉ đọc một phân mảnh duy nhất.
+    """
+    partitions = rangepartitionsforinterval(ratingstablename, rating, rating, openconnection)
+    if not partitions:
+        return []
+    cur = openconnection.cursor()
+    cur.execute(
+        f"SELECT userid, movieid, rating FROM {RANGE_TABLE_PREFIX}{partitions[0][0]} WHERE rating = %s",
+        (rating,)
+    )
+    rows = cur.fetchall()
     cur.close()
+    return rows
+
 
+def rangequerycount(ratingstablename, lo, hi, openconnection):
+    """
+    Đếm số dòng có lo <= rating <= hi trong một lượt truy vấn duy nhất.
+    Phân mảnh nằm trọn trong [lo, hi] được đếm không cần điều kiện lọc; các phân mảnh không giao bị bỏ qua.
+    """
+    partitions = rangepartitionsforinterval(ratingstablename, lo, hi, openconnection)
+    if not partitions:
+        return 0
+    counts = []
+    for i, minR, maxR in partitions:
+        table = f"{RANGE_TABLE_PREFIX}{i}"
+        if lo <= minR and hi >= maxR:
+            counts.append(f"(SELECT COUNT(*) FROM {table})")
+        else:
+            counts.append(f"(SELECT COUNT(*) FROM {table} WHERE rating >= %(lo)s AND rating <= %(hi)s)")
+    cur = openconnection.cursor()
+    cur.execute("SELECT " + " + ".join(counts), {'lo': lo, 'hi': hi})
+    count = int(cur.fetchone()[0])
+    cur.close()
+    return count
 
 
+@measure_time
+def create_db(dbname):
+    """
+    Tạo một cơ sở dữ liệu mới trong PostgreSQL.
+    Nếu cơ sở dữ liệu có tên `dbname` đã tồn tại thì không tạo mới.
+    Kết nối tới 'postgres' được lấy từ pool và trả lại sau khi dùng, kết quả kiểm tra được nhớ trong tiến trình.
+    """
+    connectionpool.create_db(dbname)
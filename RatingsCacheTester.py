@@ -0,0 +1,20 @@
+#
+# Tester for the parsed ratings cache (ratingscache), no PostgreSQL server needed
+#
+INPUT_FILE_PATH = 'ratings.dat'
+ACTUAL_ROWS_IN_INPUT_FILE = 10000054  # số dòng dữ liệu file ratings.dat, nếu là file test_data.dat thì là 20
+
+import traceback
+import testHelper
+import ratingscache
+
+if __name__ == '__main__':
+    try:
+        [result, e] = testHelper.testratingscache(ratingscache, INPUT_FILE_PATH, ACTUAL_ROWS_IN_INPUT_FILE)
+        if result :
+            print("ratingscache test pass!")
+        else:
+            print("ratingscache test fail!")
+
+    except Exception as detail:
+        traceback.print_exc()
@@ -0,0 +1,101 @@
+#
+# Lớp dịch vụ asyncio cho luồng insert: gom các lần insert đơn lẻ thành lô và commit theo nhóm
+#
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import connectionpool
+import Interface as MyAssignment
+
+# Số dòng tối đa mỗi lô và thời gian chờ tối đa (ms) trước khi ghi một lô chưa đầy
+DEFAULT_MAX_BATCH_SIZE = 500
+DEFAULT_LINGER_MS = 5.0
+
+
+class AsyncPartitionInserter:
+    """
+    Nhận các lần insert (userid, movieid, rating) dưới dạng awaitable, gom thành lô theo kích thước
+    (maxbatchsize) hoặc theo hạn chờ (lingerms), ghi cả lô vào range_partN / rrobin_partN bằng
+    rangeinsert_many / roundrobininsert_many trong một giao dịch, rồi mới hoàn tất các future.
+    Lô lớn hơn cho thông lượng cao hơn; lingerms nhỏ hơn cho độ trễ p99 thấp hơn.
+    Các lô được ghi trên kết nối mượn từ pool có cùng máy chủ, tài khoản và database với openconnection
+    (openconnection chỉ được dùng để lấy tham số kết nối).
+
+    Ví dụ:
+        async with AsyncPartitionInserter('ratings', 'range', conn) as inserter:
+            await inserter.insert(1, 122, 5.0)
+    """
+
+    def __init__(self, ratingstablename, scheme, openconnection,
+                 maxbatchsize=DEFAULT_MAX_BATCH_SIZE, lingerms=DEFAULT_LINGER_MS, workers=1):
+        if scheme not in ('range', 'roundrobin'):
+            raise ValueError(f"Unknown partitioning scheme: {scheme}")
+        self.ratingstablename = ratingstablename
+        self.connectionparams = connectionpool.connectionparameters(openconnection)
+        self.maxbatchsize = maxbatchsize
+        self.linger = lingerms / 1000.0
+        # Bỏ qua phần in thời gian của measure_time cho từng lô
+        insertmany = MyAssignment.rangeinsert_many if scheme == 'range' else MyAssignment.roundrobininsert_many
+        self.insertmany = getattr(insertmany, '__wrapped__', insertmany)
+        # workers=1 giữ thứ tự ghi giữa các lô (quan trọng với round robin)
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.pending = []
+        self.timer = None
+        self.inflight = set()
+
+    async def insert(self, userid, movieid, rating):
+        """Thêm một dòng, hoàn tất khi lô chứa dòng này đã được commit."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.pending.append(((userid, movieid, rating), future))
+        if len(self.pending) >= self.maxbatchsize:
+            self._flushpending()
+        elif self.timer is None:
+            self.timer = loop.call_later(self.linger, self._flushpending)
+        return await future
+
+    def _flushpending(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        if not self.pending:
+            return
+        batch, self.pending = self.pending, []
+        task = asyncio.ensure_future(self._writebatch(batch))
+        self.inflight.add(task)
+        task.add_done_callback(self.inflight.discard)
+
+    def _writesync(self, rows):
+        with connectionpool.pooled_connection(self.connectionparams) as conn:
+            self.insertmany(self.ratingstablename, rows, conn)
+
+    async def _writebatch(self, batch):
+        loop = asyncio.get_running_loop()
+        rows = [row for row, _ in batch]
+        try:
+            await loop.run_in_executor(self.executor, self._writesync, rows)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for _, future in batch:
+            if not future.done():
+                future.set_result(None)
+
+    async def flush(self):
+        """Ghi ngay các dòng đang chờ và đợi mọi lô đang ghi hoàn tất."""
+        self._flushpending()
+        if self.inflight:
+            await asyncio.gather(*self.inflight, return_exceptions=True)
+
+    async def close(self):
+        await self.flush()
+        self.executor.shutdown(wait=True)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
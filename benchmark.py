@@ -0,0 +1,404 @@
+#
+# Đo thời gian các phương án nạp dữ liệu ratings
+#
+# Cách chạy: python benchmark.py [đường dẫn file ratings]
+#
+import io
+import sys
+import time
+import asyncio
+import random
+import statistics
+
+import duckdb
+import polars as pl
+import psycopg2
+
+import testHelper
+import Interface as MyAssignment
+import asyncinsert
+import duckdbengine
+import partitionexport
+import ratingsparser
+import ratingscache
+import loadratingsupdate
+
+DATABASE_NAME = 'dds_assgn1'
+RATINGS_TABLE = 'ratings'
+INPUT_FILE_PATH = 'ratings.dat'
+
+
+def droptable(openconnection, tablename):
+    with openconnection.cursor() as cur:
+        cur.execute(f"DROP TABLE IF EXISTS {tablename}")
+    openconnection.commit()
+
+
+def benchmarkloaders(ratingsfilepath, modes=('polars', 'binary'), repeat=3):
+    """
+    So sánh thời gian loadratings giữa các mode (mặc định: COPY CSV qua Polars và COPY nhị phân).
+    Mỗi mode chạy `repeat` lần trên bảng trống, trả về dict mode -> danh sách thời gian (giây).
+    """
+    testHelper.createdb(DATABASE_NAME)
+    results = {}
+    with testHelper.getopenconnection(dbname=DATABASE_NAME) as conn:
+        conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        for mode in modes:
+            timings = []
+            for _ in range(repeat):
+                droptable(conn, RATINGS_TABLE)
+                start = time.perf_counter()
+                MyAssignment.loadratings(RATINGS_TABLE, ratingsfilepath, conn, mode=mode)
+                timings.append(time.perf_counter() - start)
+            results[mode] = timings
+        droptable(conn, RATINGS_TABLE)
+    conn.close()
+    return results
+
+
+def _parsepython(ratingsfilepath):
+    # Vòng lặp split('::') thuần Python như loadratingsnouselib
+    userid, movieid, rating = [], [], []
+    with open(ratingsfilepath, 'r', encoding='utf-8', buffering=65536) as f:
+        for line in f:
+            parts = line.strip().split("::")
+            if len(parts) >= 4:
+                userid.append(int(parts[0]))
+                movieid.append(int(parts[1]))
+                rating.append(float(parts[2]))
+    return userid, movieid, rating
+
+
+def _parsepolars(ratingsfilepath):
+    # Đọc từng dòng thành chuỗi rồi str.split("::") như loadratingusepolar
+    lines = pl.read_csv(ratingsfilepath, separator="\n", has_header=False, new_columns=["line"])
+    df = lines.select(pl.col("line").str.split("::").alias("fields")).select([
+        pl.col("fields").list.get(0).cast(pl.Int32).alias("userid"),
+        pl.col("fields").list.get(1).cast(pl.Int32).alias("movieid"),
+        pl.col("fields").list.get(2).cast(pl.Float32).alias("rating"),
+    ])
+    return df['userid'], df['movieid'], df['rating']
+
+
+def _parseduckdb(ratingsfilepath):
+    # read_csv với delim '::' như loadratingsuseduckdb (kết quả lấy về dạng mảng NumPy thay vì file CSV tạm)
+    con = duckdb.connect()
+    try:
+        return con.execute(f"""
+            SELECT column0::INTEGER AS userid, column1::INTEGER AS movieid, column2::FLOAT AS rating
+            FROM read_csv('{ratingsfilepath}', delim='::', header=False,
+                columns={{'column0': 'VARCHAR', 'column1': 'VARCHAR', 'column2': 'VARCHAR', 'column3': 'VARCHAR'}})
+        """).fetchnumpy()
+    finally:
+        con.close()
+
+
+def benchmarkparsers(ratingsfilepath, repeat=3):
+    """
+    So sánh riêng bước phân tích file (không có PostgreSQL) của ba phương án trong loadratingsupdate
+    với ratingsparser (mmap + quét byte vector hóa) và ratingscache. In số dòng/giây, trả về dict tên -> [thời gian].
+    """
+    parsers = {
+        'mmap': lambda: ratingsparser.parse_ratings(ratingsfilepath),
+        # Lần chạy đầu phân tích và ghi cache, các lần sau chỉ mmap file .npy
+        'cache': lambda: ratingscache.load_ratings_cache(ratingsfilepath),
+        'python': lambda: _parsepython(ratingsfilepath),
+        'polars': lambda: _parsepolars(ratingsfilepath),
+        'duckdb': lambda: _parseduckdb(ratingsfilepath),
+    }
+    rows = len(ratingsparser.parse_ratings(ratingsfilepath)[0])
+    results = {}
+    for name, parse in parsers.items():
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            parse()
+            timings.append(time.perf_counter() - start)
+        results[name] = timings
+        print(f"{name:<12} {rows / statistics.median(timings):,.0f} dòng/giây")
+    return results
+
+
+def benchmarkloadervariants(ratingsfilepath, repeat=3):
+    """
+    So sánh toàn bộ thời gian nạp của ba phương án trong loadratingsupdate với loadratings(mode='binary')
+    (phân tích bằng ratingsparser rồi COPY nhị phân). Trả về dict tên -> [thời gian].
+    """
+    loaders = {
+        'binary': lambda conn: MyAssignment.loadratings(RATINGS_TABLE, ratingsfilepath, conn, mode='binary'),
+        'nouselib': lambda conn: loadratingsupdate.loadratingsnouselib(RATINGS_TABLE, ratingsfilepath, conn),
+        'polars': lambda conn: loadratingsupdate.loadratingusepolar(RATINGS_TABLE, ratingsfilepath, conn),
+        'duckdb': lambda conn: loadratingsupdate.loadratingsuseduckdb(RATINGS_TABLE, ratingsfilepath, conn),
+    }
+    testHelper.createdb(DATABASE_NAME)
+    results = {}
+    with testHelper.getopenconnection(dbname=DATABASE_NAME) as conn:
+        conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        for name, load in loaders.items():
+            timings = []
+            for _ in range(repeat):
+                droptable(conn, RATINGS_TABLE)
+                start = time.perf_counter()
+                load(conn)
+                timings.append(time.perf_counter() - start)
+            results[name] = timings
+        droptable(conn, RATINGS_TABLE)
+    conn.close()
+    return results
+
+
+def droppartitions(openconnection, prefix):
+    with openconnection.cursor() as cur:
+        cur.execute("SELECT table_name FROM information_schema.tables "
+                    "WHERE table_schema = current_schema() AND table_name LIKE %s", (prefix + '%',))
+        for (table,) in cur.fetchall():
+            cur.execute(f"DROP TABLE IF EXISTS {table} CASCADE")
+    openconnection.commit()
+
+
+def benchmarkrangepartition(ratingsfilepath, modes=('ctas', 'singlescan'), partitioncounts=(5, 20, 50, 100)):
+    """
+    So sánh thời gian rangepartition giữa các mode khi số phân mảnh tăng dần.
+    Trả về dict "mode/n" -> [thời gian].
+    """
+    testHelper.createdb(DATABASE_NAME)
+    results = {}
+    with testHelper.getopenconnection(dbname=DATABASE_NAME) as conn:
+        conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        droptable(conn, RATINGS_TABLE)
+        MyAssignment.loadratings(RATINGS_TABLE, ratingsfilepath, conn)
+        for n in partitioncounts:
+            for mode in modes:
+                droppartitions(conn, MyAssignment.RANGE_TABLE_PREFIX)
+                start = time.perf_counter()
+                MyAssignment.rangepartition(RATINGS_TABLE, n, conn, mode=mode)
+                results[f"{mode}/{n}"] = [time.perf_counter() - start]
+        droppartitions(conn, MyAssignment.RANGE_TABLE_PREFIX)
+        droptable(conn, RATINGS_TABLE)
+    conn.close()
+    return results
+
+
+def benchmarkrangebalance(ratingsfilepath, modes=('ctas', 'equidepth'), partitioncounts=(5, 10)):
+    """
+    In số dòng của từng phân mảnh range và độ lệch (phân mảnh lớn nhất / trung bình) cho mỗi mode.
+    Trả về dict "mode/n" -> danh sách số dòng.
+    """
+    testHelper.createdb(DATABASE_NAME)
+    results = {}
+    with testHelper.getopenconnection(dbname=DATABASE_NAME) as conn:
+        conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        droptable(conn, RATINGS_TABLE)
+        MyAssignment.loadratings(RATINGS_TABLE, ratingsfilepath, conn)
+        for n in partitioncounts:
+            for mode in modes:
+                droppartitions(conn, MyAssignment.RANGE_TABLE_PREFIX)
+                MyAssignment.rangepartition(RATINGS_TABLE, n, conn, mode=mode)
+                with conn.cursor() as cur:
+                    counts = []
+                    for i in range(n):
+                        cur.execute(f"SELECT count(*) FROM {MyAssignment.RANGE_TABLE_PREFIX}{i}")
+                        counts.append(cur.fetchone()[0])
+                mean = sum(counts) / n
+                print(f"{mode}/{n}: {counts}  max/mean {max(counts) / mean if mean else 0:.2f}")
+                results[f"{mode}/{n}"] = counts
+        droppartitions(conn, MyAssignment.RANGE_TABLE_PREFIX)
+        droptable(conn, RATINGS_TABLE)
+    conn.close()
+    return results
+
+
+def benchmarkroundrobinconcurrency(ratingsfilepath, clientcounts=(1, 2, 4, 8), insertsperclient=200, numberofpartitions=5):
+    """
+    Đo số lượt roundrobininsert mỗi giây khi số client đồng thời tăng dần
+    (testHelper.testroundrobininsertconcurrent đồng thời kiểm tra độ cân bằng giữa các phân mảnh).
+    """
+    testHelper.createdb(DATABASE_NAME)
+    results = {}
+    with testHelper.getopenconnection(dbname=DATABASE_NAME) as conn:
+        conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        testHelper.deleteAllPublicTables(conn)
+        MyAssignment.loadratings(RATINGS_TABLE, ratingsfilepath, conn)
+        MyAssignment.roundrobinpartition(RATINGS_TABLE, numberofpartitions, conn)
+        for clients in clientcounts:
+            start = time.perf_counter()
+            [result, e] = testHelper.testroundrobininsertconcurrent(
+                MyAssignment, RATINGS_TABLE, numberofpartitions, clients, insertsperclient, conn)
+            if not result:
+                raise e
+            results[f"clients={clients}"] = [time.perf_counter() - start]
+        testHelper.deleteAllPublicTables(conn)
+    conn.close()
+    return results
+
+
+def _percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def _runasyncinserts(rows, scheme, maxbatchsize, lingerms, openconnection):
+    latencies = []
+
+    async def one(row):
+        start = time.perf_counter()
+        await inserter.insert(*row)
+        latencies.append(time.perf_counter() - start)
+
+    async with asyncinsert.AsyncPartitionInserter(RATINGS_TABLE, scheme, openconnection, maxbatchsize, lingerms) as inserter:
+        await asyncio.gather(*(one(row) for row in rows))
+    return latencies
+
+
+def benchmarkasyncinsert(ratingsfilepath, inserts=2000, numberofpartitions=5,
+                         batchsizes=(10, 100, 1000), lingerms=(1.0, 5.0)):
+    """
+    So sánh rangeinsert/roundrobininsert đồng bộ (mỗi dòng một commit) với lớp asyncio gom lô.
+    In thông lượng (dòng/giây) và độ trễ p99 cho từng cấu hình kích thước lô và thời gian chờ.
+    """
+    rows = [(random.randint(1, 100000), random.randint(1, 100000), random.randint(0, 10) / 2.0) for _ in range(inserts)]
+    testHelper.createdb(DATABASE_NAME)
+    with testHelper.getopenconnection(dbname=DATABASE_NAME) as conn:
+        conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        testHelper.deleteAllPublicTables(conn)
+        MyAssignment.loadratings(RATINGS_TABLE, ratingsfilepath, conn)
+        MyAssignment.rangepartition(RATINGS_TABLE, numberofpartitions, conn)
+        MyAssignment.roundrobinpartition(RATINGS_TABLE, numberofpartitions, conn)
+
+        for scheme, insert in (('range', MyAssignment.rangeinsert), ('roundrobin', MyAssignment.roundrobininsert)):
+            insert = getattr(insert, '__wrapped__', insert)
+            latencies = []
+            start = time.perf_counter()
+            for row in rows:
+                t = time.perf_counter()
+                insert(RATINGS_TABLE, *row, conn)
+                latencies.append(time.perf_counter() - t)
+            elapsed = time.perf_counter() - start
+            print(f"{scheme:<10} sync            {inserts / elapsed:10.0f} rows/s  p99 {_percentile(latencies, 0.99) * 1000:.2f}ms")
+
+            for batchsize in batchsizes:
+                for linger in lingerms:
+                    start = time.perf_counter()
+                    latencies = asyncio.run(_runasyncinserts(rows, scheme, batchsize, linger, conn))
+                    elapsed = time.perf_counter() - start
+                    print(f"{scheme:<10} async b={batchsize:<5} l={linger:<4} {inserts / elapsed:10.0f} rows/s  "
+                          f"p99 {_percentile(latencies, 0.99) * 1000:.2f}ms")
+        testHelper.deleteAllPublicTables(conn)
+    conn.close()
+
+
+def benchmarkindexlookup(ratingsfilepath, lookups=200, numberofpartitions=5, scheme='roundrobin'):
+    """
+    Đo độ trễ tra cứu "mọi rating của một người dùng" qua lookupratings khi không có gì, khi có
+    chỉ mục phụ toàn cục và khi có Bloom filter theo phân mảnh (in thêm bộ nhớ của từng bộ lọc).
+    Trả về dict "noindex"/"index"/"bloom" -> danh sách độ trễ (giây).
+    """
+    testHelper.createdb(DATABASE_NAME)
+    results = {}
+    with testHelper.getopenconnection(dbname=DATABASE_NAME) as conn:
+        conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        testHelper.deleteAllPublicTables(conn)
+        MyAssignment.loadratings(RATINGS_TABLE, ratingsfilepath, conn)
+        with conn.cursor() as cur:
+            cur.execute(f"SELECT DISTINCT userid FROM {RATINGS_TABLE}")
+            users = [row[0] for row in cur.fetchall()]
+        sample = [random.choice(users) for _ in range(lookups)]
+
+        partition = MyAssignment.rangepartition if scheme == 'range' else MyAssignment.roundrobinpartition
+        for label, withindex, withbloom in (('noindex', False, False), ('index', True, False), ('bloom', False, True)):
+            droppartitions(conn, MyAssignment.RANGE_TABLE_PREFIX if scheme == 'range' else MyAssignment.RROBIN_TABLE_PREFIX)
+            partition(RATINGS_TABLE, numberofpartitions, conn, withindex=withindex, withbloom=withbloom)
+            if withbloom:
+                for stats in MyAssignment.partition_bloom_stats(scheme, conn):
+                    print(f"bloom {stats['keytype']:<6} part {stats['partition_id']}: {stats['items']} keys, "
+                          f"{stats['nbytes'] / 1024:.1f} KiB, fpr ~{stats['estimatedfpr']:.4f}")
+            timings = []
+            for userid in sample:
+                start = time.perf_counter()
+                MyAssignment.lookupratings(RATINGS_TABLE, scheme, userid, conn)
+                timings.append(time.perf_counter() - start)
+            results[label] = timings
+        testHelper.deleteAllPublicTables(conn)
+    conn.close()
+    return results
+
+
+def benchmarkengines(ratingsfilepath, numberofpartitions=5):
+    """
+    So sánh PostgreSQL (Interface) với DuckDB nhúng (duckdbengine) trên cùng một máy:
+    thời gian loadratings, rangepartition và roundrobinpartition. Trả về dict "engine/bước" -> [thời gian].
+    """
+    results = {}
+
+    def run(engine, conn, drop):
+        steps = (
+            ('loadratings', lambda: engine.loadratings(RATINGS_TABLE, ratingsfilepath, conn)),
+            ('rangepartition', lambda: engine.rangepartition(RATINGS_TABLE, numberofpartitions, conn)),
+            ('roundrobinpartition', lambda: engine.roundrobinpartition(RATINGS_TABLE, numberofpartitions, conn)),
+        )
+        drop(conn)
+        for step, call in steps:
+            start = time.perf_counter()
+            call()
+            results[f"{engine.__name__}/{step}"] = [time.perf_counter() - start]
+        drop(conn)
+
+    testHelper.createdb(DATABASE_NAME)
+    with testHelper.getopenconnection(dbname=DATABASE_NAME) as conn:
+        conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        run(MyAssignment, conn, testHelper.deleteAllPublicTables)
+    conn.close()
+
+    conn = duckdbengine.getopenconnection(':memory:')
+    run(duckdbengine, conn, testHelper.deleteAllPublicTables)
+    conn.close()
+    return results
+
+
+def benchmarkexport(ratingsfilepath, directory='export', workercounts=(1, 4), numberofpartitions=5):
+    """
+    So sánh thời gian xuất Parquet mọi phân mảnh range với `workers` khác nhau và với một lần
+    quét tuần tự toàn bảng (COPY ratings TO STDOUT nhị phân). Trả về dict tên -> [thời gian].
+    """
+    results = {}
+    testHelper.createdb(DATABASE_NAME)
+    with testHelper.getopenconnection(dbname=DATABASE_NAME) as conn:
+        conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        testHelper.deleteAllPublicTables(conn)
+        MyAssignment.loadratings(RATINGS_TABLE, ratingsfilepath, conn)
+        MyAssignment.rangepartition(RATINGS_TABLE, numberofpartitions, conn)
+
+        start = time.perf_counter()
+        with conn.cursor() as cur:
+            cur.copy_expert(f"COPY {RATINGS_TABLE} TO STDOUT (FORMAT BINARY)", io.BytesIO())
+        results['seqscan'] = [time.perf_counter() - start]
+
+        for workers in workercounts:
+            start = time.perf_counter()
+            partitionexport.exportpartitions(RATINGS_TABLE, 'range', conn, directory, workers=workers)
+            results[f"export/{workers}"] = [time.perf_counter() - start]
+        testHelper.deleteAllPublicTables(conn)
+    conn.close()
+    return results
+
+
+def printresults(results):
+    baseline = None
+    for name, timings in results.items():
+        median = statistics.median(timings)
+        baseline = baseline or median
+        print(f"{name:<12} median {median:.4f}s  min {min(timings):.4f}s  x{baseline / median:.2f}")
+
+
+if __name__ == '__main__':
+    path = sys.argv[1] if len(sys.argv) > 1 else INPUT_FILE_PATH
+    printresults(benchmarkloaders(path))
+    printresults(benchmarkparsers(path))
+    printresults(benchmarkloadervariants(path))
+    printresults(benchmarkrangepartition(path))
+    benchmarkrangebalance(path)
+    printresults(benchmarkroundrobinconcurrency(path))
+    benchmarkasyncinsert(path)
+    printresults(benchmarkindexlookup(path))
+    printresults(benchmarkengines(path))
+    printresults(benchmarkexport(path))
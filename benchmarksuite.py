@@ -0,0 +1,359 @@
+#
+# Bộ benchmark lặp lại được cho mọi phương án loadratings / rangepartition / roundrobinpartition
+#
+# Cách chạy:
+#   python benchmarksuite.py --rows 1000,100000,1000000 --partitions 5,20 --trials 5 \
+#       --json results.json --csv results.csv [--baseline baseline.json --threshold 0.1]
+#
+# Mỗi ô của ma trận (phương án x số dòng x số phân mảnh x logged/unlogged) chạy `trials` lần,
+# mỗi lần trên một database mới tạo; lệnh được đo chạy trong một tiến trình con riêng để đo peak RSS.
+#
+import argparse
+import csv
+import functools
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+import numpy as np
+import psycopg2
+
+import connectionpool
+import testHelper
+import Interface
+
+BENCHMARK_DATABASE = 'dds_bench'
+RATINGS_TABLE = 'ratings'
+DATA_DIRECTORY = 'benchdata'
+DEFAULT_ROWS = (1000, 100000, 1000000, 10000000)
+DEFAULT_PARTITIONS = (5, 20)
+DEFAULT_PERSISTENCE = ('logged', 'unlogged')
+DEFAULT_TRIALS = 5
+# Trung vị chậm hơn baseline quá tỉ lệ này thì bị đánh dấu là hồi quy
+REGRESSION_THRESHOLD = 0.10
+# Tiền tố dòng kết quả mà tiến trình con in ra stdout
+RESULT_MARKER = 'BENCHMARK_RESULT '
+# Số dòng sinh ra mỗi lần ghi khi tạo file dữ liệu giả lập
+GENERATE_CHUNK_ROWS = 1000000
+
+# Tên phương án -> (loại, module, tên hàm, tham số thêm, kiểu bảng hỗ trợ).
+# Loại 'load' nhận đường dẫn file, 'range' / 'roundrobin' nhận số phân mảnh.
+# Kiểu bảng 'either': hàm dùng CREATE TABLE IF NOT EXISTS nên bảng ratings được tạo trước
+# (LOGGED hoặc UNLOGGED) trong bước chuẩn bị; 'logged' / 'unlogged': hàm tự tạo bảng theo kiểu cố định.
+VARIANTS = {
+    'sample.loadratings': ('load', 'Interface_Sample', 'loadratings', {}, 'logged'),
+    'update.nouselib': ('load', 'loadratingsupdate', 'loadratingsnouselib', {}, 'logged'),
+    'update.duckdb': ('load', 'loadratingsupdate', 'loadratingsuseduckdb', {}, 'either'),
+    'update.polars': ('load', 'loadratingsupdate', 'loadratingusepolar', {}, 'either'),
+    'interface.polars': ('load', 'Interface', 'loadratings', {'mode': 'polars'}, 'either'),
+    'interface.stream': ('load', 'Interface', 'loadratings', {'mode': 'stream'}, 'either'),
+    'interface.binary': ('load', 'Interface', 'loadratings', {'mode': 'binary'}, 'either'),
+    'interface.parallel': ('load', 'Interface', 'loadratings', {'mode': 'parallel'}, 'either'),
+    # Lần thử đầu tiên phân tích và ghi cache, các lần sau đọc cache
+    'interface.cache': ('load', 'Interface', 'loadratings', {'usecache': True}, 'either'),
+    'sample.rangepartition': ('range', 'Interface_Sample', 'rangepartition', {}, 'logged'),
+    'update.range.unlogged': ('range', 'rangepartitionupdate', 'rangepartitionunloggedtable', {}, 'unlogged'),
+    'update.range.bestchoice': ('range', 'rangepartitionupdate', 'rangepartitionbestchoice', {}, 'logged'),
+    'interface.range.ctas': ('range', 'Interface', 'rangepartition', {'mode': 'ctas'}, 'logged'),
+    'interface.range.singlescan': ('range', 'Interface', 'rangepartition', {'mode': 'singlescan'}, 'logged'),
+    'interface.range.parallel': ('range', 'Interface', 'rangepartition', {'mode': 'parallel'}, 'logged'),
+    'interface.range.equidepth': ('range', 'Interface', 'rangepartition', {'mode': 'equidepth'}, 'logged'),
+    'sample.roundrobinpartition': ('roundrobin', 'Interface_Sample', 'roundrobinpartition', {}, 'logged'),
+    'update.rrobin.unlogged': ('roundrobin', 'roundrobinpartitionupdate', 'roundrobinpartitionunloggedtable', {}, 'unlogged'),
+    'update.rrobin.bestchoice': ('roundrobin', 'roundrobinpartitionupdate', 'roundrobinpartitionbestchoice', {}, 'logged'),
+    'interface.rrobin.temptable': ('roundrobin', 'Interface', 'roundrobinpartition', {'mode': 'temptable'}, 'logged'),
+    'interface.rrobin.singlescan': ('roundrobin', 'Interface', 'roundrobinpartition', {'mode': 'singlescan'}, 'logged'),
+    'interface.rrobin.parallel': ('roundrobin', 'Interface', 'roundrobinpartition', {'mode': 'parallel'}, 'logged'),
+}
+# Tiền tố các bảng được tính vào kích thước kết quả của từng loại phương án
+RESULT_TABLE_PREFIXES = {'range': 'range_part', 'roundrobin': 'rrobin_part'}
+CSV_FIELDS = ('variant', 'kind', 'rows', 'partitions', 'persistence', 'trials', 'median', 'p95',
+              'rowspersec', 'peakrsskb', 'tablebytes', 'error')
+
+
+def generate_ratings_file(path, rows, seed=0):
+    """
+    Sinh file giả lập cùng định dạng ratings.dat (userid::movieid::rating::timestamp) với `rows` dòng.
+    Cùng (rows, seed) luôn cho cùng nội dung; rating là bội số 0.5 trong [0.5, 5] như MovieLens.
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, 'w', encoding='utf-8', newline='\n') as f:
+        for start in range(0, rows, GENERATE_CHUNK_ROWS):
+            count = min(GENERATE_CHUNK_ROWS, rows - start)
+            userid = rng.integers(1, 71568, count)
+            movieid = rng.integers(1, 65134, count)
+            rating = rng.integers(1, 11, count) / 2
+            timestamp = rng.integers(789652009, 1231131737, count)
+            f.write(''.join(
+                f"{u}::{m}::{r:g}::{t}\n" for u, m, r, t in zip(userid.tolist(), movieid.tolist(), rating.tolist(), timestamp.tolist())
+            ))
+    os.replace(temporary, path)
+
+
+def ratingsfile(rows, directory=DATA_DIRECTORY, seed=0):
+    """Đường dẫn file giả lập `rows` dòng, chỉ sinh lần đầu."""
+    path = os.path.join(directory, f"ratings_{rows}_{seed}.dat")
+    if not os.path.exists(path):
+        generate_ratings_file(path, rows, seed)
+    return path
+
+
+def _percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def _recreatedatabase(dbname):
+    # Đóng các pool tới database cũ, xóa hẳn (kể cả khi còn kết nối sót lại) rồi tạo mới
+    connectionpool.forget_database(dbname)
+    with connectionpool.pooled_connection('postgres') as con:
+        # DROP DATABASE không chạy được trong giao dịch
+        con.autocommit = True
+        try:
+            cur = con.cursor()
+            cur.execute(f"DROP DATABASE IF EXISTS {dbname} WITH (FORCE)")
+            cur.close()
+        finally:
+            con.autocommit = False
+    connectionpool.create_db(dbname)
+
+
+def _preparetrial(dbname, kind, persistence, path):
+    """
+    Chuẩn bị database mới cho một lần thử (không tính giờ): với phương án nạp dữ liệu 'either' thì
+    tạo sẵn bảng ratings đúng kiểu; với phương án phân mảnh thì nạp sẵn bảng ratings.
+    """
+    _recreatedatabase(dbname)
+    conn = testHelper.getopenconnection(dbname=dbname)
+    conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+    try:
+        if kind == 'load':
+            if persistence == 'unlogged':
+                with conn.cursor() as cur:
+                    cur.execute(f"""
+                        CREATE UNLOGGED TABLE {RATINGS_TABLE} (
+                            userid INTEGER,
+                            movieid INTEGER,
+                            rating FLOAT
+                        ) WITH (fillfactor=100);
+                    """)
+        else:
+            Interface.loadratings(RATINGS_TABLE, path, conn, mode='binary')
+    finally:
+        conn.close()
+
+
+def _tablebytes(dbname, kind):
+    # Tổng kích thước (gồm TOAST và chỉ mục) của bảng kết quả: ratings hoặc các phân mảnh
+    conn = testHelper.getopenconnection(dbname=dbname)
+    try:
+        with conn.cursor() as cur:
+            if kind == 'load':
+                cur.execute("SELECT pg_total_relation_size(to_regclass(%s))", (RATINGS_TABLE,))
+            else:
+                cur.execute("""
+                    SELECT coalesce(sum(pg_total_relation_size(c.oid)), 0)
+                    FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+                    WHERE n.nspname = current_schema() AND c.relkind IN ('r', 'p') AND c.relname LIKE %s
+                """, (RESULT_TABLE_PREFIXES[kind] + '%',))
+            return int(cur.fetchone()[0] or 0)
+    finally:
+        conn.close()
+
+
+def _peakrsskb():
+    # Peak RSS (kB) của tiến trình này và các tiến trình con đã kết thúc; None nếu hệ điều hành không hỗ trợ
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    # macOS trả về byte, Linux trả về kB
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+def _runtrial(spec):
+    """
+    Chạy trong tiến trình con: gọi đúng một phương án trên database đã chuẩn bị,
+    in ra thời gian (giây) và peak RSS dưới dạng một dòng JSON sau RESULT_MARKER.
+    """
+    kind, modulename, functionname, kwargs, _ = VARIANTS[spec['variant']]
+    module = __import__(modulename)
+    function = functools.partial(getattr(module, functionname), **kwargs)
+    argument = spec['path'] if kind == 'load' else spec['partitions']
+
+    conn = testHelper.getopenconnection(dbname=spec['dbname'])
+    conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+    try:
+        start = time.perf_counter()
+        function(RATINGS_TABLE, argument, conn)
+        seconds = time.perf_counter() - start
+    finally:
+        conn.close()
+    print(RESULT_MARKER + json.dumps({'seconds': seconds, 'peakrsskb': _peakrsskb()}), flush=True)
+
+
+def _spawntrial(spec):
+    completed = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--trial', json.dumps(spec)],
+        cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True
+    )
+    for line in completed.stdout.splitlines():
+        if line.startswith(RESULT_MARKER):
+            return json.loads(line[len(RESULT_MARKER):])
+    raise RuntimeError(completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else
+                       f"trial exited with code {completed.returncode}")
+
+
+def cells(variants, rowcounts, partitioncounts, persistences):
+    """Liệt kê các ô của ma trận; bỏ các tổ hợp phương án không hỗ trợ (kiểu bảng, số phân mảnh với hàm nạp)."""
+    for variant in variants:
+        kind, _, _, _, supported = VARIANTS[variant]
+        for rows in rowcounts:
+            for partitions in ([None] if kind == 'load' else partitioncounts):
+                for persistence in persistences:
+                    if supported in ('either', persistence):
+                        yield variant, kind, rows, partitions, persistence
+
+
+def runcell(variant, kind, rows, partitions, persistence, trials=DEFAULT_TRIALS,
+            dbname=BENCHMARK_DATABASE, directory=DATA_DIRECTORY):
+    """
+    Chạy một ô `trials` lần, mỗi lần trên database mới. Trả về dict kết quả của ô
+    (trung vị, p95, dòng/giây, peak RSS lớn nhất, kích thước bảng kết quả); lỗi được ghi vào 'error'.
+    """
+    path = os.path.abspath(ratingsfile(rows, directory))
+    spec = {'variant': variant, 'dbname': dbname, 'path': path, 'partitions': partitions}
+    result = {'variant': variant, 'kind': kind, 'rows': rows, 'partitions': partitions,
+              'persistence': persistence, 'trials': [], 'median': None, 'p95': None,
+              'rowspersec': None, 'peakrsskb': None, 'tablebytes': None, 'error': None}
+    rss = []
+    try:
+        for _ in range(trials):
+            _preparetrial(dbname, kind, persistence, path)
+            trial = _spawntrial(spec)
+            result['trials'].append(trial['seconds'])
+            if trial['peakrsskb'] is not None:
+                rss.append(trial['peakrsskb'])
+            result['tablebytes'] = _tablebytes(dbname, kind)
+    except Exception as e:
+        result['error'] = str(e)
+    if result['trials']:
+        result['median'] = statistics.median(result['trials'])
+        result['p95'] = _percentile(result['trials'], 0.95)
+        result['rowspersec'] = rows / result['median'] if result['median'] > 0 else None
+        result['peakrsskb'] = max(rss) if rss else None
+    return result
+
+
+def runsuite(variants=tuple(VARIANTS), rowcounts=DEFAULT_ROWS, partitioncounts=DEFAULT_PARTITIONS,
+             persistences=DEFAULT_PERSISTENCE, trials=DEFAULT_TRIALS, dbname=BENCHMARK_DATABASE,
+             directory=DATA_DIRECTORY):
+    """Chạy toàn bộ ma trận, trả về dict {'meta': ..., 'cells': [...]} để ghi ra JSON/CSV."""
+    results = []
+    for cell in cells(variants, rowcounts, partitioncounts, persistences):
+        result = runcell(*cell, trials=trials, dbname=dbname, directory=directory)
+        results.append(result)
+        status = result['error'] or (f"median {result['median']:.4f}s  p95 {result['p95']:.4f}s"
+                                     if result['median'] is not None else "no trials")
+        print(f"{result['variant']:<28} rows={result['rows']:<9} parts={result['partitions']!s:<5} "
+              f"{result['persistence']:<9} {status}")
+    _recreatedatabase(dbname)
+    return {
+        'meta': {
+            'started': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'trials': trials,
+        },
+        'cells': results,
+    }
+
+
+def writeresults(results, jsonpath=None, csvpath=None):
+    if jsonpath:
+        with open(jsonpath, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+    if csvpath:
+        with open(csvpath, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=CSV_FIELDS)
+            writer.writeheader()
+            for cell in results['cells']:
+                writer.writerow({**cell, 'trials': ' '.join(f"{t:.6f}" for t in cell['trials'])})
+
+
+def _cellkey(cell):
+    return cell['variant'], cell['rows'], cell['partitions'], cell['persistence']
+
+
+def compareresults(results, baseline, threshold=REGRESSION_THRESHOLD):
+    """
+    So sánh trung vị từng ô với ô tương ứng của `baseline` (kết quả runsuite đã lưu trước đó).
+    Trả về danh sách hồi quy (ô chậm hơn baseline quá `threshold`, hoặc chạy lỗi trong khi baseline thì không).
+    """
+    previous = {_cellkey(cell): cell for cell in baseline['cells']}
+    regressions = []
+    for cell in results['cells']:
+        old = previous.get(_cellkey(cell))
+        if old is None or old['median'] is None:
+            continue
+        if cell['median'] is None:
+            regressions.append({'cell': _cellkey(cell), 'baseline': old['median'], 'current': None, 'ratio': None})
+        elif cell['median'] > old['median'] * (1 + threshold):
+            regressions.append({'cell': _cellkey(cell), 'baseline': old['median'], 'current': cell['median'],
+                                'ratio': cell['median'] / old['median']})
+    return regressions
+
+
+def _intlist(value):
+    return [int(v) for v in value.split(',') if v]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark các phương án nạp dữ liệu và phân mảnh")
+    parser.add_argument('--variants', default=','.join(VARIANTS), help="danh sách tên phương án, cách nhau bởi dấu phẩy")
+    parser.add_argument('--rows', type=_intlist, default=list(DEFAULT_ROWS))
+    parser.add_argument('--partitions', type=_intlist, default=list(DEFAULT_PARTITIONS))
+    parser.add_argument('--persistence', default=','.join(DEFAULT_PERSISTENCE))
+    parser.add_argument('--trials', type=int, default=DEFAULT_TRIALS)
+    parser.add_argument('--dbname', default=BENCHMARK_DATABASE)
+    parser.add_argument('--datadir', default=DATA_DIRECTORY)
+    parser.add_argument('--json')
+    parser.add_argument('--csv')
+    parser.add_argument('--baseline', help="file JSON kết quả cũ để phát hiện hồi quy")
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD)
+    parser.add_argument('--trial', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.trial:
+        _runtrial(json.loads(args.trial))
+        return 0
+
+    variants = [v for v in args.variants.split(',') if v]
+    unknown = [v for v in variants if v not in VARIANTS]
+    if unknown:
+        parser.error(f"unknown variants: {', '.join(unknown)}")
+    results = runsuite(variants, args.rows, args.partitions, [p for p in args.persistence.split(',') if p],
+                       args.trials, args.dbname, args.datadir)
+    writeresults(results, args.json, args.csv)
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            regressions = compareresults(results, json.load(f), args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression['cell']}: {regression['baseline']:.4f}s -> "
+                  + (f"{regression['current']:.4f}s (x{regression['ratio']:.2f})" if regression['current'] else "error"))
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,100 @@
+#
+# Bloom filter vector hóa bằng NumPy, dùng để bỏ qua các phân mảnh chắc chắn không chứa khóa cần tìm
+#
+
+import math
+
+import numpy as np
+
+_MASK64 = np.uint64(0xFFFFFFFFFFFFFFFF)
+
+
+def _mix64(x):
+    # Hàm trộn splitmix64, tính trên cả mảng uint64 (phép nhân tràn số theo modulo 2^64)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def userkeys(userid):
+    """Khóa 64 bit cho bộ lọc theo userid."""
+    return np.asarray(userid, dtype=np.int64).astype(np.uint64)
+
+
+def pairkeys(userid, movieid):
+    """Khóa 64 bit cho bộ lọc theo cặp (userid, movieid)."""
+    userid = np.asarray(userid, dtype=np.int64).astype(np.uint64) & np.uint64(0xFFFFFFFF)
+    movieid = np.asarray(movieid, dtype=np.int64).astype(np.uint64) & np.uint64(0xFFFFFFFF)
+    return (userid << np.uint64(32)) | movieid
+
+
+class BloomFilter:
+    """
+    Bloom filter với m bit và k hàm băm (double hashing: h1 + i * h2).
+    Kích thước được chọn từ số phần tử dự kiến và tỉ lệ dương tính giả mong muốn.
+    """
+
+    def __init__(self, nbits, nhashes, bits=None, items=0):
+        self.nbits = int(nbits)
+        self.nhashes = int(nhashes)
+        self.items = int(items)
+        nbytes = (self.nbits + 7) // 8
+        if bits is None:
+            self.bits = np.zeros(nbytes, dtype=np.uint8)
+        else:
+            self.bits = np.frombuffer(bytes(bits), dtype=np.uint8).copy()
+            if len(self.bits) != nbytes:
+                raise ValueError("Bloom filter bit array does not match nbits")
+
+    @classmethod
+    def forcapacity(cls, capacity, fpr=0.01):
+        """Tạo bộ lọc rỗng tối ưu cho `capacity` phần tử với tỉ lệ dương tính giả `fpr`."""
+        if not 0 < fpr < 1:
+            raise ValueError("fpr must be between 0 and 1")
+        capacity = max(int(capacity), 1)
+        nbits = math.ceil(-capacity * math.log(fpr) / (math.log(2) ** 2))
+        # Số hàm băm tính trước khi làm tròn lên 64 bit, để luôn xấp xỉ log2(1/fpr) kể cả với bộ lọc rất nhỏ
+        nhashes = max(1, round(nbits / capacity * math.log(2)))
+        nbits = max(64, nbits)
+        return cls(nbits, nhashes)
+
+    def _positions(self, keys):
+        keys = np.asarray(keys, dtype=np.uint64)
+        with np.errstate(over='ignore'):
+            h1 = _mix64(keys)
+            h2 = _mix64(keys ^ np.uint64(0x9E3779B97F4A7C15)) | np.uint64(1)
+            steps = np.arange(self.nhashes, dtype=np.uint64)
+            return (h1[:, None] + steps[None, :] * h2[:, None]) % np.uint64(self.nbits)
+
+    def add(self, keys, count=True):
+        """Thêm một mảng khóa vào bộ lọc; count=False khi thêm lại các khóa đã được đếm."""
+        positions = self._positions(keys).ravel()
+        np.bitwise_or.at(self.bits, (positions >> np.uint64(3)).astype(np.int64),
+                         (np.uint8(1) << (positions & np.uint64(7)).astype(np.uint8)))
+        if count:
+            self.items += len(keys)
+
+    def contains(self, keys):
+        """Trả về mảng bool: False nghĩa là khóa chắc chắn không có, True là có thể có."""
+        positions = self._positions(keys)
+        bytes_ = self.bits[(positions >> np.uint64(3)).astype(np.int64)]
+        hits = (bytes_ >> (positions & np.uint64(7)).astype(np.uint8)) & np.uint8(1)
+        return hits.all(axis=1)
+
+    def mightcontain(self, key):
+        return bool(self.contains(np.array([key], dtype=np.uint64))[0])
+
+    @property
+    def nbytes(self):
+        """Dung lượng bộ nhớ của mảng bit (byte)."""
+        return self.bits.nbytes
+
+    @property
+    def estimatedfpr(self):
+        """Tỉ lệ dương tính giả ước tính với số phần tử hiện có."""
+        if self.items == 0:
+            return 0.0
+        return (1 - math.exp(-self.nhashes * self.items / self.nbits)) ** self.nhashes
+
+    def tobytes(self):
+        return self.bits.tobytes()
@@ -0,0 +1,232 @@
+#
+# Quản lý kết nối PostgreSQL dùng chung cho Interface, các module update và testHelper
+#
+
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+import psycopg2.extensions
+import psycopg2.pool
+
+DEFAULT_USER = 'postgres'
+DEFAULT_PASSWORD = '1234'
+DEFAULT_HOST = 'localhost'
+
+# Kích thước mặc định của mỗi pool
+POOL_MIN_SIZE = 1
+POOL_MAX_SIZE = 16
+# Kết nối rảnh lâu hơn số giây này sẽ được kiểm tra bằng SELECT 1 trước khi trả cho người dùng
+HEALTH_CHECK_INTERVAL = 30.0
+
+# Các lệnh cấu hình phiên, chỉ chạy một lần cho mỗi kết nối do module này tạo ra
+SESSION_SETUP = (
+    "SET synchronous_commit = OFF;",            # Không chờ ghi WAL ở mỗi COMMIT
+    "SET work_mem = '1024MB';",                 # Tăng RAM cho sort/hash
+    "SET maintenance_work_mem = '2097151kB';",  # Tăng RAM cho CREATE TABLE, CREATE INDEX, COPY
+    "SET enable_partitionwise_aggregate = ON;", # Cho phép gộp theo từng phân vùng với bảng phân vùng gốc
+)
+
+
+class SessionConnection(psycopg2.extensions.connection):
+    """
+    Kết nối psycopg2 ghi nhớ trạng thái phiên: đã chạy SESSION_SETUP chưa và lần cuối được trả về pool.
+    """
+    session_configured = False
+    last_used = 0.0
+
+
+def getopenconnection(user=DEFAULT_USER, password=DEFAULT_PASSWORD, dbname='postgres'):
+    """
+    Tạo một kết nối mới (không qua pool) tới PostgreSQL.
+    """
+    return psycopg2.connect(
+        dbname=dbname, user=user, host=DEFAULT_HOST, password=password,
+        connection_factory=SessionConnection
+    )
+
+
+def connectionparameters(openconnection):
+    """
+    Tham số kết nối đầy đủ của `openconnection` (host, port, user, dbname, sslmode, ... kèm mật khẩu),
+    dạng dict picklable để mở lại kết nối tương đương ở tiến trình khác bằng connect_with.
+    """
+    params = openconnection.get_dsn_parameters()
+    if openconnection.info.password:
+        params['password'] = openconnection.info.password
+    return params
+
+
+def connect_with(connectionparams):
+    """Tạo một kết nối mới (không qua pool) từ dict của connectionparameters."""
+    return psycopg2.connect(**connectionparams, connection_factory=SessionConnection)
+
+
+def configure_session(openconnection):
+    """
+    Chạy SESSION_SETUP trên kết nối mà không bao giờ commit giao dịch của người gọi.
+    Khi không có giao dịch đang mở, các lệnh SET chạy ở chế độ autocommit (tạm bật rồi trả lại) nên có hiệu lực
+    cho cả phiên; với kết nối tạo bởi module này thì chỉ chạy lần đầu.
+    Khi đang trong giao dịch, các lệnh SET chạy trong giao dịch đó (mất nếu giao dịch rollback)
+    và sẽ được chạy lại ở lần gọi sau.
+    """
+    if getattr(openconnection, 'session_configured', False):
+        return
+    idle = openconnection.info.transaction_status == psycopg2.extensions.TRANSACTION_STATUS_IDLE
+    autocommit = openconnection.autocommit
+    if idle and not autocommit:
+        openconnection.autocommit = True
+    try:
+        cur = openconnection.cursor()
+        for statement in SESSION_SETUP:
+            cur.execute(statement)
+        cur.close()
+    finally:
+        if idle and not autocommit:
+            openconnection.autocommit = False
+    if idle and isinstance(openconnection, SessionConnection):
+        openconnection.session_configured = True
+
+
+class ConnectionPool:
+    """
+    Pool kết nối tới một database, an toàn khi dùng từ nhiều luồng.
+    getconn() chờ khi đã dùng hết maxconn kết nối, kiểm tra sức khỏe kết nối rảnh lâu
+    và cấu hình phiên một lần cho mỗi kết nối mới.
+    """
+
+    def __init__(self, connectionparams, minconn=POOL_MIN_SIZE, maxconn=POOL_MAX_SIZE,
+                 healthcheckinterval=HEALTH_CHECK_INTERVAL):
+        self.connectionparams = dict(connectionparams)
+        self.dbname = self.connectionparams.get('dbname')
+        self.healthcheckinterval = healthcheckinterval
+        self.slots = threading.BoundedSemaphore(maxconn)
+        self.pool = psycopg2.pool.ThreadedConnectionPool(
+            minconn, maxconn, connection_factory=SessionConnection, **self.connectionparams
+        )
+
+    def _healthy(self, conn):
+        if conn.closed:
+            return False
+        if time.monotonic() - conn.last_used < self.healthcheckinterval:
+            return True
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT 1")
+            cur.close()
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def getconn(self):
+        self.slots.acquire()
+        try:
+            conn = self.pool.getconn()
+            # Bỏ kết nối hỏng và lấy kết nối khác
+            while not self._healthy(conn):
+                self.pool.putconn(conn, close=True)
+                conn = self.pool.getconn()
+            configure_session(conn)
+            return conn
+        except Exception:
+            self.slots.release()
+            raise
+
+    def putconn(self, conn, close=False):
+        try:
+            if not conn.closed and conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+            conn.last_used = time.monotonic()
+            self.pool.putconn(conn, close=close or bool(conn.closed))
+        finally:
+            self.slots.release()
+
+    @contextmanager
+    def connection(self):
+        """Mượn một kết nối trong khối with và luôn trả lại pool khi ra khỏi khối."""
+        conn = self.getconn()
+        try:
+            yield conn
+        finally:
+            self.putconn(conn)
+
+    def closeall(self):
+        self.pool.closeall()
+
+
+# Các pool của tiến trình, theo bộ tham số kết nối (xem _poolkey)
+_POOLS = {}
+_POOLS_LOCK = threading.Lock()
+# Các database đã biết là tồn tại (tránh hỏi lại pg_database)
+_EXISTING_DATABASES = set()
+
+
+def _connectionparams(connectionparams):
+    # Tên database đơn lẻ nghĩa là máy chủ và tài khoản mặc định của module
+    if isinstance(connectionparams, str):
+        return {'dbname': connectionparams, 'user': DEFAULT_USER, 'password': DEFAULT_PASSWORD, 'host': DEFAULT_HOST}
+    return dict(connectionparams)
+
+
+def _poolkey(connectionparams):
+    return tuple(sorted(connectionparams.items()))
+
+
+def get_pool(connectionparams, minconn=POOL_MIN_SIZE, maxconn=POOL_MAX_SIZE):
+    """
+    Trả về pool dùng chung của tiến trình cho một bộ tham số kết nối, tạo mới nếu chưa có.
+    `connectionparams` là dict của connectionparameters(openconnection) (cùng máy chủ, cổng,
+    tài khoản và database với kết nối gọi hàm), hoặc chỉ tên database với tài khoản mặc định.
+    """
+    connectionparams = _connectionparams(connectionparams)
+    key = _poolkey(connectionparams)
+    with _POOLS_LOCK:
+        if key not in _POOLS:
+            _POOLS[key] = ConnectionPool(connectionparams, minconn, maxconn)
+        return _POOLS[key]
+
+
+def pooled_connection(connectionparams, **kwargs):
+    """Viết tắt cho get_pool(connectionparams).connection()."""
+    return get_pool(connectionparams, **kwargs).connection()
+
+
+def closeallpools():
+    with _POOLS_LOCK:
+        for pool in _POOLS.values():
+            pool.closeall()
+        _POOLS.clear()
+
+
+def create_db(dbname):
+    """
+    Tạo database `dbname` nếu chưa tồn tại. Kết quả kiểm tra được nhớ trong tiến trình,
+    các lần gọi sau không cần kết nối tới 'postgres' nữa.
+    """
+    if dbname in _EXISTING_DATABASES:
+        return
+    with pooled_connection('postgres') as con:
+        # CREATE DATABASE không chạy được trong giao dịch
+        con.autocommit = True
+        try:
+            cur = con.cursor()
+            cur.execute('SELECT COUNT(*) FROM pg_catalog.pg_database WHERE datname = %s', (dbname,))
+            count = cur.fetchone()[0]
+            if count == 0:
+                cur.execute('CREATE DATABASE %s' % (dbname,))
+            else:
+                print('A database named {0} already exists'.format(dbname))
+            cur.close()
+        finally:
+            con.autocommit = False
+    _EXISTING_DATABASES.add(dbname)
+
+
+def forget_database(dbname):
+    """Gọi sau khi xóa database để lần create_db kế tiếp kiểm tra lại; đóng luôn pool tới database đó."""
+    _EXISTING_DATABASES.discard(dbname)
+    with _POOLS_LOCK:
+        for key in [key for key, pool in _POOLS.items() if pool.dbname == dbname]:
+            _POOLS.pop(key).closeall()
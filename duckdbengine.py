@@ -0,0 +1,224 @@
+#
+# Engine phân mảnh chạy trên DuckDB nhúng, cùng giao diện với Interface.py nhưng không cần máy chủ PostgreSQL
+# (dùng cho các job chạy lô và để so sánh với đường PostgreSQL trên một máy)
+#
+
+import os
+
+import duckdb
+
+from Interface import (
+    measure_time, range_bounds, HASH_MULTIPLIER,
+    RANGE_METADATA_TABLE, RROBIN_METADATA_TABLE, HASH_METADATA_TABLE,
+    RANGE_TABLE_PREFIX, RROBIN_TABLE_PREFIX, HASH_TABLE_PREFIX,
+)
+
+# File database DuckDB mặc định (':memory:' để chạy hoàn toàn trong RAM)
+DUCKDB_PATH = 'dds_assgn1.duckdb'
+
+
+def getopenconnection(path=DUCKDB_PATH):
+    """Mở kết nối DuckDB; đối tượng trả về có cursor() / execute() / fetchone() như kết nối psycopg2."""
+    return duckdb.connect(path)
+
+
+def init_metadata_tables(openconnection):
+    # Không khai báo PRIMARY KEY: DuckDB báo trùng khóa khi xóa rồi thêm lại cùng khóa trong một giao dịch
+    con = openconnection
+    con.execute(f"""
+        CREATE TABLE IF NOT EXISTS {RANGE_METADATA_TABLE} (
+            tablename VARCHAR NOT NULL,
+            partition_count INTEGER NOT NULL
+        );
+    """)
+    con.execute(f"""
+        CREATE TABLE IF NOT EXISTS {RROBIN_METADATA_TABLE} (
+            tablename VARCHAR NOT NULL,
+            partition_count INTEGER NOT NULL,
+            last_partition_index INTEGER NOT NULL
+        );
+    """)
+    con.execute(f"""
+        CREATE TABLE IF NOT EXISTS {HASH_METADATA_TABLE} (
+            tablename VARCHAR NOT NULL,
+            partition_count INTEGER NOT NULL
+        );
+    """)
+
+
+def _replacemetadata(con, metadatatable, values):
+    # Xóa bản ghi cũ (nếu có) rồi thêm mới, giống update_*_metadata của Interface.py
+    con.execute(f"DELETE FROM {metadatatable} WHERE tablename = ?", [values[0]])
+    con.execute(f"INSERT INTO {metadatatable} VALUES ({', '.join('?' for _ in values)})", list(values))
+
+
+def _droppartitions(con, prefix):
+    tables = con.execute(
+        "SELECT table_name FROM information_schema.tables WHERE table_schema = current_schema() AND table_name LIKE ?",
+        [prefix + '%']
+    ).fetchall()
+    for (table,) in tables:
+        con.execute(f"DROP TABLE IF EXISTS {table}")
+
+
+@measure_time
+def loadratings(ratingstablename, ratingsfilepath, openconnection):
+    """
+    Nạp ratings.dat (userid::movieid::rating::timestamp) vào bảng DuckDB bằng một câu CREATE TABLE AS read_csv,
+    giữ nguyên thứ tự dòng của file (cần cho phân mảnh round robin).
+    """
+    con = openconnection
+    con.execute(f"""
+        CREATE OR REPLACE TABLE {ratingstablename} AS
+        SELECT userid, movieid, rating
+        FROM read_csv('{ratingsfilepath}',
+            delim='::',
+            header=False,
+            columns={{'userid': 'INTEGER', 'movieid': 'INTEGER', 'rating': 'DOUBLE', 'timestamp': 'BIGINT'}}
+        )
+    """)
+
+
+@measure_time
+def rangepartition(ratingstablename, numberofpartitions, openconnection):
+    """
+    Phân mảnh theo khoảng rating giống Interface.rangepartition: phân mảnh 0 nhận [minR, maxR],
+    các phân mảnh sau nhận (minR, maxR]. Mỗi phân mảnh là một bảng DuckDB range_partN.
+    """
+    if not isinstance(numberofpartitions, int) or numberofpartitions <= 0:
+        return
+    con = openconnection
+    init_metadata_tables(con)
+    _droppartitions(con, RANGE_TABLE_PREFIX)
+    con.execute("BEGIN TRANSACTION")
+    try:
+        for i, (minR, maxR) in enumerate(range_bounds(numberofpartitions)):
+            lower = ">=" if i == 0 else ">"
+            con.execute(f"""
+                CREATE TABLE {RANGE_TABLE_PREFIX}{i} AS
+                SELECT userid, movieid, rating FROM {ratingstablename}
+                WHERE rating {lower} {minR!r} AND rating <= {maxR!r}
+            """)
+        _replacemetadata(con, RANGE_METADATA_TABLE, (ratingstablename, numberofpartitions))
+        con.execute("COMMIT")
+    except Exception:
+        con.execute("ROLLBACK")
+        raise
+
+
+@measure_time
+def roundrobinpartition(ratingstablename, numberofpartitions, openconnection):
+    """
+    Phân mảnh round robin theo thứ tự dòng: dòng thứ k (rowid, bắt đầu từ 0) vào rrobin_part<k % n>.
+    """
+    if not isinstance(numberofpartitions, int) or numberofpartitions <= 0:
+        return
+    con = openconnection
+    init_metadata_tables(con)
+    _droppartitions(con, RROBIN_TABLE_PREFIX)
+    con.execute("BEGIN TRANSACTION")
+    try:
+        for i in range(numberofpartitions):
+            con.execute(f"""
+                CREATE TABLE {RROBIN_TABLE_PREFIX}{i} AS
+                SELECT userid, movieid, rating FROM {ratingstablename}
+                WHERE rowid % {numberofpartitions} = {i}
+                ORDER BY rowid
+            """)
+        total_rows = con.execute(f"SELECT count(*) FROM {ratingstablename}").fetchone()[0]
+        last_partition_index = (total_rows - 1) % numberofpartitions if total_rows > 0 else -1
+        _replacemetadata(con, RROBIN_METADATA_TABLE, (ratingstablename, numberofpartitions, last_partition_index))
+        con.execute("COMMIT")
+    except Exception:
+        con.execute("ROLLBACK")
+        raise
+
+
+@measure_time
+def hashpartition(ratingstablename, numberofpartitions, openconnection):
+    """
+    Phân mảnh theo hàm băm của userid, cùng công thức với Interface.hash_partition_index.
+    """
+    if not isinstance(numberofpartitions, int) or numberofpartitions <= 0:
+        return
+    con = openconnection
+    init_metadata_tables(con)
+    _droppartitions(con, HASH_TABLE_PREFIX)
+    con.execute("BEGIN TRANSACTION")
+    try:
+        for i in range(numberofpartitions):
+            con.execute(f"""
+                CREATE TABLE {HASH_TABLE_PREFIX}{i} AS
+                SELECT userid, movieid, rating FROM {ratingstablename}
+                WHERE (((userid::BIGINT * {HASH_MULTIPLIER}) & 4294967295) >> 16) % {numberofpartitions} = {i}
+            """)
+        _replacemetadata(con, HASH_METADATA_TABLE, (ratingstablename, numberofpartitions))
+        con.execute("COMMIT")
+    except Exception:
+        con.execute("ROLLBACK")
+        raise
+
+
+@measure_time
+def rangeinsert(ratingstablename, userid, itemid, rating, openconnection):
+    """
+    Thêm 1 dòng vào phân mảnh range tương ứng (cùng quy tắc chọn phân mảnh với Interface.rangeinsert).
+    """
+    con = openconnection
+    partition_count = con.execute(
+        f"SELECT partition_count FROM {RANGE_METADATA_TABLE} WHERE tablename = ?", [ratingstablename]
+    ).fetchone()[0]
+    delta = 5.0 / partition_count
+    index = int(rating / delta)
+    if rating % delta == 0 and index != 0:
+        index = index - 1
+    con.execute(f"INSERT INTO {RANGE_TABLE_PREFIX}{index} VALUES (?, ?, ?)", [userid, itemid, rating])
+
+
+@measure_time
+def roundrobininsert(ratingstablename, userid, itemid, rating, openconnection):
+    """
+    Thêm 1 dòng vào phân mảnh round robin kế tiếp; slot được cấp bằng UPDATE ... RETURNING
+    trong cùng giao dịch với INSERT.
+    """
+    con = openconnection
+    con.execute("BEGIN TRANSACTION")
+    try:
+        partition_count, index = con.execute(f"""
+            UPDATE {RROBIN_METADATA_TABLE}
+            SET last_partition_index = (last_partition_index + 1) % partition_count
+            WHERE tablename = ?
+            RETURNING partition_count, last_partition_index
+        """, [ratingstablename]).fetchone()
+        con.execute(f"INSERT INTO {RROBIN_TABLE_PREFIX}{index} VALUES (?, ?, ?)", [userid, itemid, rating])
+        con.execute("COMMIT")
+    except Exception:
+        con.execute("ROLLBACK")
+        raise
+
+
+@measure_time
+def hashinsert(ratingstablename, userid, itemid, rating, openconnection):
+    """
+    Thêm 1 dòng vào phân mảnh hash tương ứng với userid.
+    """
+    con = openconnection
+    partition_count = con.execute(
+        f"SELECT partition_count FROM {HASH_METADATA_TABLE} WHERE tablename = ?", [ratingstablename]
+    ).fetchone()[0]
+    index = (((int(userid) * HASH_MULTIPLIER) & 0xFFFFFFFF) >> 16) % partition_count
+    con.execute(f"INSERT INTO {HASH_TABLE_PREFIX}{index} VALUES (?, ?, ?)", [userid, itemid, rating])
+
+
+def exportparquet(prefix, numberofpartitions, openconnection, directory):
+    """
+    Ghi mỗi phân mảnh `prefix`N ra file Parquet <directory>/<prefix>N.parquet
+    (ví dụ để đọc lại bằng read_parquet hoặc chuyển sang máy khác). Trả về danh sách đường dẫn.
+    """
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for i in range(numberofpartitions):
+        path = os.path.join(directory, f"{prefix}{i}.parquet")
+        openconnection.execute(f"COPY {prefix}{i} TO '{path}' (FORMAT PARQUET)")
+        paths.append(path)
+    return paths
@@ -5,6 +5,8 @@ import os
 import tempfile
 import polars as pl
 
+import connectionpool
+
 DATABASE_NAME = 'dds_assgn1'
 
 def loadratingsnouselib(ratingstablename, ratingsfilepath, openconnection):
@@ -15,9 +17,7 @@ def loadratingsnouselib(ratingstablename, ratingsfilepath, openconnection):
 
     try:
         # Tối ưu cấu hình PostgreSQL để tăng tốc độ ghi dữ liệu
-        cur.execute("SET synchronous_commit = OFF;")  # Không ghi log mỗi COMMIT (giảm I/O)
-        cur.execute("SET work_mem = '1024MB';")       # Tăng bộ nhớ cho các phép toán sort, hash
-        cur.execute("SET maintenance_work_mem = '2097151kB';")  # Tăng bộ nhớ cho các thao tác CREATE TABLE, COPY
+        connectionpool.configure_session(cur.connection)  # synchronous_commit, work_mem, maintenance_work_mem, ...
 
         # Tạo bảng ratings với fillfactor tối đa (giảm phân mảnh khi ghi dữ liệu liên tục)
         cur.execute(f"""
@@ -142,9 +142,7 @@ def loadratingusepolar(ratingstablename, ratingsfilepath, openconnection):
 
     try:
         # Tối ưu cấu hình PostgreSQL để tăng tốc độ INSERT/COPY
-        cur.execute("SET synchronous_commit = OFF;")  # Không cần ghi log ngay mỗi lần COMMIT
-        cur.execute("SET work_mem = '1024MB';")       # Tăng bộ nhớ RAM dùng cho các thao tác xử lý
-        cur.execute("SET maintenance_work_mem = '2097151kB';")  # Tăng RAM cho CREATE TABLE và COPY
+        connectionpool.configure_session(cur.connection)  # synchronous_commit, work_mem, maintenance_work_mem, ...
 
         # Tạo bảng nếu chưa có, với fillfactor=100 (giảm phân mảnh khi ghi nhiều)
         cur.execute(f"""
@@ -194,43 +192,14 @@ def loadratingusepolar(ratingstablename, ratingsfilepath, openconnection):
             os.remove(csv_path)
     
 # Hàm getopenconnection dùng để tạo và trả về một kết nối tới cơ sở dữ liệu PostgreSQL
+# (dùng chung cách tạo kết nối của module connectionpool)
 def getopenconnection(user='postgres', password='1234', dbname='postgres'):
-    # Sử dụng hàm psycopg2.connect để tạo kết nối:
-    # - dbname: tên cơ sở dữ liệu (mặc định là 'postgres')
-    # - user: tên người dùng (mặc định là 'postgres')
-    # - password: mật khẩu của người dùng (mặc định là '1234')
-    # - host: máy chủ lưu trữ cơ sở dữ liệu (mặc định là 'localhost')
-    return psycopg2.connect(
-        "dbname='" + dbname + "' user='" + user + "' host='localhost' password='" + password + "'"
-    )
+    return connectionpool.getopenconnection(user=user, password=password, dbname=dbname)
 
 def create_db(dbname):
     """
     Tạo một cơ sở dữ liệu mới trong PostgreSQL.
     Nếu cơ sở dữ liệu có tên `dbname` đã tồn tại thì không tạo mới.
+    Kết nối tới 'postgres' lấy từ pool dùng chung, kết quả kiểm tra được nhớ trong tiến trình.
     """
-
-    # Kết nối tới cơ sở dữ liệu mặc định là 'postgres'
-    con = getopenconnection(dbname='postgres')
-
-    # Thiết lập chế độ AUTOCOMMIT vì lệnh CREATE DATABASE không thể nằm trong transaction
-    con.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
-
-    # Tạo cursor để thực hiện truy vấn SQL
-    cur = con.cursor()
-
-    # Kiểm tra xem cơ sở dữ liệu tên dbname đã tồn tại chưa
-    cur.execute(
-        'SELECT COUNT(*) FROM pg_catalog.pg_database WHERE datname=\'%s\'' % (dbname,)
-    )
-    count = cur.fetchone()[0]
-
-    if count == 0:
-        # Nếu chưa tồn tại thì tạo mới cơ sở dữ liệu
-        cur.execute('CREATE DATABASE %s' % (dbname,))
-    else:
-        # Nếu đã tồn tại thì in thông báo
-        print('A database named {0} already exists'.format(dbname))
-
-    # Đóng cursor và kết nối
-    cur.close()
+    connectionpool.create_db(dbname)
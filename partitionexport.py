@@ -0,0 +1,106 @@
+#
+# Xuất các phân mảnh ra Parquet theo thư mục kiểu hive (scheme=range/part=3/) kèm manifest thống kê
+#
+
+import io
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import polars as pl
+
+import connectionpool
+import pgcopy
+from Interface import (
+    measure_time, get_range_metadata, get_rrobin_metadata, get_hash_metadata,
+    RANGE_TABLE_PREFIX, RROBIN_TABLE_PREFIX, HASH_TABLE_PREFIX,
+)
+
+# Tiền tố bảng và hàm đọc số phân mảnh của từng kiểu phân mảnh
+PARTITION_SCHEMES = {
+    'range': (RANGE_TABLE_PREFIX, get_range_metadata),
+    'roundrobin': (RROBIN_TABLE_PREFIX, lambda con, t: get_rrobin_metadata(con, t)[0]),
+    'hash': (HASH_TABLE_PREFIX, get_hash_metadata),
+}
+MANIFEST_FILE = 'manifest.json'
+# Nén mặc định của file Parquet (zstd cho file nhỏ hơn snappy mà vẫn đọc nhanh)
+PARQUET_COMPRESSION = 'zstd'
+
+
+def _columnstats(values):
+    if len(values) == 0:
+        return {'min': None, 'max': None}
+    return {'min': values.min().item(), 'max': values.max().item()}
+
+
+def _exportpartitionworker(connectionparams, table, path, compression):
+    """
+    Luồng con: COPY một phân mảnh ra dạng nhị phân trên kết nối từ pool, giải mã vector hóa
+    thành các cột rồi ghi một file Parquet. Trả về thông tin của phân mảnh cho manifest.
+    """
+    start = time.perf_counter()
+    buffer = io.BytesIO()
+    with connectionpool.pooled_connection(connectionparams) as conn:
+        cur = conn.cursor()
+        cur.copy_expert(f"COPY (SELECT userid, movieid, rating FROM {table}) TO STDOUT (FORMAT BINARY)", buffer)
+        cur.close()
+        conn.commit()
+    userid, movieid, rating = pgcopy.decode_ratings(buffer.getbuffer())
+    buffer.close()
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    pl.DataFrame({'userid': userid, 'movieid': movieid, 'rating': rating}).write_parquet(
+        path, compression=compression, statistics=True
+    )
+    return {
+        'table': table,
+        'rows': len(userid),
+        'userid': _columnstats(userid),
+        'movieid': _columnstats(movieid),
+        'rating': _columnstats(rating),
+        'bytes': os.path.getsize(path),
+        'seconds': round(time.perf_counter() - start, 4),
+    }
+
+
+@measure_time
+def exportpartitions(ratingstablename, scheme, openconnection, directory, workers=4,
+                     compression=PARQUET_COMPRESSION):
+    """
+    Ghi mỗi phân mảnh của `scheme` ('range', 'roundrobin' hoặc 'hash') ra
+    <directory>/scheme=<scheme>/part=<i>/data.parquet, `workers` phân mảnh cùng lúc.
+    Số phân mảnh lấy từ bảng metadata; manifest.json trong <directory>/scheme=<scheme>/
+    ghi số dòng, min/max từng cột và kích thước file của mỗi phân mảnh. Trả về manifest (dict).
+    """
+    if scheme not in PARTITION_SCHEMES:
+        raise ValueError(f"Unknown partitioning scheme: {scheme}")
+    prefix, getcount = PARTITION_SCHEMES[scheme]
+    numberofpartitions = getcount(openconnection, ratingstablename)
+    connectionparams = connectionpool.connectionparameters(openconnection)
+    root = os.path.join(directory, f"scheme={scheme}")
+    paths = [os.path.join(root, f"part={i}", 'data.parquet') for i in range(numberofpartitions)]
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(_exportpartitionworker, connectionparams, f"{prefix}{i}", path, compression)
+            for i, path in enumerate(paths)
+        ]
+        partitions = [f.result() for f in futures]
+
+    for i, (partition, path) in enumerate(zip(partitions, paths)):
+        partition['part'] = i
+        partition['path'] = os.path.relpath(path, root)
+    manifest = {
+        'tablename': ratingstablename,
+        'scheme': scheme,
+        'partition_count': numberofpartitions,
+        'rows': sum(p['rows'] for p in partitions),
+        'compression': compression,
+        'exported_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'partitions': partitions,
+    }
+    os.makedirs(root, exist_ok=True)
+    with open(os.path.join(root, MANIFEST_FILE), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
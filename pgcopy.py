@@ -0,0 +1,118 @@
+#
+# Mã hóa dữ liệu ratings sang định dạng COPY nhị phân (PGCOPY) của PostgreSQL
+#
+
+import numpy as np
+
+# Header PGCOPY: chữ ký 11 byte + cờ (int32) + độ dài phần mở rộng header (int32)
+PGCOPY_HEADER = b'PGCOPY\n\xff\r\n\x00' + (0).to_bytes(4, 'big') + (0).to_bytes(4, 'big')
+# Trailer: số trường bằng -1 (int16) báo hết dữ liệu
+PGCOPY_TRAILER = (-1).to_bytes(2, 'big', signed=True)
+
+# Mỗi dòng của bảng ratings (userid INTEGER, movieid INTEGER, rating FLOAT) ở dạng nhị phân:
+# số trường (int16), rồi với mỗi trường là độ dài (int32) và giá trị, tất cả theo thứ tự big-endian
+RATINGS_ROW_DTYPE = np.dtype([
+    ('fieldcount', '>i2'),
+    ('userid_len', '>i4'), ('userid', '>i4'),
+    ('movieid_len', '>i4'), ('movieid', '>i4'),
+    ('rating_len', '>i4'), ('rating', '>f8'),
+])
+
+
+def encode_ratings(userid, movieid, rating):
+    """
+    Đóng gói ba cột (mảng NumPy, Series Polars, list...) thành các dòng PGCOPY (không gồm header/trailer).
+    Toàn bộ thao tác là vector hóa trên một mảng có cấu trúc, không lặp từng dòng bằng Python.
+    """
+    userid = np.asarray(userid)
+    rows = np.empty(len(userid), dtype=RATINGS_ROW_DTYPE)
+    rows['fieldcount'] = 3
+    rows['userid_len'] = 4
+    rows['userid'] = userid
+    rows['movieid_len'] = 4
+    rows['movieid'] = np.asarray(movieid)
+    rows['rating_len'] = 8
+    rows['rating'] = np.asarray(rating)
+    return rows.tobytes()
+
+
+class PGCopyBinaryStream:
+    """
+    Đối tượng dạng file cho cur.copy_expert(... (FORMAT BINARY)).
+    Nhận một iterator các khối (userid, movieid, rating) và mã hóa lần lượt từng khối khi COPY đọc tới.
+    """
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.buffer = PGCOPY_HEADER
+        self.position = 0
+        self.finished = False
+
+    def _next_buffer(self):
+        for userid, movieid, rating in self.chunks:
+            if len(userid):
+                return encode_ratings(userid, movieid, rating)
+        if not self.finished:
+            self.finished = True
+            return PGCOPY_TRAILER
+        return b''
+
+    def read(self, size=-1):
+        if self.position >= len(self.buffer):
+            self.buffer = self._next_buffer()
+            self.position = 0
+        if size is None or size < 0:
+            size = len(self.buffer) - self.position
+        piece = self.buffer[self.position:self.position + size]
+        self.position += len(piece)
+        return piece
+
+
+# Dòng (userid INTEGER, movieid INTEGER) ở dạng nhị phân, dùng khi đọc khóa của phân mảnh
+USERMOVIE_ROW_DTYPE = np.dtype([
+    ('fieldcount', '>i2'),
+    ('userid_len', '>i4'), ('userid', '>i4'),
+    ('movieid_len', '>i4'), ('movieid', '>i4'),
+])
+
+# Dòng (userid, movieid, partition_id) của nhật ký bloom_delta
+USERMOVIEPART_ROW_DTYPE = np.dtype([
+    ('fieldcount', '>i2'),
+    ('userid_len', '>i4'), ('userid', '>i4'),
+    ('movieid_len', '>i4'), ('movieid', '>i4'),
+    ('partition_id_len', '>i4'), ('partition_id', '>i4'),
+])
+
+
+def decode_rows(data, rowdtype):
+    """
+    Giải mã toàn bộ kết quả COPY ... TO STDOUT (FORMAT BINARY) thành mảng có cấu trúc `rowdtype`.
+    Chỉ hỗ trợ các cột có độ dài cố định và không NULL (đúng với các bảng ratings/phân mảnh);
+    gặp dòng không khớp định dạng thì báo ValueError.
+    """
+    data = memoryview(data)
+    if bytes(data[:11]) != PGCOPY_HEADER[:11]:
+        raise ValueError("Not a PGCOPY binary stream")
+    extension = int.from_bytes(data[15:19], 'big')
+    body = data[19 + extension:]
+    if len(body) < 2 or bytes(body[-2:]) != PGCOPY_TRAILER:
+        raise ValueError("Truncated PGCOPY binary stream")
+    body = body[:-2]
+    if len(body) % rowdtype.itemsize:
+        raise ValueError("PGCOPY rows do not match the expected fixed-width layout (NULL values?)")
+    rows = np.frombuffer(body, dtype=rowdtype)
+    fields = [name for name in rowdtype.names if name.endswith('_len')]
+    if (rows['fieldcount'] != len(fields)).any() or any(
+            (rows[name] != rowdtype[name[:-4]].itemsize).any() for name in fields):
+        raise ValueError("PGCOPY rows do not match the expected fixed-width layout (NULL values?)")
+    return rows
+
+
+def decode_ratings(data):
+    """
+    Giải mã kết quả COPY (SELECT userid, movieid, rating ...) TO STDOUT (FORMAT BINARY)
+    thành ba mảng NumPy thứ tự byte gốc (userid int32, movieid int32, rating float64).
+    """
+    rows = decode_rows(data, RATINGS_ROW_DTYPE)
+    return (rows['userid'].astype(np.int32), rows['movieid'].astype(np.int32),
+            rows['rating'].astype(np.float64))
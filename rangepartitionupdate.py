@@ -1,3 +1,5 @@
+import connectionpool
+
 RANGE_METADATA_TABLE = 'range_metadata'
 
 def rangepartitionunloggedtable(ratingstablename, numberofpartitions, openconnection):
@@ -13,9 +15,7 @@ def rangepartitionunloggedtable(ratingstablename, numberofpartitions, openconnec
     RANGE_TABLE_PREFIX = "range_part"                   # Tiền tố tên bảng phân vùng
 
     # Tối ưu hiệu suất để insert nhanh
-    cur.execute("SET synchronous_commit = OFF;")              # Không ghi log mỗi COMMIT (giảm I/O)
-    cur.execute("SET work_mem = '1024MB';")                   # Tăng bộ nhớ cho các phép toán sort, hash
-    cur.execute("SET maintenance_work_mem = '2097151kB';")    # Tăng bộ nhớ cho các thao tác CREATE TABLE, COPY
+    connectionpool.configure_session(cur.connection)  # synchronous_commit, work_mem, maintenance_work_mem, ...
 
     for i in range(numberofpartitions):
         minR = i * delta
@@ -51,9 +51,7 @@ def rangepartitionbestchoice(ratingstablename, numberofpartitions, openconnectio
         # Khởi tạo bảng range_metadata
         init_range_metadata_table(openconnection)
         # Tối ưu hiệu suất INSERT/CREATE TABLE:
-        cur.execute("SET synchronous_commit = OFF;")           # Tắt ghi log mỗi COMMIT để giảm I/O
-        cur.execute("SET work_mem = '1024MB';")                # Tăng RAM cho các thao tác tính toán trung gian
-        cur.execute("SET maintenance_work_mem = '2097151kB';") # Tăng RAM cho CREATE TABLE, COPY, ...
+        connectionpool.configure_session(cur.connection)  # synchronous_commit, work_mem, maintenance_work_mem, ...
 
         # Tính độ rộng mỗi khoảng rating
         delta = 5.0 / numberofpartitions
@@ -0,0 +1,174 @@
+#
+# Bộ nhớ đệm (cache) các cột đã phân tích của ratings.dat, lưu dạng .npy cạnh file gốc và nạp lại bằng mmap
+#
+
+import hashlib
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+import ratingsparser
+
+# Thư mục cache nằm cạnh file ratings, dùng chung cho mọi file trong cùng thư mục
+CACHE_DIRNAME = '.ratingscache'
+MANIFEST_FILE = 'manifest.json'
+# Tổng dung lượng tối đa (byte) của các file cache trong một thư mục, vượt quá thì xóa mục ít dùng nhất (LRU)
+CACHE_SIZE_LIMIT = 2 * 1024 * 1024 * 1024
+# Số byte đọc ở đầu, giữa và cuối file để tính dấu vân tay nội dung
+FINGERPRINT_SAMPLE_SIZE = 1024 * 1024
+# Số dòng của mỗi khối khi đọc lần lượt từ cache
+CACHE_CHUNK_ROWS = 1024 * 1024
+# rating giữ float64 để khớp kiểu FLOAT của bảng ratings
+CACHE_ROW_DTYPE = np.dtype([('userid', '<i4'), ('movieid', '<i4'), ('rating', '<f8')])
+
+# Tuần tự hóa việc đọc/ghi manifest giữa các luồng của tiến trình
+_CACHE_LOCK = threading.Lock()
+
+
+def cachedirectory(ratingsfilepath):
+    return os.path.join(os.path.dirname(os.path.abspath(ratingsfilepath)), CACHE_DIRNAME)
+
+
+def fingerprint(ratingsfilepath):
+    """
+    Dấu vân tay của file: đường dẫn tuyệt đối, kích thước, mtime và băm các mẫu nội dung
+    ở đầu, giữa và cuối file (không phải đọc lại toàn bộ file mỗi lần nạp).
+    Đánh đổi của việc chỉ lấy mẫu: một lần sửa tại chỗ giữ nguyên kích thước, không chạm vào các khối mẫu
+    và giữ nguyên mtime (ví dụ bị đặt lại bằng os.utime / touch -d) sẽ cho cùng dấu vân tay,
+    nên cache trả về các cột cũ; khi đó cần gọi clear_ratings_cache.
+    """
+    path = os.path.abspath(ratingsfilepath)
+    stat = os.stat(path)
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f"{path}\0{stat.st_size}\0{stat.st_mtime_ns}".encode())
+    offsets = {0, max(0, (stat.st_size - FINGERPRINT_SAMPLE_SIZE) // 2), max(0, stat.st_size - FINGERPRINT_SAMPLE_SIZE)}
+    with open(path, 'rb') as f:
+        for offset in sorted(offsets):
+            f.seek(offset)
+            digest.update(f.read(FINGERPRINT_SAMPLE_SIZE))
+    return digest.hexdigest()
+
+
+def _readmanifest(directory):
+    try:
+        with open(os.path.join(directory, MANIFEST_FILE), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def _writemanifest(directory, manifest):
+    # Ghi ra file tạm rồi đổi tên để tiến trình khác không bao giờ đọc phải manifest ghi dở
+    path = os.path.join(directory, MANIFEST_FILE)
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(temporary, path)
+
+
+def _removeentry(directory, manifest, key):
+    """Xóa file cache của `key`; trả về False nếu file đang được mmap (Windows không cho xóa)."""
+    try:
+        os.remove(os.path.join(directory, f"{key}.npy"))
+    except FileNotFoundError:
+        pass
+    except OSError:
+        return False
+    manifest.pop(key, None)
+    return True
+
+
+def _evict(directory, manifest, sizelimit, keep):
+    """Xóa các mục ít được dùng gần đây nhất cho tới khi tổng dung lượng không vượt sizelimit."""
+    total = sum(entry['bytes'] for entry in manifest.values())
+    for key in sorted(manifest, key=lambda k: manifest[k]['lastused']):
+        if total <= sizelimit:
+            break
+        if key == keep:
+            continue
+        size = manifest[key]['bytes']
+        if _removeentry(directory, manifest, key):
+            total -= size
+
+
+def load_ratings_cache(ratingsfilepath, sizelimit=CACHE_SIZE_LIMIT):
+    """
+    Trả về mảng có cấu trúc (userid, movieid, rating) của file ratings.
+    Nếu cache khớp dấu vân tay thì ánh xạ file .npy vào bộ nhớ (mmap), không phân tích lại;
+    ngược lại phân tích bằng ratingsparser, ghi cache mới (thay cho cache cũ của cùng file) rồi
+    xóa bớt theo LRU nếu tổng dung lượng vượt `sizelimit`. Kết quả lớn hơn sizelimit thì không được lưu.
+    """
+    directory = cachedirectory(ratingsfilepath)
+    source = os.path.abspath(ratingsfilepath)
+    key = fingerprint(ratingsfilepath)
+    cachepath = os.path.join(directory, f"{key}.npy")
+
+    with _CACHE_LOCK:
+        manifest = _readmanifest(directory)
+        if os.path.exists(cachepath):
+            try:
+                rows = np.load(cachepath, mmap_mode='r')
+            except (ValueError, OSError):
+                # File cache hỏng (ví dụ ghi dở): bỏ đi và phân tích lại
+                _removeentry(directory, manifest, key)
+            else:
+                if rows.dtype == CACHE_ROW_DTYPE:
+                    entry = manifest.setdefault(key, {
+                        'source': source, 'rows': len(rows), 'bytes': os.path.getsize(cachepath),
+                    })
+                    entry['lastused'] = time.time()
+                    _writemanifest(directory, manifest)
+                    return rows
+                del rows
+                _removeentry(directory, manifest, key)
+
+        userid, movieid, rating = ratingsparser.parse_ratings(ratingsfilepath, ratingdtype=np.float64)
+        rows = np.empty(len(userid), dtype=CACHE_ROW_DTYPE)
+        rows['userid'] = userid
+        rows['movieid'] = movieid
+        rows['rating'] = rating
+        if rows.nbytes > sizelimit:
+            return rows
+
+        os.makedirs(directory, exist_ok=True)
+        # Cache của phiên bản cũ của cùng file không còn dùng được nữa
+        for stale in [k for k, entry in manifest.items() if entry['source'] == source and k != key]:
+            _removeentry(directory, manifest, stale)
+        temporary = f"{cachepath}.{os.getpid()}.tmp"
+        with open(temporary, 'wb') as f:
+            np.save(f, rows)
+        os.replace(temporary, cachepath)
+        manifest[key] = {
+            'source': source,
+            'rows': len(rows),
+            'bytes': os.path.getsize(cachepath),
+            'lastused': time.time(),
+        }
+        _evict(directory, manifest, sizelimit, keep=key)
+        _writemanifest(directory, manifest)
+        return np.load(cachepath, mmap_mode='r')
+
+
+def iter_cached_ratings(ratingsfilepath, chunkrows=CACHE_CHUNK_ROWS, sizelimit=CACHE_SIZE_LIMIT):
+    """
+    Sinh ra lần lượt bộ ba mảng (userid, movieid, rating) từ cache, mỗi khối `chunkrows` dòng,
+    cùng dạng với Interface.iter_ratings_chunks nên dùng thay được cho các hàm nạp.
+    """
+    rows = load_ratings_cache(ratingsfilepath, sizelimit)
+    for start in range(0, len(rows), chunkrows):
+        block = rows[start:start + chunkrows]
+        yield block['userid'], block['movieid'], block['rating']
+
+
+def clear_ratings_cache(ratingsfilepath):
+    """Xóa mọi file cache trong thư mục cache cạnh `ratingsfilepath`."""
+    directory = cachedirectory(ratingsfilepath)
+    with _CACHE_LOCK:
+        manifest = _readmanifest(directory)
+        for key in list(manifest):
+            _removeentry(directory, manifest, key)
+        if os.path.isdir(directory):
+            _writemanifest(directory, manifest)
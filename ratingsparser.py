@@ -0,0 +1,144 @@
+#
+# Bộ phân tích ratings.dat (userid::movieid::rating::timestamp) bằng mmap và quét byte vector hóa
+#
+
+import mmap
+import os
+
+import numpy as np
+
+# Kích thước mặc định (byte) của mỗi khối được phân tích
+PARSER_CHUNK_SIZE = 8 * 1024 * 1024
+
+NEWLINE = ord('\n')
+CARRIAGE_RETURN = ord('\r')
+COLON = ord(':')
+DOT = ord('.')
+ZERO = ord('0')
+# Mỗi dòng hợp lệ có đúng 3 dấu phân tách '::' (6 ký tự ':')
+COLONS_PER_LINE = 6
+# Số ký tự tối đa của một trường số (10**18 vẫn nằm trong int64)
+MAX_FIELD_WIDTH = 18
+POWERS_OF_TEN = 10 ** np.arange(MAX_FIELD_WIDTH + 1, dtype=np.int64)
+
+
+def _parsenumbers(block, starts, ends, allowdot):
+    """
+    Đổi các trường block[starts[i]:ends[i]] (chữ số ASCII, có thể có một dấu '.') thành số.
+    Các trường được căn phải và xử lý theo từng cột ký tự (tối đa bằng độ dài trường dài nhất),
+    mỗi cột là một phép toán vector trên tất cả các trường của khối.
+    Trả về (giá trị nguyên bỏ dấu chấm int64, số chữ số sau dấu chấm int64).
+    """
+    lengths = ends - starts
+    values = np.zeros(len(lengths), dtype=np.int64)
+    fraction = np.zeros(len(lengths), dtype=np.int64)
+    if len(lengths) == 0:
+        return values, fraction
+    width = int(lengths.max())
+    if lengths.min() <= 0 or width > MAX_FIELD_WIDTH:
+        raise ValueError("Malformed ratings line: empty or too long numeric field")
+
+    # power: số chữ số đã gặp tính từ bên phải, cũng là số mũ của 10 cho chữ số kế tiếp
+    power = np.zeros(len(lengths), dtype=np.int64)
+    dots = np.zeros(len(lengths), dtype=np.int64)
+    shortest = int(lengths.min())
+    for k in range(width):
+        # Cột k tính từ phải; các cột nằm trong trường ngắn nhất không cần mặt nạ
+        allvalid = k < shortest
+        valid = True if allvalid else k < lengths
+        chars = block[ends - 1 - k] if allvalid else block[np.where(valid, ends - 1 - k, 0)]
+        # Phép trừ trên uint8 tràn vòng: ký tự không phải chữ số đều cho giá trị > 9
+        digits = chars - np.uint8(ZERO)
+        isdot = valid & (chars == DOT)
+        isdigit = valid & ~isdot
+        if (isdigit & (digits > 9)).any():
+            raise ValueError("Malformed ratings line: non-numeric field")
+        if not allowdot:
+            if isdot.any():
+                raise ValueError("Malformed ratings line: non-numeric field")
+            # Không có dấu chấm nên chữ số ở cột k luôn có số mũ k
+            values += (digits if allvalid else np.where(valid, digits, 0)) * POWERS_OF_TEN[k]
+            continue
+        values += np.where(isdigit, digits * POWERS_OF_TEN[power], 0)
+        fraction = np.where(isdot, power, fraction)
+        dots += isdot
+        power += isdigit
+    if allowdot and ((power == 0).any() or (dots > 1).any()):
+        raise ValueError("Malformed ratings line: non-numeric field")
+    return values, fraction
+
+
+def parse_ratings_block(block, ratingdtype=np.float32):
+    """
+    Phân tích một khối byte gồm các dòng nguyên vẹn (mảng uint8, thường là lát cắt của mmap).
+    Vị trí xuống dòng và dấu ':' được tìm bằng phép so sánh vector trên cả khối; không tạo chuỗi
+    hay list Python cho từng dòng. Dòng trống được bỏ qua, dòng sai định dạng gây ValueError.
+    Trả về (userid int32, movieid int32, rating `ratingdtype`).
+    """
+    newlines = np.flatnonzero(block == NEWLINE)
+    linestarts = np.concatenate(([0], newlines + 1))
+    lineends = np.concatenate((newlines, [len(block)]))
+    # Bỏ '\r' của dòng kết thúc bằng \r\n, rồi bỏ các dòng trống
+    nonempty = lineends > linestarts
+    lineends = lineends - (nonempty & (block[np.maximum(lineends - 1, 0)] == CARRIAGE_RETURN))
+    nonempty = lineends > linestarts
+    linestarts, lineends = linestarts[nonempty], lineends[nonempty]
+
+    colons = np.flatnonzero(block == COLON)
+    if len(colons) != COLONS_PER_LINE * len(linestarts):
+        raise ValueError("Malformed ratings line: expected 'userid::movieid::rating::timestamp'")
+    colons = colons.reshape(-1, COLONS_PER_LINE)
+    if not ((colons[:, 0] > linestarts).all() and (colons[:, 5] < lineends).all()
+            and (colons[:, 1::2] == colons[:, 0::2] + 1).all()):
+        raise ValueError("Malformed ratings line: expected 'userid::movieid::rating::timestamp'")
+
+    userid, _ = _parsenumbers(block, linestarts, colons[:, 0], allowdot=False)
+    movieid, _ = _parsenumbers(block, colons[:, 1] + 1, colons[:, 2], allowdot=False)
+    rating, fraction = _parsenumbers(block, colons[:, 3] + 1, colons[:, 4], allowdot=True)
+    rating = (rating / POWERS_OF_TEN[fraction]).astype(ratingdtype)
+    return userid.astype(np.int32), movieid.astype(np.int32), rating
+
+
+def iter_ratings(ratingsfilepath, chunksize=PARSER_CHUNK_SIZE, start=0, end=None, ratingdtype=np.float32):
+    """
+    Ánh xạ file vào bộ nhớ (mmap) và sinh ra lần lượt bộ ba mảng (userid, movieid, rating)
+    cho từng khối khoảng `chunksize` byte của khoảng [start, end); ranh giới khối luôn nằm sau '\\n'
+    (start phải là đầu một dòng, như các khoảng của split_file_ranges).
+    """
+    with open(ratingsfilepath, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        end = size if end is None else min(end, size)
+        if end <= start:
+            return
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        data = np.frombuffer(mm, dtype=np.uint8)
+        try:
+            position = start
+            while position < end:
+                limit = min(position + chunksize, end)
+                if limit < end:
+                    cut = mm.rfind(b'\n', position, limit) + 1
+                    if cut <= position:
+                        # Dòng dài hơn cả khối: kéo dài tới hết dòng
+                        cut = mm.find(b'\n', limit, end) + 1 or end
+                    limit = cut
+                yield parse_ratings_block(data[position:limit], ratingdtype)
+                position = limit
+        finally:
+            # Phải bỏ mọi view NumPy trỏ vào mmap trước khi đóng; nếu traceback của một lỗi phân tích
+            # còn giữ view thì để bộ thu gom rác đóng mmap sau
+            del data
+            try:
+                mm.close()
+            except BufferError:
+                pass
+
+
+def parse_ratings(ratingsfilepath, chunksize=PARSER_CHUNK_SIZE, ratingdtype=np.float32):
+    """
+    Phân tích toàn bộ file, trả về (userid int32, movieid int32, rating `ratingdtype`) liền mạch.
+    """
+    chunks = list(iter_ratings(ratingsfilepath, chunksize, ratingdtype=ratingdtype))
+    if not chunks:
+        return np.zeros(0, np.int32), np.zeros(0, np.int32), np.zeros(0, ratingdtype)
+    return tuple(np.concatenate(column) for column in zip(*chunks))
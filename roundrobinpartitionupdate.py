@@ -1,3 +1,5 @@
+import connectionpool
+
 RROBIN_METADATA_TABLE = 'rrobin_metadata'
 
 def roundrobinpartitionunloggedtable(ratingstablename, numberofpartitions, openconnection):
@@ -11,9 +13,7 @@ def roundrobinpartitionunloggedtable(ratingstablename, numberofpartitions, openc
     temp_table = "rrobin_temp"           # Bảng tạm để đánh số dòng
 
     # Tối ưu hiệu suất để insert nhanh
-    cur.execute("SET synchronous_commit = OFF;")              # Không ghi log mỗi COMMIT (giảm I/O)
-    cur.execute("SET work_mem = '1024MB';")                   # Tăng bộ nhớ cho các phép toán sort, hash
-    cur.execute("SET maintenance_work_mem = '2097151kB';")    # Tăng bộ nhớ cho các thao tác CREATE TABLE, COPY
+    connectionpool.configure_session(cur.connection)  # synchronous_commit, work_mem, maintenance_work_mem, ...
 
     # Tạo bảng tạm chứa dữ liệu gốc, thêm số thứ tự dòng và chỉ số phân vùng
     cur.execute(f"""
@@ -54,9 +54,7 @@ def roundrobinpartitionbestchoice(ratingstablename: str, numberofpartitions: int
         init_rrobin_metadata_table(con)
         
         # Thiết lập PostgreSQL để tối ưu hiệu suất
-        cur.execute("SET synchronous_commit = OFF;")            # Tắt ghi log để tăng tốc độ insert
-        cur.execute("SET work_mem = '1024MB';")                 # Tăng bộ nhớ xử lý sort/hash
-        cur.execute("SET maintenance_work_mem = '2097151kB';")  # Tăng bộ nhớ cho thao tác CREATE TABLE
+        connectionpool.configure_session(cur.connection)  # synchronous_commit, work_mem, maintenance_work_mem, ...
 
         # Tạo bảng tạm chứa dữ liệu và chỉ số phân vùng được tính trước
         cur.execute(f"""
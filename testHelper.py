@@ -1,8 +1,13 @@
+import time
 import traceback
+import threading
 import psycopg2
 
+import connectionpool
+
 RANGE_TABLE_PREFIX = 'range_part'
 RROBIN_TABLE_PREFIX = 'rrobin_part'
+HASH_TABLE_PREFIX = 'hash_part'
 USER_ID_COLNAME = 'userid'
 MOVIE_ID_COLNAME = 'movieid'
 RATING_COLNAME = 'rating'
@@ -12,24 +17,10 @@ def createdb(dbname):
     """
     We create a DB by connecting to the default user and database of Postgres
     The function first checks if an existing database exists for a given name, else creates it.
+    The check uses the shared connection pool and is remembered for the rest of the process.
     :return:None
     """
-    # Connect to the default database
-    con = getopenconnection()
-    con.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
-    cur = con.cursor()
-
-    # Check if an existing database with the same name exists
-    cur.execute('SELECT COUNT(*) FROM pg_catalog.pg_database WHERE datname=\'%s\'' % (dbname,))
-    count = cur.fetchone()[0]
-    if count == 0:
-        cur.execute('CREATE DATABASE %s' % (dbname,))  # Create the database
-    else:
-        print('A database named "{0}" already exists'.format(dbname))
-
-    # Clean up
-    cur.close()
-    con.close()
+    connectionpool.create_db(dbname)
 
 def delete_db(dbname):
     con = getopenconnection(dbname = 'postgres')
@@ -38,21 +29,20 @@ def delete_db(dbname):
     cur.execute('drop database ' + dbname)
     cur.close()
     con.close()
+    connectionpool.forget_database(dbname)
 
 
 def deleteAllPublicTables(openconnection):
     cur = openconnection.cursor()
-    cur.execute("SELECT table_name FROM information_schema.tables WHERE table_schema = 'public'")
-    l = []
-    for row in cur:
-        l.append(row[0])
+    cur.execute("SELECT table_name FROM information_schema.tables WHERE table_schema = current_schema()")
+    l = [row[0] for row in cur.fetchall()]
     for tablename in l:
         cur.execute("drop table if exists {0} CASCADE".format(tablename))
 
     cur.close()
 
 def getopenconnection(user='postgres', password='1234', dbname='postgres'):
-    return psycopg2.connect("dbname='" + dbname + "' user='" + user + "' host='localhost' password='" + password + "'")
+    return connectionpool.getopenconnection(user=user, password=password, dbname=dbname)
 
 
 ####### Tester support
@@ -94,17 +84,36 @@ def getCountroundrobinpartition(ratingstablename, numberofpartitions, openconnec
     countList = []
     for i in range(0, numberofpartitions):
         cur.execute(
-            "select count(*) from (select *, row_number() over () from {0}) as temp where (row_number-1)%{1}= {2}".format(
+            "select count(*) from (select *, row_number() over () as row_number from {0}) as temp where (row_number-1)%{1}= {2}".format(
                 ratingstablename, numberofpartitions, i))
         countList.append(int(cur.fetchone()[0]))
 
     cur.close()
     return countList
 
+def getCounthashpartition(ratingstablename, numberofpartitions, openconnection):
+    '''
+    Get number of rows for each partition, using the same userid hash as the partitioning
+    :param ratingstablename:
+    :param numberofpartitions:
+    :param openconnection:
+    :return:
+    '''
+    cur = openconnection.cursor()
+    countList = []
+    for i in range(0, numberofpartitions):
+        cur.execute(
+            "select count(*) from {0} where ((({1}::bigint * 2654435761) & 4294967295) >> 16) % {2} = {3}".format(
+                ratingstablename, USER_ID_COLNAME, numberofpartitions, i))
+        countList.append(int(cur.fetchone()[0]))
+
+    cur.close()
+    return countList
+
 # Helpers for Tester functions
 def checkpartitioncount(cursor, expectedpartitions, prefix):
     cursor.execute(
-        "SELECT COUNT(table_name) FROM information_schema.tables WHERE table_schema = 'public' AND table_name LIKE '{0}%';".format(
+        "SELECT COUNT(table_name) FROM information_schema.tables WHERE table_schema = current_schema() AND table_name LIKE '{0}%';".format(
             prefix))
     count = int(cursor.fetchone()[0])
     if count != expectedpartitions:  raise Exception(
@@ -184,6 +193,26 @@ def testEachRoundrobinPartition(ratingstablename, n, openconnection, roundrobinp
                 roundrobinpartitiontableprefix, i, count, countList[i]
             ))
 
+def testEachHashPartition(ratingstablename, n, openconnection, hashpartitiontableprefix):
+    countList = getCounthashpartition(ratingstablename, n, openconnection)
+    cur = openconnection.cursor()
+    for i in range(0, n):
+        cur.execute("select count(*) from {0}{1}".format(hashpartitiontableprefix, i))
+        count = int(cur.fetchone()[0])
+        if count != countList[i]:
+            raise Exception("{0}{1} has {2} of rows while the correct number should be {3}".format(
+                hashpartitiontableprefix, i, count, countList[i]
+            ))
+    # Every user must live in exactly one partition
+    cur.execute("select count(*) from (select {0} from ({1}) as t group by {0} having count(distinct p) > 1) as s".format(
+        USER_ID_COLNAME,
+        ' UNION ALL '.join("select {0}, {1} as p from {2}{1}".format(USER_ID_COLNAME, i, hashpartitiontableprefix)
+                           for i in range(0, n))))
+    split = int(cur.fetchone()[0])
+    cur.close()
+    if split:
+        raise Exception("{0} user(s) have ratings in more than one hash partition".format(split))
+
 # ##########
 
 def testloadratings(MyAssignment, ratingstablename, filepath, openconnection, rowsininpfile):
@@ -249,6 +278,49 @@ def testroundrobinpartition(MyAssignment, ratingstablename, numberofpartitions,
         return [False, e]
     return [True, None]
 
+def testhashpartition(MyAssignment, ratingstablename, n, openconnection, partitionstartindex, ACTUAL_ROWS_IN_INPUT_FILE):
+    """
+    Tests the hash partition function for Completness, Disjointness and Reconstruction,
+    and checks that every user is stored in a single partition
+    :param ratingstablename: Argument for function to be tested
+    :param n: Argument for function to be tested
+    :param openconnection: Argument for function to be tested
+    :param partitionstartindex: Indicates how the table names are indexed. Do they start as hashpart1, 2 ... or hashpart0, 1, 2...
+    :return:Raises exception if any test fails
+    """
+    try:
+        MyAssignment.hashpartition(ratingstablename, n, openconnection)
+        testrangeandrobinpartitioning(n, openconnection, HASH_TABLE_PREFIX, partitionstartindex, ACTUAL_ROWS_IN_INPUT_FILE)
+        testEachHashPartition(ratingstablename, n, openconnection, HASH_TABLE_PREFIX)
+    except Exception as e:
+        traceback.print_exc()
+        return [False, e]
+    return [True, None]
+
+
+def testhashinsert(MyAssignment, ratingstablename, userid, itemid, rating, openconnection, expectedtableindex):
+    """
+    Tests the hash insert function by checking whether the tuple is inserted in he Expected table you provide
+    :param ratingstablename: Argument for function to be tested
+    :param userid: Argument for function to be tested
+    :param itemid: Argument for function to be tested
+    :param rating: Argument for function to be tested
+    :param openconnection: Argument for function to be tested
+    :param expectedtableindex: The expected table to which the record has to be saved
+    :return:Raises exception if any test fails
+    """
+    try:
+        expectedtablename = HASH_TABLE_PREFIX + expectedtableindex
+        MyAssignment.hashinsert(ratingstablename, userid, itemid, rating, openconnection)
+        if not testrangerobininsert(expectedtablename, itemid, openconnection, rating, userid):
+            raise Exception(
+                'Hash insert failed! Couldnt find ({0}, {1}, {2}) tuple in {3} table'.format(userid, itemid, rating,
+                                                                                             expectedtablename))
+    except Exception as e:
+        traceback.print_exc()
+        return [False, e]
+    return [True, None]
+
 def testroundrobininsert(MyAssignment, ratingstablename, userid, itemid, rating, openconnection, expectedtableindex):
     """
     Tests the roundrobin insert function by checking whether the tuple is inserted in he Expected table you provide
@@ -273,6 +345,62 @@ def testroundrobininsert(MyAssignment, ratingstablename, userid, itemid, rating,
     return [True, None]
 
 
+def testroundrobininsertsequence(MyAssignment, ratingstablename, numberofpartitions, inserts, openconnection,
+                                 insertfunctions=None):
+    """
+    Tests consecutive roundrobininsert calls right after roundrobinpartition: the j-th insert must land in
+    partition (last_partition_index + 1 + j) % numberofpartitions and the metadata pointer must follow it
+    :param numberofpartitions: Number of partitions created by roundrobinpartition
+    :param inserts: Number of roundrobininsert calls
+    :param insertfunctions: Insert functions used in turn (default: roundrobininsert only)
+    :return:Raises exception if any test fails
+    """
+    try:
+        insertfunctions = [getattr(f, '__wrapped__', f) for f in insertfunctions or [MyAssignment.roundrobininsert]]
+        with openconnection.cursor() as cur:
+            cur.execute("SELECT last_partition_index FROM rrobin_metadata WHERE tablename = %s", (ratingstablename,))
+            lastindex = int(cur.fetchone()[0])
+        for j in range(inserts):
+            userid = 2000000 + j
+            insertfunctions[j % len(insertfunctions)](ratingstablename, userid, j, 1.5, openconnection)
+            expectedtablename = RROBIN_TABLE_PREFIX + str((lastindex + 1 + j) % numberofpartitions)
+            if not testrangerobininsert(expectedtablename, j, openconnection, 1.5, userid):
+                raise Exception('Round robin insert #{0} did not land in {1}'.format(j, expectedtablename))
+        with openconnection.cursor() as cur:
+            cur.execute("SELECT last_partition_index FROM rrobin_metadata WHERE tablename = %s", (ratingstablename,))
+            current = int(cur.fetchone()[0])
+        if current != (lastindex + inserts) % numberofpartitions:
+            raise Exception('rrobin_metadata.last_partition_index is {0}, expected {1}'.format(
+                current, (lastindex + inserts) % numberofpartitions))
+    except Exception as e:
+        traceback.print_exc()
+        return [False, e]
+    return [True, None]
+
+
+def testroundrobinnativemixed(MyAssignment, ratingstablename, numberofpartitions, inserts, openconnection):
+    """
+    Tests the declarative round robin layout: after roundrobinpartition(mode='native'), roundrobininsert and
+    roundrobininsertnative are called in turn and every row must land in the next partition of the sequence
+    :param numberofpartitions: Number of partitions to create
+    :param inserts: Number of insert calls, alternating between the two functions
+    :return:Raises exception if any test fails
+    """
+    try:
+        # The plain round robin partitions of the earlier tests have to go before the native layout is built
+        with openconnection.cursor() as cur:
+            for i in range(numberofpartitions):
+                cur.execute('DROP TABLE IF EXISTS {0}{1}'.format(RROBIN_TABLE_PREFIX, i))
+        openconnection.commit()
+        partition = getattr(MyAssignment.roundrobinpartition, '__wrapped__', MyAssignment.roundrobinpartition)
+        partition(ratingstablename, numberofpartitions, openconnection, mode='native')
+    except Exception as e:
+        traceback.print_exc()
+        return [False, e]
+    return testroundrobininsertsequence(MyAssignment, ratingstablename, numberofpartitions, inserts, openconnection,
+                                        [MyAssignment.roundrobininsert, MyAssignment.roundrobininsertnative])
+
+
 def testrangeinsert(MyAssignment, ratingstablename, userid, itemid, rating, openconnection, expectedtableindex):
     """
     Tests the range insert function by checking whether the tuple is inserted in he Expected table you provide
@@ -294,4 +422,121 @@ def testrangeinsert(MyAssignment, ratingstablename, userid, itemid, rating, open
     except Exception as e:
         traceback.print_exc()
         return [False, e]
-    return [True, None]
\ No newline at end of file
+    return [True, None]
+
+def testroundrobininsertconcurrent(MyAssignment, ratingstablename, numberofpartitions, clients, insertsperclient, openconnection):
+    """
+    Stress test for round robin insert: several clients insert at the same time, each on its own connection.
+    Checks that every partition received exactly the rows strict round robin order would give it
+    and prints the achieved inserts/sec.
+    :param numberofpartitions: Number of round robin partitions already created
+    :param clients: Number of concurrent clients (threads, one connection each)
+    :param insertsperclient: Number of roundrobininsert calls per client
+    :param openconnection: Connection used to read the state before and after the test
+    :return:Raises exception if any test fails
+    """
+    try:
+        # Skip the timing print of measure_time for every single insert
+        insert = getattr(MyAssignment.roundrobininsert, '__wrapped__', MyAssignment.roundrobininsert)
+        dbname = openconnection.info.dbname
+
+        with openconnection.cursor() as cur:
+            cur.execute("SELECT last_partition_index FROM rrobin_metadata WHERE tablename = %s", (ratingstablename,))
+            lastindex = int(cur.fetchone()[0])
+            before = []
+            for i in range(numberofpartitions):
+                cur.execute("select count(*) from {0}{1}".format(RROBIN_TABLE_PREFIX, i))
+                before.append(int(cur.fetchone()[0]))
+
+        errors = []
+
+        def client(clientid):
+            con = getopenconnection(dbname=dbname)
+            try:
+                for j in range(insertsperclient):
+                    insert(ratingstablename, 1000000 + clientid, j, 2.5, con)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                con.close()
+
+        threads = [threading.Thread(target=client, args=(c,)) for c in range(clients)]
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - start
+        if errors:
+            raise errors[0]
+
+        total = clients * insertsperclient
+        print('{0} clients: {1} inserts in {2:.4f}s ({3:.0f} inserts/sec)'.format(clients, total, elapsed, total / elapsed))
+
+        # Partition p must receive the slots j in [0, total) with (lastindex + 1 + j) % n == p
+        with openconnection.cursor() as cur:
+            for i in range(numberofpartitions):
+                expected = sum(1 for j in range(total) if (lastindex + 1 + j) % numberofpartitions == i)
+                cur.execute("select count(*) from {0}{1}".format(RROBIN_TABLE_PREFIX, i))
+                added = int(cur.fetchone()[0]) - before[i]
+                if added != expected:
+                    raise Exception("{0}{1} received {2} rows under concurrency while strict round robin expects {3}".format(
+                        RROBIN_TABLE_PREFIX, i, added, expected))
+    except Exception as e:
+        traceback.print_exc()
+        return [False, e]
+    return [True, None]
+
+
+def testratingscache(ratingscache, ratingsfilepath, rowsininpfile):
+    """
+    Tests the parsed-columns cache on a private copy of the ratings file: the first load parses and writes the cache,
+    the second one must be a memory-mapped hit with the same columns, and rewriting the file must replace the entry
+    :param ratingscache: The ratingscache module
+    :param ratingsfilepath: Ratings file to copy
+    :param rowsininpfile: Number of rows in the input file provided for assertion
+    :return:Raises exception if any test fails
+    """
+    import os
+    import shutil
+    import tempfile
+    import numpy as np
+
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, os.path.basename(ratingsfilepath))
+        shutil.copyfile(ratingsfilepath, path)
+
+        first = ratingscache.load_ratings_cache(path)
+        if len(first) != rowsininpfile:
+            raise Exception('Cache returned {0} rows while the file has {1}'.format(len(first), rowsininpfile))
+        userid, movieid, rating = ratingscache.ratingsparser.parse_ratings(path, ratingdtype=np.float64)
+        if not ((first['userid'] == userid).all() and (first['movieid'] == movieid).all() and (first['rating'] == rating).all()):
+            raise Exception('Cached columns differ from the parsed file')
+
+        second = ratingscache.load_ratings_cache(path)
+        if not isinstance(second, np.memmap) or not (second == first).all():
+            raise Exception('Second load was not served from the cache file')
+        manifest = ratingscache._readmanifest(ratingscache.cachedirectory(path))
+        if list(manifest) != [ratingscache.fingerprint(path)]:
+            raise Exception('Manifest does not hold exactly the current fingerprint: {0}'.format(list(manifest)))
+        del first, second
+
+        # Appending a row changes size and mtime: the old entry must be dropped and the new row must appear
+        with open(path, 'rb') as f:
+            separator = b'' if f.read().endswith(b'\n') else b'\n'
+        with open(path, 'ab') as f:
+            f.write(separator + b'999999::1::5::0\n')
+        third = ratingscache.load_ratings_cache(path)
+        if len(third) != rowsininpfile + 1 or third['userid'][-1] != 999999:
+            raise Exception('Cache was not refreshed after the file changed')
+        manifest = ratingscache._readmanifest(ratingscache.cachedirectory(path))
+        if list(manifest) != [ratingscache.fingerprint(path)]:
+            raise Exception('Stale cache entry was not removed: {0}'.format(list(manifest)))
+        del third
+    except Exception as e:
+        traceback.print_exc()
+        return [False, e]
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return [True, None]